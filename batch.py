@@ -0,0 +1,164 @@
+"""
+こうかとんサバイバーをシードと調整値を変えてまとめてヘッドレス実行し，結果を集計するスクリプト
+各実行は別プロセスで行うので，コア数に応じて並列に進む
+使い方：
+    python batch.py --seeds 100 --out report.json
+    python batch.py --seeds 20 --param boss_health=100,200 --param enemy_interval=10,20
+    python batch.py --seeds 4 --autoplay --frames 50000 --param invincible=1 --param boss_threshold=1000000000  # 耐久試験
+"""
+import argparse
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import koukaton_survivor as ks
+
+
+PARAMS = (  # --paramで変えられるGameの引数
+    "spawn_directions",
+    "enemy_interval",
+    "clown_interval",
+    "item_interval",
+    "gravity_item_interval",
+    "boss_threshold",
+    "boss_health",
+    "max_live",
+    "pixel_collide",  # 1なら矩形で当たったものを画素単位でも調べる
+    "invincible",  # 1ならやられない（--autoplayと合わせて耐久試験に使う）
+)
+
+
+
+def parse_param(text: str) -> tuple[str, list[int]]:
+    """
+    "名前=値1,値2,..."を分解する
+    戻り値：(名前, 値のリスト)
+    """
+    name, _, values = text.partition("=")
+    if name not in PARAMS or not values:
+        raise argparse.ArgumentTypeError(f"{text}: 名前=値1,値2,... の形で，名前は{', '.join(PARAMS)}のどれか")
+    return name, [int(v) for v in values.split(",")]
+
+
+def run_one(job: tuple[int, dict, int, bool, int]) -> dict:
+    """
+    1回分のゲームをヘッドレスで実行する（ワーカープロセスで呼ばれる）
+    引数 job：(乱数シード, Gameの引数, 最大フレーム数, ボットに操作させるか, 描画品質の段階)
+    戻り値：1回分の指標の辞書
+    """
+    seed, params, frames, autoplay, quality = job
+    cpu = time.process_time()
+    control = ks.Autoplayer() if autoplay else None
+    result = ks.run_headless(frames, control=control, seed=seed, profile=True, params=params, quality=quality)
+    cpu = time.process_time() - cpu  # 他のプロセスを待っていた時間を含まない
+    profile = result.get("profile", {})
+    return {
+        "seed": seed,
+        "params": params,
+        "result": result["result"],
+        "score": result["score"],
+        "frames": result["frames"],
+        "peaks": result["peaks"],
+        "p50_ms": profile.get("p50", 0.0),
+        "p95_ms": profile.get("p95", 0.0),
+        "p99_ms": profile.get("p99", 0.0),
+        "elapsed": result["elapsed"],
+        "cpu_s": cpu,
+    }
+
+
+def aggregate(runs: list[dict]) -> list[dict]:
+    """
+    同じ調整値の実行をまとめて統計量にする
+    戻り値：調整値ごとの集計の辞書のリスト
+    """
+    groups = {}
+    for run in runs:
+        groups.setdefault(json.dumps(run["params"], sort_keys=True), []).append(run)
+    report = []
+    for key, group in groups.items():
+        frames = [run["frames"] for run in group]
+        scores = [run["score"] for run in group]
+        outcomes = {}
+        for run in group:
+            outcomes[run["result"]] = outcomes.get(run["result"], 0) + 1
+        peaks = {name: max(run["peaks"][name] for run in group) for name in group[0]["peaks"]}
+        report.append({
+            "params": json.loads(key),
+            "runs": len(group),
+            "outcomes": outcomes,
+            "frames_mean": statistics.fmean(frames),
+            "frames_median": statistics.median(frames),
+            "frames_min": min(frames),
+            "frames_max": max(frames),
+            "score_mean": statistics.fmean(scores),
+            "score_max": max(scores),
+            "peaks": peaks,
+            "p50_ms": statistics.median(run["p50_ms"] for run in group),
+            "p95_ms": statistics.median(run["p95_ms"] for run in group),
+            "p99_ms": max(run["p99_ms"] for run in group),
+        })
+    return report
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="こうかとんサバイバーのバッチ実行")
+    parser.add_argument("--seeds", type=int, default=10, help="調整値ごとの実行回数（シードを1ずつ変える）")
+    parser.add_argument("--seed-start", type=int, default=0, help="最初の乱数シード")
+    parser.add_argument("--param", type=parse_param, action="append", default=[], help="名前=値1,値2,...（複数指定で全組み合わせ）")
+    parser.add_argument("--frames", type=int, default=6000, help="1回あたりの最大フレーム数")
+    parser.add_argument("--autoplay", action="store_true", help="何も押さない入力の代わりにボットに操作させる")
+    parser.add_argument("--quality", type=int, default=0, choices=range(len(ks.Quality.levels)), help="描画品質の段階（負荷で変わらないように全実行で固定する）")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="並列に動かすプロセス数")
+    parser.add_argument("--out", help="集計結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    names = [name for name, _ in args.param]
+    combos = [dict(zip(names, values)) for values in itertools.product(*(values for _, values in args.param))]
+    jobs = [(seed, params, args.frames, args.autoplay, args.quality) for params in combos for seed in range(args.seed_start, args.seed_start + args.seeds)]
+
+    ks.AssetRegistry().prepare()  # ワーカーが同時にアトラスを焼き込まないように先に用意しておく
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        chunk = max(1, len(jobs) // (args.workers * 4))  # 偏りが出ない程度にまとめて渡す
+        runs = list(pool.map(run_one, jobs, chunksize=chunk))
+    wall = time.perf_counter() - start
+    busy = sum(run["cpu_s"] for run in runs)
+
+    report = {
+        "meta": {
+            "jobs": len(jobs),
+            "workers": args.workers,
+            "frames": args.frames,
+            "autoplay": args.autoplay,
+            "quality": args.quality,
+            "wall_s": wall,
+            "run_s": busy,
+            "speedup": busy / wall if wall > 0 else 0.0,  # 1プロセスで順に実行した場合との比のおおよその値
+        },
+        "groups": aggregate(runs),
+        "runs": runs,
+    }
+    for group in report["groups"]:
+        params = " ".join(f"{k}={v}" for k, v in group["params"].items()) or "(default)"
+        outcomes = " ".join(f"{k}={v}" for k, v in sorted(group["outcomes"].items()))
+        print(f"{params:40s} runs={group['runs']} [{outcomes}] frames={group['frames_median']:.0f} "
+              f"score={group['score_mean']:.0f} p95={group['p95_ms']:.2f}ms")
+    print(f"{len(jobs)} runs in {wall:.1f}s on {args.workers} workers (x{report['meta']['speedup']:.2f})")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(report, f, indent=2)
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,250 @@
+"""
+こうかとんサバイバーのゲームループ各部の処理時間を計測するベンチマーク
+使い方：
+    python benchmark.py --out result.json
+    python benchmark.py --compare result.json  # 保存したベースラインと比較する
+    python benchmark.py --snapshot boss.kks  # スナップショットの局面を計測する
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame as pg
+
+import koukaton_survivor as ks
+
+
+SCENARIOS = {  # シナリオ名: 初期配置の設定
+    "enemies_100": {"enemies": 100, "beams": 20, "durians": 1, "balls": 1},
+    "enemies_1000": {"enemies": 1000, "beams": 20, "durians": 1, "balls": 1},
+    "enemies_5000": {"enemies": 5000, "beams": 20, "durians": 1, "balls": 1},
+    "enemies_20000": {"enemies": 20000, "beams": 20, "durians": 1, "balls": 1},
+    "beam_volley": {"enemies": 300, "beams": 600, "durians": 0, "balls": 0},
+    "skills": {"enemies": 300, "beams": 20, "durians": 60, "balls": 60},
+    "boss": {"enemies": 0, "beams": 100, "durians": 4, "balls": 4, "boss": True, "neobeams": 100},
+    "bullet_hell": {"enemies": 0, "beams": 20, "durians": 0, "balls": 0, "boss": True, "rings": 100},
+}
+PHASES = ("targeting", "collision", "update", "draw", "frame")
+CLOWN_RATIO = 0.2  # 敵のうちピエロの割合
+QUERIES = 10  # 1フレームあたりの最近傍探索回数
+
+
+
+class World:
+    """
+    シナリオどおりに敵やビームを配置したGameを持つ計測用のゲーム状態
+    """
+    def __init__(self, config: dict, seed: int, full_redraw: bool = False):
+        """
+        引数1 config：SCENARIOSの設定か，{"snapshot": スナップショットのファイル名}
+        引数2 seed：乱数シード（スナップショットのときは保存された乱数の状態を使う）
+        引数3 full_redraw：Trueなら毎フレーム画面全体を描き直す
+        """
+        random.seed(seed)
+        self.screen = pg.display.get_surface()
+        if "snapshot" in config:
+            self.game = game = ks.Snapshot.load(config["snapshot"])[0]
+        else:
+            self.game = game = ks.Game()
+        game.invincible = True  # 計測中にゲームオーバーで抜けないようにする
+        game.level_save = 10**9  # スキル選択画面で止まらないようにする
+        if "snapshot" in config:  # 配置はスナップショットのまま
+            self.probe = ks.Beam(game.bird, game.xbeam, game.emys, game.cemys, False)
+            self.renderer = ks.Renderer(self.screen, game.bg_img, full_redraw)
+            self.draw()
+            return
+        bird = game.bird
+        bird.rect.center = ks.WIDTH//2, ks.HEIGHT//2
+
+        n_clown = int(config["enemies"] * CLOWN_RATIO)
+        for i in range(config["enemies"]):
+            emy = ks.ClownEnemy(bird, 16) if i < n_clown else ks.Enemy(bird, 16)
+            emy.rect.center = random.randint(0, ks.WIDTH), random.randint(0, ks.HEIGHT)  # 登録前に配置する
+            if emy.rect.center == bird.rect.center:  # 方向ベクトルが求まらない位置は避ける
+                emy.rect.x += 1
+            (game.cemys if i < n_clown else game.emys).add(emy)
+
+        appearance = game.appearance
+        appearance.threshold = float('inf')  # 計測中にボスを出現させない
+        if config.get("boss"):
+            appearance.boss_appeared = True
+            appearance.boss_visible = True
+            appearance.boss = ks.Boss()
+            appearance.boss.appearing = False
+            appearance.boss.rect.top = 150
+            appearance.boss.health = 10**9  # 計測中に撃破しないようにする
+            cx, cy = appearance.boss.rect.center
+            volleys = [ks.NeoBeam(appearance.boss, 3) for _ in range(config.get("neobeams", 0))]
+            volleys += [ks.NeoBeam(appearance.boss, 30, "ring") for _ in range(config.get("rings", 0))]
+            for volley in volleys:
+                frames = random.randint(0, 60)  # 発射済みのビームとして進めておく
+                size = ks.BossBullets.BIG if volley.pattern == "fan" else ks.BossBullets.SMALL
+                for angle in volley.angles():
+                    game.boss_beams.add(cx, cy, angle, size, age=frames)
+
+        for _ in range(config["beams"]):
+            beam = ks.Beam(bird, game.xbeam, game.emys, game.cemys, appearance.boss_appeared)
+            beam.rect.center = random.randint(0, ks.WIDTH), random.randint(0, ks.HEIGHT)
+            game.beams.add(beam)
+        for _ in range(config["durians"]):
+            drn = ks.Durian(bird)
+            drn.rect.center = random.randint(0, ks.WIDTH), random.randint(0, ks.HEIGHT)
+            game.drns.add(drn)
+        for _ in range(config["balls"]):
+            ball = ks.Soccerball(bird)
+            ball.rect.center = random.randint(0, ks.WIDTH), random.randint(0, ks.HEIGHT)
+            game.balls.add(ball)
+        self.probe = ks.Beam(bird, game.xbeam, game.emys, game.cemys, False)  # 探索計測用のビーム
+        self.renderer = ks.Renderer(self.screen, game.bg_img, full_redraw)
+        self.draw()  # 計測するのは前のフレームがある状態の描画
+
+
+    def targeting(self):
+        """
+        ビーム発射時の最近傍の敵探索（インデックスの作り直しを含む）
+        """
+        game = self.game
+        game.targets.invalidate()
+        for _ in range(QUERIES):
+            self.probe._find_nearest_enemy(game.bird, game.emys, game.cemys, game.targets)
+
+
+    def collision(self):
+        """
+        Game.collideの衝突判定ブロック
+        """
+        self.game.collide()
+
+
+    def update(self):
+        """
+        Game.advanceによる各グループのupdate
+        """
+        self.game.advance(ks.KeyState())
+
+
+    def draw(self):
+        """
+        Game.drawによる描画と画面への反映
+        """
+        self.game.draw(self.renderer)
+        self.renderer.present()
+
+
+
+def summarize(samples: list[float]) -> dict:
+    """
+    計測値（秒）のリストをミリ秒の統計量にまとめる
+    """
+    ms = sorted(x * 1000 for x in samples)
+    return {
+        "median_ms": statistics.median(ms),
+        "mean_ms": statistics.fmean(ms),
+        "min_ms": ms[0],
+        "p95_ms": ms[min(len(ms)-1, int(len(ms)*0.95))],
+    }
+
+
+def run_scenario(config: dict, reps: int, seed: int, full_redraw: bool = False) -> dict:
+    """
+    シナリオをreps回作り直して1フレームずつ計測する
+    戻り値：フェーズ名: 統計量の辞書
+    """
+    samples = {phase: [] for phase in PHASES}
+    for rep in range(reps):
+        world = World(config, seed + rep, full_redraw)
+        clock = time.perf_counter
+        t0 = clock()
+        world.targeting()
+        t1 = clock()
+        world.collision()
+        t2 = clock()
+        world.update()
+        t3 = clock()
+        world.draw()
+        t4 = clock()
+        samples["targeting"].append(t1 - t0)
+        samples["collision"].append(t2 - t1)
+        samples["update"].append(t3 - t2)
+        samples["draw"].append(t4 - t3)
+        samples["frame"].append(t4 - t0)
+    return {phase: summarize(values) for phase, values in samples.items()}
+
+
+def compare(result: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    ベースラインより中央値がthreshold以上遅くなったフェーズを列挙する
+    戻り値：退行の説明文のリスト
+    """
+    regressions = []
+    for name, phases in result["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        for phase, stats in phases.items():
+            if phase not in base:
+                continue
+            old, new = base[phase]["median_ms"], stats["median_ms"]
+            if old > 0 and new > old * (1 + threshold):
+                regressions.append(f"{name}.{phase}: {old:.3f}ms -> {new:.3f}ms (+{(new/old-1)*100:.0f}%)")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="こうかとんサバイバーのベンチマーク")
+    parser.add_argument("--scenario", nargs="*", choices=sorted(SCENARIOS), help="実行するシナリオ（省略時は--snapshotがなければ全部）")
+    parser.add_argument("--snapshot", nargs="*", default=[], help="シナリオの代わりに計測するスナップショットのファイル")
+    parser.add_argument("--reps", type=int, default=30, help="シナリオごとの計測回数")
+    parser.add_argument("--seed", type=int, default=0, help="乱数シード")
+    parser.add_argument("--out", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較するベースラインのJSONファイル")
+    parser.add_argument("--threshold", type=float, default=0.15, help="退行とみなす中央値の増加率")
+    parser.add_argument("--full-redraw", action="store_true", help="差分描画ではなく毎フレーム画面全体を描き直す")
+    args = parser.parse_args()
+
+    pg.init()
+    pg.display.set_mode((ks.WIDTH, ks.HEIGHT))
+    ks.ASSETS.load_all()
+    ks.TEXT.load_all()
+
+    result = {
+        "meta": {
+            "python": platform.python_version(),
+            "pygame": pg.version.ver,
+            "platform": platform.platform(),
+            "seed": args.seed,
+            "reps": args.reps,
+            "full_redraw": args.full_redraw,
+        },
+        "scenarios": {},
+    }
+    configs = {name: SCENARIOS[name] for name in args.scenario or ([] if args.snapshot else SCENARIOS)}
+    configs.update({os.path.basename(path): {"snapshot": path} for path in args.snapshot})
+    for name, config in configs.items():
+        result["scenarios"][name] = stats = run_scenario(config, args.reps, args.seed, args.full_redraw)
+        print(f"{name:14s} " + " ".join(f"{phase}={stats[phase]['median_ms']:.3f}ms" for phase in PHASES))
+    pg.quit()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = compare(result, json.load(f), args.threshold)
+        for line in regressions:
+            print("REGRESSION", line)
+        return 1 if regressions else 0
+    return 0
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,37 @@
+import collections
+import csv
+import hashlib
+import heapq
+import itertools
+import json
 import math
 import os
 import random
+import struct
 import sys
+import threading
 import time
+import warnings
+import zlib
 import pygame as pg
 from pygame.locals import *
+try:
+    import numpy as np
+except ImportError:  # NumPyがなければ敵は1体ずつ動かす
+    np = None
 
 
 WIDTH = 1100  # ゲームウィンドウの幅
 HEIGHT = 650  # ゲームウィンドウの高さ
-os.chdir(os.path.dirname(os.path.abspath(__file__)))
+FPS = 50  # 1秒あたりのシミュレーションのステップ数
+STEP = 1 / FPS  # 1ステップの時間（秒）
+MAX_STEPS = 5  # 描画1回あたりに追いつくステップ数の上限
+RENDER_FPS = 60  # 描画の上限フレームレート
+CLEAR_STEPS = 5 * FPS  # ボス撃破からゲーム終了までのステップ数
+GAMEOVER_STEPS = 2 * FPS  # やられてからゲーム終了までのステップ数（キーを押せばすぐ終わる）
+IDLE_FPS = 15  # 画面が変わらないシーン（スキル選択・ゲームオーバー）の描画の上限フレームレート
+ROOT = os.path.dirname(os.path.abspath(__file__))  # 画像などのファイルを探す基準のディレクトリ
+IMPORTED = time.perf_counter()  # このモジュールを読み込んだ時刻（プロセスの開始時刻が取れないときの代わり）
 
 
 
@@ -41,844 +63,4724 @@ def calc_orientation(org: pg.Rect, dst: pg.Rect) -> tuple[float, float]:
 
 
 
-class Gravity(pg.sprite.Sprite):
+def resource(path: str) -> str:
     """
-    重力場に関するクラス
+    ゲームに同梱したファイルのパスを返す（カレントディレクトリによらない）
+    引数 path：このファイルからの相対パス
+    戻り値：絶対パス
     """
-    def __init__(self, life: int):
+    return os.path.join(ROOT, path)
+
+
+
+def cache_dir() -> str:
+    """
+    作り直せるファイル（アトラスなど）を置くディレクトリを返す
+    環境変数KOUKATON_CACHEがあればそこ，なければXDG_CACHE_HOME（既定は~/.cache）の下を使う
+    """
+    path = os.environ.get("KOUKATON_CACHE")
+    if path:
+        return path
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "koukaton_survivor")
+
+
+
+def process_uptime() -> float:
+    """
+    プロセスが起動してからの経過秒数を返す
+    /procが読めない環境ではこのモジュールを読み込んでからの秒数を返す（インタプリタとpygameの起動分は含まない）
+    """
+    try:
+        with open("/proc/self/stat") as f:
+            ticks = int(f.read().rsplit(")", 1)[1].split()[19])  # 22番目の項目が起動時刻（OS起動からのクロック数）
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0]) - ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return time.perf_counter() - IMPORTED
+
+
+
+class AssetRegistry:
+    """
+    画像アセットを一度だけ読み込み，拡大縮小・変換したSurfaceを全インスタンスで共有するクラス
+    """
+    preload = [  # 起動時に読み込んでおく（ファイル名, 倍率）の一覧
+        ("fig/pg_bg.jpg", 1.0),
+        ("fig/3.png", 1.25),
+        ("fig/6.png", 1.25),
+        ("fig/8.png", 1.25),
+        ("fig/beam.png", 1.0),
+        ("fig/beam.png", 2.0),
+        ("fig/bossbeam.png", 1.0),
+        ("fig/explosion.gif", 1.0),
+        ("fig/fruit_durian.png", 0.3),
+        ("fig/sport_soccerball.png", 0.1),
+        ("fig/alien1.png", 0.5),
+        ("fig/images.jpg", 0.25),
+        ("fig/kouseki_colorful.png", 0.1),
+        ("fig/bakudan.png", 0.15),
+        ("fig/fantasy_dragon.png", 0.7),
+    ]
+    opaque = {"fig/pg_bg.jpg"}  # 透過不要でconvert()するファイル
+    atlas_width = 2048  # アトラスの幅
+    atlas_version = 4  # 3：カラーキーを画素ごとの透明度に直してから焼き込む，4：画素のCRCを目録に持つ
+    atlas_format = "BGRA" if sys.byteorder == "little" else "ARGB"  # convert_alpha後と同じ画素の並び（読み込んだまま使える）
+
+    def __init__(self, atlas: str | None = None):
         """
-        重力場Surfaceを生成する
-        引数 life：重力場の発動時間
+        引数 atlas：焼き込んだ画像をまとめたファイルの拡張子なしのパス（.jsonが目録，.rgbaが無圧縮の画素）
+        省略するとユーザーのキャッシュディレクトリに置く（同梱のfig/は書き換えない）
         """
-        super().__init__()
-        self.image = pg.Surface((WIDTH, HEIGHT))
-        self.image.set_alpha(128)  # 透明度を設定
-        self.image.fill((0, 0, 0))  # 黒い矩形
-        self.rect = self.image.get_rect()
-        self.life = life
+        self.atlas = atlas or os.path.join(cache_dir(), "atlas")
+        self.sources = {}  # ファイル名: 読み込んだままのSurface
+        self.surfaces = {}  # (ファイル名, 倍率, 角度, 反転): 変換済みSurface
+        self.baked = set()  # アトラスから切り出したキー
+        self.raw = []  # prepareで作ったがまだ画面の形式に変換していないキー
+        self.pending = None  # prepareで読み込んだアトラス（キー, 位置, 変換前のSurface）
+        self.loads = 0  # ディスクから読み込んだ回数
+        self.atlas_state = None  # "loaded"：アトラスを使った，"baked"：作り直した，None：使っていない
 
 
-    def update(self):
+    def variants(self) -> list[tuple]:
         """
-        発動時間を1減算し、0未満になったら消滅する
+        アトラスに焼き込む（ファイル名, 倍率, 角度, 反転）の一覧
         """
-        self.life -= 1
-        if self.life < 0:
-            self.kill()
+        keys = [(path, scale, 0, (False, False)) for path, scale in __class__.preload]
+        keys += Bird.variants(3) + Explosion.variants()
+        keys += Beam.rotations.variants(1.0) + BossBullets.variants()  # 初期倍率の回転画像
+        return list(dict.fromkeys(keys))
 
 
+    def load_all(self, rebake: bool = False):
+        """
+        variantsの画像をまとめて用意する（prepareとfinishを続けて呼ぶ）
+        pg.display.set_modeの後に呼ぶことでconvert_alpha済みのSurfaceになる
+        引数 rebake：Trueならアトラスを必ず作り直す
+        """
+        self.prepare(rebake)
+        self.finish()
 
-class GravityItem(pg.sprite.Sprite):
-    """
-    重力場発動アイテムに関するクラス
-    """
-    def __init__(self):
+
+    def prepare(self, rebake: bool = False, progress=None):
         """
-        重力場発動アイテムを生成する
+        variantsの画像を画面の形式に変換する手前まで用意する（Loaderのスレッドから呼ばれる）
+        元画像が変わっていないキーはアトラスから一度に読み込み，足りないキーだけ元画像から作ってアトラスを書き直す
+        引数1 rebake：Trueならアトラスを必ず作り直す
+        引数2 progress：進み具合を(済んだ数, 全体の数)で受け取る関数
         """
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/bakudan.png"), 0, 0.15)
-        self.rect = self.image.get_rect()
-        self.rect.center = random.randint(50, WIDTH-50), random.randint(50, HEIGHT-50)  # 画面内にランダムでアイテムを出現させる
+        keys = self.variants()
+        self.pending = None if rebake else self.read_atlas(keys)
+        found, stale = {}, True
+        if self.pending is not None:
+            baked, rects, sheet, stale = self.pending
+            self.pending = baked, rects, sheet
+            found = {key: sheet.subsurface(rect) for key, rect in zip(baked, rects)}
+        missing = [key for key in keys if key not in found]
+        for i, key in enumerate(missing):
+            if key not in self.surfaces:
+                self.surfaces[key] = self.build(*key)
+                self.raw.append(key)
+            if progress:
+                progress(len(found) + i + 1, len(keys))
+        if not missing and not stale:
+            self.atlas_state = "loaded"
+            if progress:
+                progress(1, 1)
+            return
+        try:
+            self.bake(keys, {key: found.get(key) or self.surfaces[key] for key in keys})
+            self.atlas_state = "baked"
+        except OSError:  # 書き込めない場所でもゲームは動かす
+            self.atlas_state = None
 
 
+    def finish(self):
+        """
+        prepareで用意した画像を画面の形式に変換して登録する
+        画面の形式を使うのでpg.display.set_modeの後にメインスレッドから呼ぶ
+        """
+        if self.pending is not None:
+            keys, rects, sheet = self.pending
+            self.pending = None
+            if pg.display.get_surface() is not None:
+                alpha = pg.Surface((1, 1), pg.SRCALPHA).convert_alpha()
+                if sheet.get_masks() != alpha.get_masks():  # 書き出した環境と画素の並びが違うときだけ変換する
+                    sheet = sheet.convert_alpha()
+            for key, rect in zip(keys, rects):
+                self.surfaces[key] = self.convert(key[0], sheet.subsurface(rect), opaque_only=True)
+                self.baked.add(key)
+        for key in self.raw:
+            self.surfaces[key] = self.convert(key[0], self.surfaces[key])
+        self.raw = []
 
-class Bird(pg.sprite.Sprite):
-    """
-    ゲームキャラクター（こうかとん）に関するクラス
-    """
-    delta = {  # 押下キーと移動量の辞書
-        pg.K_UP: (0, -1),
-        pg.K_DOWN: (0, +1),
-        pg.K_LEFT: (-1, 0),
-        pg.K_RIGHT: (+1, 0),
-    }
 
-    def __init__(self, num: int, xy: tuple[int, int]):
+    def _manifest(self, keys: list[tuple]) -> dict:
         """
-        こうかとん画像Surfaceを生成する
-        引数1 num：こうかとん画像ファイル名の番号
-        引数2 xy：こうかとん画像の位置座標タプル
+        アトラスが有効かどうかを判定するための情報（元画像の大きさと更新時刻，焼き込むキー）
         """
-        super().__init__()
-        img0 = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 1.25)
-        img = pg.transform.flip(img0, True, False)  # デフォルトのこうかとん
-        self.imgs = {
-            (+1, 0): img,  # 右
-            (+1, -1): pg.transform.rotozoom(img, 45, 1.0),  # 右上
-            (0, -1): pg.transform.rotozoom(img, 90, 1.0),  # 上
-            (-1, -1): pg.transform.rotozoom(img0, -45, 1.0),  # 左上
-            (-1, 0): img0,  # 左
-            (-1, +1): pg.transform.rotozoom(img0, 45, 1.0),  # 左下
-            (0, +1): pg.transform.rotozoom(img, -90, 1.0),  # 下
-            (+1, +1): pg.transform.rotozoom(img, -45, 1.0),  # 右下
+        paths = sorted({key[0] for key in keys})
+        stats = {path: os.stat(resource(path)) for path in paths}
+        return {
+            "version": __class__.atlas_version,
+            "format": __class__.atlas_format,
+            "sources": {path: [st.st_size, st.st_mtime_ns] for path, st in stats.items()},
+            "keys": [[path, scale, angle, list(flip)] for path, scale, angle, flip in keys],
         }
-        self.dire = (+1, 0)
-        self.image = self.imgs[self.dire]
-        self.rect = self.image.get_rect()
-        self.rect.center = xy
-        self.speed = 10
-        self.state = "normal"  # 追加: 通常状態
-        self.hyper_life = 0    # 追加: 発動時間
 
-        self.skills = []  # スキルの格納リスト(手持ちのスキル)
-        self.wait_skill = False  # スキル選択画面の表示について
+
+    def read_atlas(self, keys: list[tuple]) -> tuple | None:
+        """
+        アトラスの目録を確かめ，画素を1枚のSurfaceとして読み込む
+        元画像が変わったキーと今回使わないキーは捨て，残りのキーだけを返す
+        戻り値：(使えるキー, 位置, Surface, 書き直すべきか)（ファイルがない・形式が違う・画素が目録と組でないときはNone）
+        """
+        try:
+            with open(self.atlas + ".json") as f:
+                manifest = json.load(f)
+            expected = self._manifest(keys)
+            if manifest.get("version") != expected["version"] or manifest.get("format") != expected["format"]:
+                return None
+            sources = manifest["sources"]
+            wanted = set(keys)
+            usable, rects, stale = [], [], False
+            for (path, scale, angle, flip), rect in zip(manifest["keys"], manifest["rects"]):
+                key = (path, scale, angle, tuple(flip))
+                if key in wanted and sources.get(path) == expected["sources"].get(path):
+                    usable.append(key)
+                    rects.append(rect)
+                else:
+                    stale = True
+            size = manifest["size"]
+            pixels = bytearray(size[0] * size[1] * 4)
+            with open(self.atlas + ".rgba", "rb") as f:
+                if f.readinto(pixels) != len(pixels):  # 一度の読み込みで全画素を読む
+                    return None
+            if zlib.crc32(pixels) != manifest["crc"]:  # 別のプロセスが書き直した画素と組になっていない
+                return None
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        return usable, rects, pg.image.frombuffer(pixels, size, __class__.atlas_format), stale
 
 
-    def change_img(self, num: int, screen: pg.Surface):
+    def bake(self, keys: list[tuple], images: dict):
         """
-        こうかとん画像を切り替え，画面に転送する
-        引数1 num：こうかとん画像ファイル名の番号
-        引数2 screen：画面Surface
+        キーの画像を1枚のアトラスに並べ，無圧縮の画素と目録を書き出す
+        引数1 keys：焼き込むキー
+        引数2 images：キー: 画面の形式に変換する前のSurface（画素ごとの透明度つき）
         """
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/{num}.png"), 0, 1.25)
-        screen.blit(self.image, self.rect)
+        rects, x, y, row = [], 0, 0, 0
+        order = sorted(range(len(keys)), key=lambda i: -images[keys[i]].get_height())  # 高い順に棚詰めする
+        placed = [None] * len(keys)
+        for i in order:
+            w, h = images[keys[i]].get_size()
+            if x + w > __class__.atlas_width:
+                x, y, row = 0, y + row, 0
+            placed[i] = [x, y, w, h]
+            x += w
+            row = max(row, h)
+        sheet = pg.Surface((__class__.atlas_width, max(1, y + row)), pg.SRCALPHA)
+        sheet.fill((0, 0, 0, 0))
+        for key, rect in zip(keys, placed):
+            sheet.blit(images[key], rect[:2], special_flags=pg.BLEND_RGBA_ADD)  # 透明の上に足すことで画素をそのまま写す
+        manifest = self._manifest(keys)
+        manifest["size"] = list(sheet.get_size())
+        manifest["rects"] = placed
+        data = pg.image.tobytes(sheet, __class__.atlas_format)
+        manifest["crc"] = zlib.crc32(data)
+        os.makedirs(os.path.dirname(self.atlas) or ".", exist_ok=True)
+        tmp = f"{self.atlas}.{os.getpid()}.{threading.get_ident()}.tmp"  # 同時に焼き込む他のプロセスと名前が重ならない
+        try:
+            with open(tmp + ".rgba", "wb") as f:
+                f.write(data)
+            with open(tmp + ".json", "w") as f:
+                json.dump(manifest, f)
+            os.replace(tmp + ".rgba", self.atlas + ".rgba")
+            os.replace(tmp + ".json", self.atlas + ".json")  # 目録を最後に置き換えるので，途中で読んでも古い目録では使われない
+        finally:
+            for ext in (".rgba", ".json"):
+                if os.path.exists(tmp + ext):
+                    os.remove(tmp + ext)
 
 
-    def update(self, key_lst: list[bool], screen: pg.Surface):
+    def source(self, path: str) -> pg.Surface:
         """
-        押下キーに応じてこうかとんを移動させる
-        引数1 key_lst：押下キーの真理値リスト
-        引数2 screen：画面Surface
+        画像ファイルを読み込む（2回目以降はキャッシュを返す）
+        引数 path：画像ファイル名
+        戻り値：読み込んだSurface
         """
-        sum_mv = [0, 0]
-        for k, mv in __class__.delta.items():
-            if key_lst[k]:
-                sum_mv[0] += mv[0]
-                sum_mv[1] += mv[1]
-        self.rect.move_ip(self.speed*sum_mv[0], self.speed*sum_mv[1])
-        if check_bound(self.rect) != (True, True):
-            self.rect.move_ip(-self.speed*sum_mv[0], -self.speed*sum_mv[1])
-        if not (sum_mv[0] == 0 and sum_mv[1] == 0):
-            self.dire = tuple(sum_mv)
-            self.image = self.imgs[self.dire]
-        screen.blit(self.image, self.rect)
-        
-        screen.blit(self.image, self.rect)
+        if path not in self.sources:
+            img = pg.image.load(resource(path))
+            if path not in __class__.opaque:
+                img = self.straighten(img)
+            self.sources[path] = img
+            self.loads += 1
+        return self.sources[path]
 
 
+    @staticmethod
+    def straighten(img: pg.Surface) -> pg.Surface:
+        """
+        カラーキーやパレットの透過を画素ごとの透明度に直す
+        アトラスへの加算合成はカラーキーを無視するので，焼き込む前にconvert_alphaと同じ画素にそろえておく
+        引数 img：読み込んだままのSurface
+        戻り値：画素ごとの透明度を持つSurface
+        """
+        if img.get_flags() & pg.SRCALPHA and img.get_colorkey() is None:
+            return img
+        out = pg.Surface(img.get_size(), pg.SRCALPHA)
+        out.fill((0, 0, 0, 0))
+        out.blit(img, (0, 0))  # カラーキーの画素は写らずに透明のまま残る
+        return out
+
 
-class Beam(pg.sprite.Sprite):
-    """
-    追尾機能付きビームに関するクラス
-    """
-    def __init__(self, bird: Bird, xbeam: float, enemies: pg.sprite.Group, clown_enemies: pg.sprite.Group, appearance):
+    def build(self, path: str, scale: float, angle: float, flip: tuple[bool, bool]) -> pg.Surface:
         """
-        ビームを生成する
-        引数1 bird：ビームを放つこうかとん
-        引数2 xbeam：ビーム倍率
-        引数3 enemies：通常の敵機グループ
-        引数4 clown_enemies：ピエロの敵機グループ
+        元画像を拡大縮小・回転・反転したSurfaceを作る（画面の形式には変換しない）
         """
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/beam.png"), 0, 2.0)
-        self.rect = self.image.get_rect()
-        self.rect.center = bird.rect.center
-        self.speed = 10
-        self.appearance = appearance
-        
-        if self.appearance:
-            self.vx, self.vy = calc_orientation(self.rect, pg.Rect(WIDTH/2, 250, 0, 0))
-        else:
-            # 最も近い敵を特定
-            self.target = self._find_nearest_enemy(bird, enemies, clown_enemies)
-            # 初期の移動方向を設定
-            self.vx, self.vy = bird.dire if self.target is None else calc_orientation(self.rect, self.target.rect)
-        
-        # 角度の計算と画像の回転
-        angle = math.degrees(math.atan2(-self.vy, self.vx))
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/beam.png"), angle, xbeam)
+        img = self.source(path)
+        if flip != (False, False):
+            img = pg.transform.flip(img, *flip)
+        if scale != 1.0 or angle != 0:
+            img = pg.transform.rotozoom(img, angle, scale)
+        return img
 
 
-    def _find_nearest_enemy(self, bird: Bird, enemies: pg.sprite.Group, clown_enemies: pg.sprite.Group) -> pg.sprite.Sprite:
+    def convert(self, path: str, img: pg.Surface, opaque_only: bool = False) -> pg.Surface:
         """
-        全ての敵（通常の敵とピエロ）の中から最も近い敵を見つける
-        引数1 bird：こうかとん
-        引数2 enemies：通常の敵機グループ
-        引数3 clown_enemies：ピエロの敵機グループ
-        戻り値：最も近い敵のSprite（敵がいない場合はNone）
+        画面の形式に変換する（画面生成前はそのまま返す）
+        引数1 path：画像ファイル名（opaqueならconvert，それ以外はconvert_alpha）
+        引数2 img：変換するSurface
+        引数3 opaque_only：Trueなら透過なしの画像だけ変換する（アトラスは既に透過ありの形式なので）
         """
-        nearest_enemy = None
-        min_distance = float('inf')
-        
-        # 通常の敵とピエロの敵を両方チェック
-        for enemy in list(enemies) + list(clown_enemies):
-            distance = math.hypot(bird.rect.centerx - enemy.rect.centerx,
-                                bird.rect.centery - enemy.rect.centery)
-            if distance < min_distance:
-                min_distance = distance
-                nearest_enemy = enemy
-        
-        return nearest_enemy
+        if pg.display.get_surface() is None:
+            return img
+        if path in __class__.opaque:
+            return img.convert()  # 背景などは透過なしの方が速く描ける
+        return img if opaque_only else img.convert_alpha()
 
 
-    def update(self, xbeam: float, appearance):
+    def get(self, path: str, scale: float = 1.0, angle: float = 0, flip: tuple[bool, bool] = (False, False)) -> pg.Surface:
         """
-        ビームを移動させる
-        敵が生存している場合は追尾する
+        拡大縮小・回転・反転済みの共有Surfaceを返す
+        引数1 path：画像ファイル名
+        引数2 scale：倍率
+        引数3 angle：回転角度
+        引数4 flip：(横反転, 縦反転)
+        戻り値：共有Surface（書き換えないこと）
         """
-        if self.appearance:
-            # ボスの中心座標を取得
-            boss_centerx = appearance.rect.centerx
-            boss_centery = appearance.rect.centery
-            
-            # ビームの現在座標を取得
-            beam_centerx = self.rect.centerx
-            beam_centery = self.rect.centery
-            
-            # ボスの中心座標への方向ベクトルを計算
-            dx = boss_centerx - beam_centerx
-            dy = boss_centery - beam_centery
-            distance = math.sqrt(dx**2 + dy**2)  # 距離を計算
-            
-            if distance != 0:  # 0で割るのを防ぐ
-                self.vx = dx / distance
-                self.vy = dy / distance
-            # 画面中央へ移動する処理
-            self.rect.move_ip(self.speed * self.vx, self.speed * self.vy)
-        else:
-            if self.target and self.target.alive():
-                # ターゲットの方向を再計算
-                self.vx, self.vy = calc_orientation(self.rect, self.target.rect)
-                # 画像の角度を更新
-                angle = math.degrees(math.atan2(-self.vy, self.vx))
-                self.image = pg.transform.rotozoom(pg.image.load(f"fig/beam.png"), angle, xbeam)
-            self.rect.move_ip(self.speed * self.vx, self.speed * self.vy)
-            
-        if (self.rect.centerx <= 0 or self.rect.centerx >= WIDTH) and (self.rect.centery <= 0 or self.rect.centery >= HEIGHT):
-            self.kill()
+        key = (path, scale, angle, flip)
+        img = self.surfaces.get(key)
+        if img is None:  # アトラスにもないときだけ作る
+            img = self.surfaces[key] = self.convert(path, self.build(path, scale, angle, flip))
+        return img
 
 
+    def find(self, path: str, scale: float = 1.0, angle: float = 0, flip: tuple[bool, bool] = (False, False)) -> pg.Surface | None:
+        """
+        用意済みのSurfaceだけを返す（なければ作らずにNone）
+        """
+        return self.surfaces.get((path, scale, angle, flip))
 
-class Bossbeam(pg.sprite.Sprite):
-    """
-    ボスビームに関するクラス
-    """
-    def __init__(self, boss, angle0:float=0):  # angleのパラメータを追加
+
+    def digest(self) -> str:
         """
-        ビーム画像Surfaceを生成する
-        引数1 boss：ビームを放つボス
-        引数2 angle0：追加の回転角度　（デフォルト：0）
+        用意した画像の画素のハッシュを返す（当たり判定のマスクが同じ環境かどうかを記録と比べるのに使う）
+        戻り値：16進数の文字列
         """
-        super().__init__()
-        self.vx, self.vy = boss.dire
-        angle = math.degrees(math.atan2(-self.vy, self.vx))
-        angle += angle0  # 追加の回転角度を適用
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/bossbeam.png"), angle, 2.0)
-        self.vx = math.cos(math.radians(angle))
-        self.vy = -math.sin(math.radians(angle))
-        self.rect = self.image.get_rect()
-        self.rect.centery = boss.rect.centery
-        self.rect.centerx = boss.rect.centerx
-        self.speed = 3
+        h = hashlib.sha1()
+        for key in self.variants():
+            img = self.get(*key)
+            h.update(struct.pack("<II", *img.get_size()))
+            h.update(pg.image.tobytes(img, "RGBA"))
+        return h.hexdigest()
 
 
-    def update(self):
+    def stats(self) -> dict:
         """
-        ビームを速度ベクトルself.vx, self.vyに基づき移動させる
-        引数 screen：画面Surface
+        読み込み状況を返す
+        戻り値：読み込み回数，保持Surface数，保持バイト数の辞書
         """
-        self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
-        if (self.rect.centerx <= 0 or self.rect.centerx >= WIDTH) and (self.rect.centery <= 0 or self.rect.centery >= HEIGHT):
-            self.kill()
+        sources = sum(s.get_pitch()*s.get_height() for s in self.sources.values())
+        variants = sum(s.get_pitch()*s.get_height() for s in self.surfaces.values())
+        return {
+            "loads": self.loads,
+            "surfaces": len(self.surfaces),
+            "source_bytes": sources,
+            "surface_bytes": variants,
+            "bytes": sources + variants,
+            "baked": len(self.baked),
+            "atlas": self.atlas_state,
+        }
 
 
+ASSETS = AssetRegistry()  # 全スプライトで共有するアセット
 
-class NeoBeam:
+
+
+class TextCache:
     """
-    複数方向ビームに関するクラス
+    フォントを大きさごとに一度だけ作り，描画した文字列Surfaceを使い回すクラス
+    文字列Surfaceは最近使った順にcapacity個まで残す
     """
-    def __init__(self, boss, num: int):
+    preload = [  # 起動時に作っておく（フォントの大きさ, 文字列, 色）の一覧
+        (50, "Select Skill - 1:Durian 2:Soccerball", (255, 255, 255)),
+        (100, "WARNING!!", (255, 0, 0)),
+        (150, "GAME CLEAR!", (255, 215, 0)),
+        (150, "GAME OVER", (255, 0, 0)),
+    ]
+
+    def __init__(self, capacity: int = 64):
         """
-        引数1 boss：ビームを放つボス
-        引数2 num：ビームの数
+        引数 capacity：残しておく文字列Surfaceの数
         """
-        self.boss = boss
-        self.num = num
-    
+        self.capacity = capacity
+        self.fonts = {}  # 大きさ: Font
+        self.texts = {}  # (大きさ, 文字列, アンチエイリアス, 色): Surface（最近使ったものほど後ろ）
+        self.renders = 0  # 実際に描画した回数
+        self.evictions = 0  # 古いものを捨てた回数
+
 
-    def gen_beams(self) -> list[Bossbeam]:
+    def load_all(self):
         """
-        複数方向のビームを生成する
-        戻り値：Beamインスタンスのリスト
+        preloadに登録された文字列をまとめて描画しておく
         """
-        beams = []
-        # 基準となる角度をランダムに決定 (-180度から180度の間)
-        base_angle = random.randint(-180, 180)
-        angle_range = 100  # 発射範囲は100度
-        angle_step = angle_range / (self.num - 1) if self.num > 1 else 0
-        
-        for i in range(self.num):
-            # 基準角度を中心に扇状に広がるように角度を計算
-            spread_angle = -50 + (i * angle_step)  # -50度から+50度まで扇状に広がる
-            final_angle = base_angle + spread_angle  # 基準角度に扇状の角度を加算
-            beams.append(Bossbeam(self.boss, final_angle))
-        
-        return beams
-    
+        for size, text, color in __class__.preload:
+            self.render(size, text, color)
 
 
-class Explosion(pg.sprite.Sprite):
-    """
-    爆発に関するクラス
-    """
-    def __init__(self, obj: "Enemy", life: int):
-        super().__init__()
-        img = pg.image.load(f"fig/explosion.gif")
-        self.imgs = [img, pg.transform.flip(img, 1, 1)]
-        self.image = self.imgs[0]
-        self.rect = self.image.get_rect(center=obj.rect.center)
-        self.life = life
+    def font(self, size: int) -> pg.font.Font:
+        """
+        既定フォントを返す（大きさごとに一度だけ作る）
+        引数 size：フォントの大きさ
+        """
+        font = self.fonts.get(size)
+        if font is None:
+            font = self.fonts[size] = pg.font.Font(None, size)
+        return font
 
 
-    def update(self):
+    def render(self, size: int, text: str, color: tuple[int, int, int], antialias: bool = True) -> pg.Surface:
         """
-        爆発時間を1減算した爆発経過時間_lifeに応じて爆発画像を切り替えることで
-        爆発エフェクトを表現する
+        文字列を描画したSurfaceを返す（同じ組み合わせなら前回のものを返す）
+        引数1 size：フォントの大きさ
+        引数2 text：文字列
+        引数3 color：文字の色
+        引数4 antialias：アンチエイリアスするか
+        戻り値：共有Surface（書き換えないこと）
         """
-        self.life -= 1
-        self.image = self.imgs[self.life//10%2]
-        if self.life < 0:
-            self.kill()
+        key = (size, text, antialias, color)
+        img = self.texts.pop(key, None)
+        if img is None:
+            img = self.font(size).render(text, antialias, color)
+            self.renders += 1
+            if len(self.texts) >= self.capacity:
+                del self.texts[next(iter(self.texts))]  # 一番長く使われていないものを捨てる
+                self.evictions += 1
+        self.texts[key] = img  # 末尾に入れ直して最近使ったことにする
+        return img
+
+
+    def stats(self) -> dict:
+        """
+        戻り値：フォント数，保持Surface数，描画回数，破棄回数の辞書
+        """
+        return {
+            "fonts": len(self.fonts),
+            "texts": len(self.texts),
+            "renders": self.renders,
+            "evictions": self.evictions,
+        }
 
 
+TEXT = TextCache()  # 画面上の文字で共有するキャッシュ
 
-class Durian(pg.sprite.Sprite):
+
+
+class MaskCache:
     """
-    スキル:ドリアンのこと
-    ドリアンに関するクラス
-    引数1 player：ドリアンの初期位置をbirdの位置にする
+    画像ごとにpg.mask.from_surfaceの結果を一度だけ作って使い回し，画素単位の当たり判定を行うクラス
+    画像はASSETSや回転画像テーブルで共有されているので，マスクも向きや回転バケットごとに1つで済む
+    矩形（や格子）で当たった候補だけを調べる
     """
-    def __init__(self, player: Bird):
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load("fig/fruit_durian.png"), 0, 0.3)  # ドリアンの倍率設定
-        self.rect = self.image.get_rect()
-        self.rect.center = player.rect.center  # ドリアンの初期座標
-        self.vx = 1  # 初期速度(x方向)
-        self.vy = 1  # 初期速度(y方向)
-        self.speed = 3
-        self.has_damaged_boss = False  # Bossにダメージを与えたかどうかを示すフラグ
+    def __init__(self, capacity: int = 1024):
+        """
+        引数 capacity：保持するマスクの数の上限（超えたら全て捨てる．画像を読み込み直したときの古い分を残さない）
+        """
+        self.capacity = capacity
+        self.masks = {}  # 画像: マスク
+        self.builds = 0  # マスクを作った回数
+        self.checks = 0  # 画素単位で調べた回数
 
 
-    def update(self):
-        self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
+    def get(self, img: pg.Surface) -> pg.mask.Mask:
+        """
+        画像のマスクを返す
+        引数 img：共有Surface
+        戻り値：不透明な画素が立ったマスク
+        """
+        mask = self.masks.get(img)
+        if mask is None:
+            if len(self.masks) >= self.capacity:
+                self.masks.clear()
+            mask = self.masks[img] = pg.mask.from_surface(img)
+            self.builds += 1
+        return mask
 
-        if self.rect.left < 0:  # 左壁衝突時の反転
-            self.vx *= -1
-        if self.rect.right > WIDTH:  # 右壁衝突時の反転
-            self.vx *= -1
-        if self.rect.top < 0:  # 上壁衝突時の反転
-            self.vy *= -1
-        if self.rect.bottom > HEIGHT:  # 下壁衝突時の反転
-            self.vy *= -1
 
+    def collide(self, a, b) -> bool:
+        """
+        描画位置に置いた2つの画像の不透明な画素が重なっているか（pg.sprite.collide_maskのキャッシュ版）
+        引数1 a, 引数2 b：imageとrectを持つオブジェクト（rect.topleftに描かれる）
+        戻り値：重なっていればTrue
+        """
+        self.checks += 1
+        masks, ra, rb = self.masks, a.rect, b.rect
+        ma, mb = masks.get(a.image), masks.get(b.image)  # 何度も呼ばれるので，作り済みならgetを経由しない
+        if ma is None:
+            ma = self.get(a.image)
+        if mb is None:
+            mb = self.get(b.image)
+        return ma.overlap(mb, (rb.x - ra.x, rb.y - ra.y)) is not None
 
 
-class Soccerball(pg.sprite.Sprite):
+    def stats(self) -> dict:
+        """
+        戻り値：保持マスク数，作った回数，調べた回数の辞書
+        """
+        return {"masks": len(self.masks), "builds": self.builds, "checks": self.checks}
+
+
+MASKS = MaskCache()  # 画素単位の当たり判定で共有するマスク
+
+
+
+class Loader:
     """
-    サッカーボールに関するクラス
-    引数1 player：ボールの初期位置をbirdの位置にする
+    画像と文字列を別スレッドで用意し，その間に読み込み画面を描くクラス
+    スレッドでは読み込み・拡大縮小・回転とフォントの準備だけを行い，画面の形式への変換はfinishでメインスレッドが行う
     """
-    def __init__(self, player: Bird):
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load("fig/sport_soccerball.png"), 0, 0.1)  # サッカーボールの倍率設定
-        self.rect = self.image.get_rect()
-        self.rect.center = player.rect.center  # サッカーボールの初期座標
-        self.vx = 1  # 初期速度(x方向)
-        self.vy = 1  # 初期速度(y方向)
-        self.speed = 10
+    bar = pg.Rect(0, 0, 600, 24)  # 進み具合のバー（画面中央の下寄りに置く）
 
+    def __init__(self, assets: AssetRegistry, text: TextCache):
+        """
+        引数1 assets：画像を用意するAssetRegistry
+        引数2 text：文字列を用意するTextCache
+        """
+        self.assets = assets
+        self.text = text
+        self.done, self.total = 0, 1  # 画像の進み具合
+        self.error = None  # スレッドで起きた例外
+        self.thread = threading.Thread(target=self._run, name="loader", daemon=True)
+        self.bar = __class__.bar.copy()
+        self.bar.center = WIDTH//2, HEIGHT*2//3
 
-    def update(self, emy_rct):
-        self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
 
-        if self.rect.left < 0 or self.rect.right > WIDTH:  # 左と右壁衝突時の反転
-            self.vx *= -1
-        if self.rect.top < 0 or self.rect.bottom > HEIGHT:  # 上と下壁衝突時の反転
-            self.vy *= -1
-        
-    
-        for emy in pg.sprite.spritecollide(self, emy_rct, False):
-            if self.rect.left <= emy.rect.right or self.rect.right >= emy.rect.left:
-                self.vx *= -1
-            if self.rect.top >= emy.rect.bottom or self.rect.bottom <= emy.rect.top:
-                self.vy *= -1
+    def start(self) -> "Loader":
+        """
+        読み込み画面の文字を描いてからスレッドを始める
+        フォントはスレッドと同時に使わないよう，ここで描いた文字だけを読み込み中に表示する
+        """
+        self.title = self.text.render(100, "Koukaton Survivor", (255, 255, 255))
+        self.label = self.text.render(40, "Loading...", (200, 200, 200))
+        self.thread.start()
+        return self
 
 
+    def _run(self):
+        """
+        スレッドで画像と固定の文字列を用意する
+        """
+        try:
+            self.assets.prepare(progress=self._progress)
+            self.text.load_all()
+        except BaseException as e:  # メインスレッドのfinishで投げ直す
+            self.error = e
 
-class Enemy(pg.sprite.Sprite):
-    def __init__(self, player: Bird, spawn_directions: int):
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/alien1.png"), 0, 0.5)
-        self.rect = self.image.get_rect()
-        
-        # 指定された方向数に基づいてランダムな角度を選択
-        angle = random.randint(0, spawn_directions-1) * (360/spawn_directions)
-        angle_rad = math.radians(angle)
-        radius = max(WIDTH, HEIGHT) + 100  # 画面外からの出現を確実にする
-        
-        self.rect.center = (
-            WIDTH/2 + math.cos(angle_rad) * radius,
-            HEIGHT/2 + math.sin(angle_rad) * radius
-        )
-        
-        self.player = player
-        self.speed = 3
-        self.visible = False  # 画面内に入ったかどうかのフラグ
 
+    def _progress(self, done: int, total: int):
+        """
+        スレッドから進み具合を受け取る
+        """
+        self.done, self.total = done, total
 
-    def update(self):
-        self.vx, self.vy = calc_orientation(self.rect, self.player.rect)
-        self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
+
+    def progress(self) -> float:
+        """
+        戻り値：画像の用意が済んだ割合（0〜1）
+        """
+        return self.done / self.total
 
 
+    def ready(self) -> bool:
+        """
+        戻り値：スレッドの処理が終わっていればTrue
+        """
+        return not self.thread.is_alive()
 
-class Score:
+
+    def wait(self, timeout: float):
+        """
+        スレッドの処理が終わるか，timeout秒たつまで待つ
+        """
+        self.thread.join(timeout)
+
+
+    def finish(self):
+        """
+        スレッドの終了を待ち，用意した画像を画面の形式に変換する
+        """
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+        self.assets.finish()
+
+
+    def draw(self, screen: pg.Surface):
+        """
+        タイトルと進み具合のバーを描く
+        引数 screen：画面Surface
+        """
+        screen.fill((0, 0, 0))
+        screen.blit(self.title, self.title.get_rect(center=(WIDTH//2, HEIGHT//3)))
+        screen.blit(self.label, self.label.get_rect(midbottom=(WIDTH//2, self.bar.top - 10)))
+        pg.draw.rect(screen, (255, 255, 255), self.bar, 2)
+        fill = self.bar.inflate(-8, -8)
+        fill.width = int(fill.width * self.progress())
+        pg.draw.rect(screen, (255, 215, 0), fill)
+
+
+
+class RotationCache:
     """
-    打ち落とした爆弾，敵機の数をスコアとして表示するクラス
-    爆弾：1点
-    敵機：10点
+    角度をバケットに量子化して回転済み画像を使い回すテーブル
+    倍率が変わったときだけテーブルを作り直し，各バケットは初めて使われたときに回転させる
     """
-    def __init__(self):
-        self.font = pg.font.Font(None, 50)
-        self.color = (0, 0, 255)
-        self.value = 0
-        self.image = self.font.render(f"Score: {self.value}", 0, self.color)
-        self.rect = self.image.get_rect()
-        self.rect.center = 100, HEIGHT-50
+    def __init__(self, path: str, step: float = 5):
+        """
+        引数1 path：回転させる画像ファイル名
+        引数2 step：1バケットあたりの角度（度）
+        """
+        self.path = path
+        self.set_step(step)
 
 
-    def update(self, screen: pg.Surface):
-        self.image = self.font.render(f"Score: {self.value}", 0, self.color)
-        screen.blit(self.image, self.rect)
+    def set_step(self, step: float):
+        """
+        バケットの分解能を変更し，テーブルを破棄する
+        引数 step：1バケットあたりの角度（度）
+        """
+        self.step = step
+        self.size = max(1, round(360 / step))
+        self.scale = None
+        self.table = []
+        self.rebuilds = 0  # テーブルを作り直した回数
 
 
+    def bucket(self, angle: float) -> int:
+        """
+        角度をバケット番号に変換する
+        引数 angle：角度（度）
+        戻り値：バケット番号
+        """
+        return round(angle / self.step) % self.size
 
-class ClownEnemy(pg.sprite.Sprite):
-    """ピエロの敵クラス"""
-    def __init__(self, player: "Bird", spawn_directions: int):
-        super().__init__()
-        # 基本の画像設定
-        self.image = pg.transform.rotozoom(pg.image.load("fig/images.jpg"), 0, 0.25)
-        self.rect = self.image.get_rect()
-        
-        # 出現位置の設定（画面外から確実に出現するように修正）
-        angle = random.randint(0, spawn_directions-1) * (360/spawn_directions)
-        angle_rad = math.radians(angle)
-        radius =max(WIDTH, HEIGHT) + 100  # 画面外からの距離を調整
-        
-        # 画面の中心からの位置を計算
-        spawn_x = WIDTH/2 + math.cos(angle_rad) * radius
-        spawn_y = HEIGHT/2 + math.sin(angle_rad) * radius
-        
-        # 画面外になるように調整
-        if spawn_x < WIDTH/2:
-            spawn_x = -50
-        elif spawn_x >= WIDTH/2:
-            spawn_x = WIDTH + 50
-            
-        if spawn_y < HEIGHT/2:
-            spawn_y = -50
-        elif spawn_y >= HEIGHT/2:
-            spawn_y = HEIGHT + 50
-            
-        self.rect.center = (spawn_x, spawn_y)
-        self.player = player
-        self.base_speed = 2
-        self.speed = self.base_speed
-        self.points = 20
-        
-        # 移動用の変数
-        self.vx = 0
-        self.vy = 0
-        self.movement_phase = 0
 
+    def get(self, bucket: int, scale: float) -> pg.Surface:
+        """
+        バケットと倍率に対応する回転済み画像を返す
+        引数1 bucket：バケット番号
+        引数2 scale：倍率
+        戻り値：共有Surface（書き換えないこと）
+        """
+        if scale != self.scale:  # 倍率が変わったら古いテーブルを捨てる
+            self.scale = scale
+            self.table = [None] * self.size
+            self.rebuilds += 1
+        img = self.table[bucket]
+        if img is None:
+            img = ASSETS.find(self.path, scale, bucket * self.step)  # アトラスに焼き込み済みならそれを使う
+            if img is None:  # 焼き込みと同じ画素で作り，焼き込み済みの画像と同じく画面の形式にしておく
+                key = (self.path, scale, bucket * self.step, (False, False))
+                img = ASSETS.convert(self.path, ASSETS.build(*key))
+            self.table[bucket] = img
+        return img
 
-    def update(self):
-        """敵の更新処理"""
-        # プレイヤーへの方向を計算
-        target_x = self.player.rect.centerx - self.rect.centerx
-        target_y = self.player.rect.centery - self.rect.centery
-        
-        # 方向の正規化
-        distance = math.sqrt(target_x**2 + target_y**2)
-        if distance != 0:
-            self.vx = (target_x / distance) * self.speed
-            self.vy = (target_y / distance) * self.speed
-            
-        # ジグザグ動作の追加
-        self.movement_phase += 0.1
-        perpendicular_x = -self.vy  # 垂直方向のベクトル
-        perpendicular_y = self.vx
-        zigzag = math.sin(self.movement_phase) * 2  # ジグザグの振れ幅を調整
-        
-        # 最終的な移動を適用
-        self.rect.x += self.vx + perpendicular_x * zigzag
-        self.rect.y += self.vy + perpendicular_y * zigzag
+
+    def variants(self, scale: float) -> list[tuple]:
+        """
+        アトラスに焼き込む全バケットのキー
+        引数 scale：倍率
+        戻り値：(ファイル名, 倍率, 角度, 反転)のリスト
+        """
+        return [(self.path, scale, bucket * self.step, (False, False)) for bucket in range(self.size)]
 
 
 
-class Item(pg.sprite.Sprite):
+class SpatialHash:
     """
-    強化アイテムに関するクラス
+    画面を一様な格子に分け，スプライトが重なるセルにグループごとに登録して衝突候補を絞り込むクラス
+    1フレームに1回buildし，その後の衝突判定はすべてこの格子に問い合わせる
     """
-    def __init__(self):
+    def __init__(self, cell: int = 128):
         """
-        強化アイテムSurfaceを生成する
+        引数 cell：1セルの一辺（ピクセル）
         """
-        super().__init__()
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/kouseki_colorful.png"), 0, 0.1)
-        self.rect = self.image.get_rect()
-        self.rect.center = random.randint(50, WIDTH-50), random.randint(50, HEIGHT-50)
+        self.cell = cell
+        self.cells = {}  # グループ: {(列, 行): 登録されたスプライトのリスト}
+        self.order = {}  # スプライト: 登録順（groupcollideと同じ順に処理するため）
 
 
+    def build(self, *groups: pg.sprite.Group, area: pg.Rect | None = None):
+        """
+        格子を空にしてグループのスプライトを登録し直す
+        引数1 groups：登録するスプライトグループ
+        引数2 area：EnemySwarmの敵はこれと重なるものだけ登録する（外の敵は何にも当たらない範囲を渡す．Noneなら全て）
+        """
+        self.cells.clear()
+        self.order.clear()
+        c = self.cell
+        order = self.order
+        for group in groups:
+            cells = self.cells[group] = {}
+            swarm = getattr(group, "swarm", None)
+            if isinstance(swarm, EnemySwarm):  # 配列から求めるので敵のRectを書き戻さずに済む
+                for sprite in group:
+                    order[sprite] = len(order)
+                spans = swarm.spans(group, c, area)
+            else:
+                spans = []
+                for sprite in group:
+                    order[sprite] = len(order)
+                    rect = sprite.rect
+                    spans.append((sprite, rect.left//c, (rect.right-1)//c, rect.top//c, (rect.bottom-1)//c))
+            for sprite, x0, x1, y0, y1 in spans:
+                for ix in range(x0, x1 + 1):
+                    for iy in range(y0, y1 + 1):
+                        if (ix, iy) in cells:
+                            cells[ix, iy].append(sprite)
+                        else:
+                            cells[ix, iy] = [sprite]
 
-class Boss:
-    def __init__(self):
-        self.image = pg.transform.rotozoom(pg.image.load(f"fig/fantasy_dragon.png"), 0, 0.7)
-        self.rect = self.image.get_rect()
-        self.rect.center = (WIDTH/2, 0)  # ボスの初期位置を設定
-        self.health = 200  # ボスの体力（必要に応じて調整）
-        self.appearing=True
-        self.font = pg.font.Font(None, 50)  # 体力表示用のフォント
-        self.defeated = False  # ボス撃破フラグ
-        self.defeat_time = None  # ボス撃破時刻
-        self.dire=(+1, 0)
 
+    def query(self, rect: pg.Rect, group: pg.sprite.Group) -> list[pg.sprite.Sprite]:
+        """
+        rectと重なるgroupのスプライトを登録順に返す
+        引数1 rect：判定するRect
+        引数2 group：登録済みのスプライトグループ（killされたものは含まない）
+        戻り値：衝突したスプライトのリスト
+        """
+        c = self.cell
+        cells = self.cells[group]
+        found = []
+        for ix in range(rect.left//c, (rect.right-1)//c + 1):
+            for iy in range(rect.top//c, (rect.bottom-1)//c + 1):
+                if (ix, iy) in cells:
+                    found += cells[ix, iy]
+        if not found:
+            return found
+        found = [found[i] for i in rect.collidelistall([sprite.rect for sprite in found])]
+        if len(found) > 1:  # 複数セルにまたがるスプライトの重複を除いて登録順に並べる
+            found = sorted(set(found), key=self.order.__getitem__)
+        return [sprite for sprite in found if sprite.alive()]
 
-    def __update__(self, screen):
-        # ボスの表示と移動
-        if self.appearing:
-            self.rect.y += 1
-            if self.rect.top >= 150:
-                self.rect.top = 150
-                self.appearing = False
 
-        # 体力表示
-        health_text = self.font.render(f"Boss HP: {self.health}", True, (255, 0, 0))
-        screen.blit(health_text, (10, 10))
+    def collide(self, groupa: pg.sprite.Group, groupb: pg.sprite.Group, dokilla: bool, dokillb: bool, collided=None) -> dict:
+        """
+        pg.sprite.groupcollideと同じ結果を格子から求める
+        引数1 groupa：格子に登録済みのグループ
+        引数2 groupb：相手のグループ（登録済みでなくてもよい）
+        引数3 dokilla：衝突したgroupaのスプライトをkillするか
+        引数4 dokillb：衝突したgroupbのスプライトをkillするか
+        引数5 collided：矩形が重なった組だけをさらに絞り込む関数（a, b）→ bool（Noneなら矩形だけ）
+        戻り値：{groupaのスプライト: 衝突したgroupbのスプライトのリスト}
+        """
+        hits = {}
+        if groupb in self.cells and len(groupa) <= len(groupb):  # 両方登録済みなら少ない方から問い合わせる
+            for a in groupa.sprites():
+                bs = self.query(a.rect, groupb)
+                if bs:
+                    hits[a] = bs
+        else:
+            for b in groupb.sprites():
+                for a in self.query(b.rect, groupa):
+                    if a in hits:
+                        hits[a].append(b)
+                    else:
+                        hits[a] = [b]
+        crashed = {}
+        for a in sorted(hits, key=self.order.__getitem__):  # groupcollideはgroupaの順に処理する
+            bs = [b for b in hits[a] if b.alive()] if dokillb else hits[a]
+            if collided is not None:
+                bs = [b for b in bs if collided(a, b)]
+            if not bs:
+                continue
+            crashed[a] = bs
+            if dokillb:
+                for b in bs:
+                    b.kill()
+            if dokilla:
+                a.kill()
+        return crashed
 
-        if self.health <= 0:
-            self.health = 0
 
-        # ボス撃破時の処理
-        if self.health <= 0 and not self.defeated:
-            self.defeated = True
-            self.defeat_time = time.time()
-            # 爆発エフェクトを生成
-            explosion = Explosion(self, 100)
-            health_text = self.font.render(f"Boss HP:", True, (255, 0, 0))
-            return explosion
-        
-        # 通常表示
-        if not self.defeated:
-            screen.blit(self.image, self.rect)
 
-        # ゲームクリア表示
-        if self.defeated:
-            clear_font = pg.font.Font(None, 150)
-            clear_text = clear_font.render("GAME CLEAR!", True, (255, 215, 0))
-            clear_rect = clear_text.get_rect(center=(WIDTH//2, HEIGHT//2))
-            screen.blit(clear_text, clear_rect)
-            
-            # 5秒経過後にゲーム終了
-            if time.time() - self.defeat_time >= 5:
-                pg.quit()
-                sys.exit()
+class TargetIndex:
+    """
+    敵の中心座標を格子に登録し，ある地点から最も近い敵を探すクラス
+    invalidateされた後，最初の問い合わせのときだけ作り直す
+    """
+    def __init__(self, *groups: pg.sprite.Group, cell: int = 128):
+        """
+        引数1 groups：探索対象の敵グループ（この順に優先する）
+        引数2 cell：1セルの一辺（ピクセル）
+        """
+        self.groups = groups
+        self.cell = cell
+        self.cells = {}  # (列, 行): [(登録順, スプライト, 中心のx, 中心のy)]
+        self.bounds = None  # 登録されたセルの範囲 (最小列, 最小行, 最大列, 最大行)
+        self.dirty = True
+        self.builds = 0  # 作り直した回数
+        self.queries = 0  # 問い合わせ回数
 
-        
 
-class Appearance:
-    def __init__(self, score):
-        self.score = score  # Score クラスのインスタンス
-        self.boss_appeared = False  # ボスが登場しているかのフラグ
-        self.boss = None  # ボスのインスタンス
-        self.font = pg.font.Font(None, 100)
-        self.boss_time = None
-        self.flash_time = 0
-        self.boss_visible = False
+    def invalidate(self):
+        """
+        敵の位置や数が変わったので次の問い合わせで作り直す
+        """
+        self.dirty = True
 
 
-    def __update__(self, screen, emys, cemys):
-        # ボスの出現条件
-        if self.score.value >= 1000 and not self.boss_appeared:
-            self.boss_appeared = True
-            self.boss = Boss()
-            for emy in emys:
-                emy.kill()  # 他の敵を削除
-            for cemy in cemys:
-                cemy.kill()
-            self.boss_time = time.time()  # 通常の敵をすべて削除
-            self.flash_time = 0  # 点滅時間リセット
-            self.boss_visible = False  # 点滅状態に入る前に初期化
+    def _build(self):
+        self.cells.clear()
+        c = self.cell
+        i = 0
+        for group in self.groups:
+            swarm = getattr(group, "swarm", None)
+            if isinstance(swarm, EnemySwarm):  # 配列から求めるので敵のRectを書き戻さずに済む
+                points = swarm.centers(group)
+            else:
+                points = [(sprite, sprite.rect.centerx, sprite.rect.centery) for sprite in group]
+            for sprite, x, y in points:  # 作り直すのは敵が動いた後なので，次に無効になるまで中心は変わらない
+                key = x//c, y//c
+                if key in self.cells:
+                    self.cells[key].append((i, sprite, x, y))
+                else:
+                    self.cells[key] = [(i, sprite, x, y)]
+                i += 1
+        if self.cells:
+            xs = [ix for ix, _ in self.cells]
+            ys = [iy for _, iy in self.cells]
+            self.bounds = min(xs), min(ys), max(xs), max(ys)
+        else:
+            self.bounds = None
+        self.dirty = False
+        self.builds += 1
 
-        # ボスが登場している場合の更新と表示
-        if self.boss_time and time.time() - self.boss_time < 4:
-            # ボス襲来の文字表示
-            self.flash_time += 1
-            if self.flash_time % 80 < 10:
-                text = self.font.render("WARNING!!", True, (255, 0, 0))
-                screen.blit(text, (320, HEIGHT / 2))
-                if self.flash_time > 4:
-                    self.boss_visible = True
-        elif self.boss and self.boss_visible:
-            # ボスが点滅状態を抜けた後も表示
-            self.boss.__update__(screen)
 
+    def nearest(self, pos: tuple[int, int]) -> pg.sprite.Sprite | None:
+        """
+        posから最も近い生存中の敵を返す（同じ距離なら登録順が先のもの）
+        引数 pos：探索の中心座標
+        戻り値：最も近い敵のSprite（敵がいない場合はNone）
+        """
+        if self.dirty:
+            self._build()
+        self.queries += 1
+        if self.bounds is None:
+            return None
+        c = self.cell
+        px, py = pos
+        cx, cy = px//c, py//c
+        x0, y0, x1, y1 = self.bounds
+        max_r = max(cx-x0, x1-cx, cy-y0, y1-cy)
+        best, best_d, best_i = None, float('inf'), 0
+        for r in range(max_r + 1):
+            if best is not None and best_d < (r-1) * c:  # これより外側のセルにもっと近い敵はいない
+                break
+            for ix in range(cx-r, cx+r+1):
+                step = 1 if abs(ix-cx) == r else 2*r  # 内側は処理済みなので輪の上だけ見る
+                for iy in range(cy-r, cy+r+1, step or 1):
+                    for i, sprite, x, y in self.cells.get((ix, iy), ()):
+                        if not sprite.alive():
+                            continue
+                        d = math.hypot(px - x, py - y)
+                        if d < best_d or (d == best_d and i < best_i):
+                            best, best_d, best_i = sprite, d, i
+        return best
 
-        
-def main():
-    pg.display.set_caption("こうかとんサバイバー")
-    screen = pg.display.set_mode((WIDTH, HEIGHT))
-    bg_img = pg.image.load(f"fig/pg_bg.jpg")
-    score = Score()
-    level_save = 0
-
-    bird = Bird(3, (900, 400))
-    beams = pg.sprite.Group()
-    boss_beams=pg.sprite.Group()
-    exps = pg.sprite.Group()
-    emys = pg.sprite.Group()
-    cemys = pg.sprite.Group()
-    gravities = pg.sprite.Group()
-    items = pg.sprite.Group()
-    gravityitems = pg.sprite.Group()
-    drns = pg.sprite.Group()  # ドリアンのグループ
-    balls = pg.sprite.Group()  # サッカーボールのグループ
-    appearance=Appearance(score)
-    
-
-    tmr = 0
-    beam_timer = 0  # 追加: ビーム発射のタイマー
-    clock = pg.time.Clock()
-    spawn_directions = 4  # 初期の出現方向数
-    enemies_per_spawn = 3  # 初期の出現数
-    last_enemy_increase = 0  # 最後に敵の数を増やした時間
-    xbeam = 1.0  # 初期のビーム倍率
-    beam_span = 0  # ビーム発射のスパン
-    item_count = 0  # アイテム獲得数
-
-    while True:
-        key_lst = pg.key.get_pressed()
-        for event in pg.event.get():
-            if event.type == pg.QUIT:
-                return 0
-            """
-            スキル選択画面
-            敵を倒した数で判断
-            選択画面表示中はすべての時間をSTOPする
-            キーボードでスキルの選択:
-                1 ドリアン
-                2 サッカーボール
-            """
-            if bird.wait_skill:  # birdで定義、スキル画面のこと
-                if event.type == pg.KEYDOWN:  # キーが押されたら
-                    if event.key == pg.K_1:  # 1を押したら
-                        drns.add(Durian(bird))  # スキルのリストに、クラス(Durian)を追加
-                        bird.wait_skill = False  # この画面を消す
-                    if event.key == pg.K_2:  #2を押したら
-                        balls.add(Soccerball(bird))  # スキルリストに、クラス(Soccerball)を追加
-                        bird.wait_skill = False  # この画面を消す
-
-        # 定期的に自動発射
-        beam_timer += 1
-        if beam_span >= 29:
-            beam_span = 29
-        if beam_timer % (30 - beam_span) == 0:  # 30フレームごとにビームを自動発射
-            beams.add(Beam(bird, xbeam ,emys ,cemys, appearance.boss_appeared))  # emysグループを渡す
-            beam_timer = 0  # タイマーをリセット
-
-        screen.blit(bg_img, [0, 0])
-
-        # 5秒ごとに敵の出現数と方向を増やす
-        current_time = tmr // 50  # フレーム数を秒数に変換
-        if current_time - last_enemy_increase >= 5 and not appearance.boss_appeared:
-            enemies_per_spawn += 100  # 出現数を2増やす
-            spawn_directions += 2   # 方向を2増やす
-            last_enemy_increase = current_time
-
-        if tmr%20 == 0 and not appearance.boss_appeared: # 20フレームに1回，敵機を出現させる
-            emys.add(Enemy(bird, spawn_directions))
-
-        if tmr%100 == 0 and not appearance.boss_appeared:
-            cemys.add(ClownEnemy(bird, spawn_directions))
 
-        if tmr != 0:
-            if tmr%100 == 0:  # 100フレームに1回、強化アイテムを出現させる
-                items.add(Item())
+    def nearest_many(self, points: list[tuple[int, int]]) -> list[pg.sprite.Sprite | None]:
+        """
+        複数地点の最も近い敵をまとめて探す
+        引数 points：探索の中心座標のリスト
+        戻り値：各地点に最も近い敵のリスト
+        """
+        return [self.nearest(pos) for pos in points]
 
-        if tmr != 0:
-            if tmr%1000 == 0:  # 1000フレームに1回、重力場発動アイテムを出現させる
-                gravityitems.add(GravityItem())
 
-        if tmr%100 == 0 and appearance.boss_appeared:
-            boss_neo_beam = NeoBeam(appearance.boss, 3)  # ボスが3本のビームを発射
-            boss_beams.add(boss_neo_beam.gen_beams())
-            if appearance.boss.health == 0:
-                for boss_beam in boss_beams:
-                    boss_beam.kill()
+    def retarget(self, beams: pg.sprite.Group):
+        """
+        狙っていた敵が倒されたビームに，ビームから最も近い敵を狙い直させる
+        引数 beams：ビームのグループ
+        """
+        lost = [beam for beam in beams if not beam.appearance and beam.target is not None and not beam.target_alive()]
+        if not lost:
+            return
+        for beam, target in zip(lost, self.nearest_many([beam.rect.center for beam in lost])):
+            beam.aim(target)
+
 
-        # 通常の敵との衝突判定
-        if pg.sprite.spritecollideany(bird, emys):
-            bird.change_img(8, screen)  # こうかとん悲しみエフェクト
-            score.update(screen)
-            pg.display.update()
-            time.sleep(2)
+
+class EnemySwarm:
+    """
+    全ての敵の位置・速度・ジグザグ位相・種類をNumPy配列で持ち，1回の計算でまとめて動かすクラス
+    Enemy.update，ClownEnemy.updateと同じ動きをする
+    位置は配列が正で，スプライトのRectへは読まれたときだけ書き戻す（SwarmSprite.rect）
+    衝突判定の格子・最近傍探索・間引き・描画は配列から直接求めるので，画面外の多数の敵のRectは書き戻さない
+    """
+    CHASE = 0  # Enemy：こうかとんへ直進する
+    ZIGZAG = 1  # ClownEnemy：ジグザグに近づく
+    columns = ("x", "y", "w", "h", "hw", "hh", "vx", "vy", "speed", "phase", "kind", "px", "py", "captured")
+
+    def __init__(self, capacity: int = 256):
+        """
+        引数 capacity：最初に確保する配列の長さ（足りなくなったら倍にする）
+        """
+        self.sprites = []  # 配列の各行に対応するスプライト
+        self.slots = {}  # スプライト: 行番号
+        self.x = np.zeros(capacity)  # Rectの左端
+        self.y = np.zeros(capacity)  # Rectの上端
+        self.w = np.zeros(capacity)  # Rectの幅
+        self.h = np.zeros(capacity)  # Rectの高さ
+        self.hw = np.zeros(capacity)  # Rectの幅の半分（切り捨て）
+        self.hh = np.zeros(capacity)  # Rectの高さの半分（切り捨て）
+        self.vx = np.zeros(capacity)
+        self.vy = np.zeros(capacity)
+        self.speed = np.zeros(capacity)
+        self.phase = np.zeros(capacity)  # ジグザグの位相
+        self.kind = np.zeros(capacity, dtype=np.int8)
+        self.px = np.zeros(capacity)  # captureしたときの左端（描画の補間用）
+        self.py = np.zeros(capacity)  # captureしたときの上端
+        self.captured = np.zeros(capacity, dtype=bool)  # captureの後に登録された行はFalse（補間しない）
+        self.epoch = 1  # stepのたびに増やす（スプライトがRectに書き戻したときの値と比べる）
+        self.positions = None  # このepochの整数の(左端のリスト, 上端のリスト)（最初に書き戻すときに作る）
+
+
+    def __len__(self) -> int:
+        return len(self.sprites)
+
+
+    def _grow(self):
+        for name in __class__.columns:
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+    def add(self, sprite: "SwarmSprite"):
+        """
+        敵を配列の末尾に登録する
+        引数 sprite：EnemyかClownEnemy
+        """
+        if sprite in self.slots:
             return
+        i = len(self.sprites)
+        if i == len(self.x):
+            self._grow()
+        rect = sprite.rect
+        self.sprites.append(sprite)
+        self.slots[sprite] = i
+        self.x[i], self.y[i] = self.px[i], self.py[i] = rect.x, rect.y
+        self.w[i], self.h[i] = rect.width, rect.height
+        self.hw[i], self.hh[i] = rect.width//2, rect.height//2
+        self.speed[i] = sprite.speed
+        self.captured[i] = False
+        if isinstance(sprite, ClownEnemy):
+            self.kind[i] = __class__.ZIGZAG
+            self.vx[i], self.vy[i] = sprite.vx, sprite.vy
+            self.phase[i] = sprite.movement_phase
+        else:
+            self.kind[i] = __class__.CHASE
+            self.vx[i] = self.vy[i] = self.phase[i] = 0
+        if self.positions is not None:
+            self.positions[0].append(rect.x)
+            self.positions[1].append(rect.y)
+        sprite.swarm, sprite.synced = self, self.epoch
 
-        # ピエロとの衝突判定
-        if pg.sprite.spritecollideany(bird, cemys):
-            bird.change_img(8, screen)  # こうかとん悲しみエフェクト
-            score.update(screen)
-            pg.display.update()
-            time.sleep(2)
+
+    def remove(self, sprite: "SwarmSprite"):
+        """
+        敵の登録を外す（最後の行を空いた行に移す）
+        引数 sprite：登録済みの敵
+        """
+        if sprite not in self.slots:
             return
+        sprite.rect  # 倒された位置に爆発を出せるように書き戻しておく
+        i = self.slots.pop(sprite)
+        sprite.swarm = None
+        last = len(self.sprites) - 1
+        moved = self.sprites.pop()
+        if i != last:
+            self.sprites[i] = moved
+            self.slots[moved] = i
+            for name in __class__.columns:
+                arr = getattr(self, name)
+                arr[i] = arr[last]
+        if self.positions is not None:
+            for values in self.positions:
+                values[i] = values[last]
+                values.pop()
 
-        for emy in pg.sprite.groupcollide(emys, beams, True, True).keys():
-            exps.add(Explosion(emy, 100))  # 爆発エフェクト
-            score.value += 10  # 10点アップ
-            bird.change_img(6, screen)  # こうかとん喜びエフェクト
 
-            if int(score.value / 150) > level_save:  # 150点ごとにスキルの選択
-                bird.wait_skill = True
-                level_save = int(score.value / 150)
+    def step(self, target: pg.Rect):
+        """
+        全ての敵をtargetに向けて1フレーム分動かす
+        引数 target：追いかける相手（こうかとん）のRect
+        """
+        self.epoch += 1  # これまでに書き戻したRectは古くなる
+        self.positions = None
+        n = len(self.sprites)
+        if n == 0:
+            return
+        x, y = self.x[:n], self.y[:n]
+        dx = target.centerx - (x + self.hw[:n])
+        dy = target.centery - (y + self.hh[:n])
+        dist = np.sqrt(dx**2 + dy**2)
+        moving = dist != 0
+        safe = np.where(moving, dist, 1.0)
+        speed = self.speed[:n]
+        zigzag = self.kind[:n] == __class__.ZIGZAG
 
-        if bird.wait_skill:
-            """
-            スキル選択画面
-            """
-            screen.fill((0, 0, 0))  # 黒画面
-            font = pg.font.Font(None, 50)  # fontの大きさ
-            text = font.render("Select Skill - 1:Durian 2:Soccerball", True, (255, 255, 255))  # 書く文字と白色
-            screen.blit(text, ((WIDTH//4) - 20, HEIGHT//2))  # 描写位置
-            pg.display.update()
-            continue  # これがないと下のアップデートが実行されてしまうため必須
+        # Enemy：move_ipは移動量を0方向へ切り捨てる
+        chase = ~zigzag
+        mx = np.where(moving, speed * (dx / safe), 0.0)
+        my = np.where(moving, speed * (dy / safe), 0.0)
+        x[chase] += np.trunc(mx[chase])
+        y[chase] += np.trunc(my[chase])
 
-        for emy in pg.sprite.groupcollide(emys, drns, True, False).keys():
-            exps.add(Explosion(emy, 100))
-            score.value += 5
+        # ClownEnemy：距離が0のときは前の速度を使い，Rectへの代入は四捨五入（0から遠い方へ）
+        if zigzag.any():
+            vx, vy = self.vx[:n], self.vy[:n]
+            turn = zigzag & moving
+            vx[turn] = (dx[turn] / dist[turn]) * speed[turn]
+            vy[turn] = (dy[turn] / dist[turn]) * speed[turn]
+            phase = self.phase[:n]
+            phase[zigzag] += 0.1
+            wave = np.sin(phase[zigzag]) * 2
+            zvx, zvy = vx[zigzag], vy[zigzag]
+            nx = x[zigzag] + (zvx + -zvy * wave)
+            ny = y[zigzag] + (zvy + zvx * wave)
+            x[zigzag] = np.copysign(np.floor(np.abs(nx) + 0.5), nx)
+            y[zigzag] = np.copysign(np.floor(np.abs(ny) + 0.5), ny)
 
-        for emy in pg.sprite.groupcollide(cemys, drns, True, False).keys():
-            exps.add(Explosion(cemy, 100))
-            score.value += 5
 
-        balls.update(emys)  # 反射のみ
-        balls.update(cemys)  # 反射のみ
-        
+    def write(self, sprite: "SwarmSprite"):
+        """
+        配列の位置を1体のRectに書き戻す（SwarmSprite.rectが読まれたときに呼ばれる）
+        引数 sprite：登録済みの敵
+        """
+        if self.positions is None:  # このepochで最初の書き戻しのときだけ配列をリストにする
+            n = len(self.sprites)
+            self.positions = self.x[:n].astype(np.int64).tolist(), self.y[:n].astype(np.int64).tolist()
+        i = self.slots[sprite]
+        sprite._rect.topleft = self.positions[0][i], self.positions[1][i]
+        sprite.synced = self.epoch
 
-        for emy in pg.sprite.groupcollide(emys, balls, True, False).keys():
-            exps.add(Explosion(emy, 100))
-            score.value += 5
 
-        for emy in pg.sprite.groupcollide(cemys, balls, True, False).keys():
-            exps.add(Explosion(cemy, 100))
-            score.value += 5
+    def rows(self, group: pg.sprite.AbstractGroup) -> tuple[list, "np.ndarray"]:
+        """
+        戻り値：(グループのスプライトのリスト（グループの順）, それぞれの行番号の配列)
+        """
+        sprites = group.sprites()
+        return sprites, np.fromiter(map(self.slots.__getitem__, sprites), np.intp, len(sprites))
 
-        for cemy in pg.sprite.groupcollide(cemys, beams, True, True).keys():
-            exps.add(Explosion(cemy, 100))  # 爆発エフェクト
-            score.value += 10  # 10点アップ
-            bird.change_img(6, screen)  # こうかとん喜びエフェクト
-            if int(score.value / 150) > level_save:  # 150点ごとにスキルの選択
-                bird.wait_skill = True
-                level_save = int(score.value / 150)
 
-        for emy in pg.sprite.groupcollide(emys, gravities, True, False).keys():
-            exps.add(Explosion(emy, 100))  # 爆発エフェクト
-            score.value += 10  # 10点アップ
+    def overlaps(self, rows: "np.ndarray", area: pg.Rect) -> "np.ndarray":
+        """
+        行のRectがareaと重なるか（pg.Rect.colliderectと同じ判定）
+        戻り値：真理値の配列
+        """
+        x, y = self.x[rows], self.y[rows]
+        return (x < area.right) & (area.left < x + self.w[rows]) & (y < area.bottom) & (area.top < y + self.h[rows])
 
-        for cemy in pg.sprite.groupcollide(cemys, gravities, True, False).keys():
-            exps.add(Explosion(cemy, 100))  # 爆発エフェクト
-            score.value += 10  # 10点アップ
 
-        for item in pg.sprite.spritecollide(bird, items, True):  # こうかとんと強化アイテムがぶつかったら
-            xbeam += 0.2  # ビームの倍率をあげる
-            score.value += 10  # 10点アップ
-            if bird.speed <= 20:  # こうかとんのスピードの最大値を設定
-                bird.speed *= 1.1 
-            item_count += 1
-            if item_count % 2 == 0:  # 2回に一回、アイテムを獲得するとビームのスパンをあげる
-                beam_span += 1
-            item.kill()  # 強化アイテムを削除する
+    def spans(self, group: pg.sprite.AbstractGroup, cell: int, area: pg.Rect | None = None) -> list[tuple]:
+        """
+        格子に登録するセルの範囲を配列から求める（SpatialHash.build用）
+        引数1 group：敵のグループ
+        引数2 cell：1セルの一辺
+        引数3 area：これと重なる敵だけを返す（Noneなら全て）
+        戻り値：(スプライト, 最小列, 最大列, 最小行, 最大行)のリスト（グループの順）
+        """
+        sprites, rows = self.rows(group)
+        if not sprites:
+            return []
+        x, y = self.x[rows], self.y[rows]
+        spans = zip(sprites, (x // cell).astype(np.int64).tolist(), ((x + self.w[rows] - 1) // cell).astype(np.int64).tolist(),
+                    (y // cell).astype(np.int64).tolist(), ((y + self.h[rows] - 1) // cell).astype(np.int64).tolist())
+        if area is None:
+            return list(spans)
+        return list(itertools.compress(spans, self.overlaps(rows, area).tolist()))
 
-        for gitem in pg.sprite.spritecollide(bird, gravityitems, True):  # こうかとんと重力場発動アイテムがぶつかったら
-            gravities.add(Gravity(80))
-            if appearance.boss_appeared:  # もしボスが現れている場合
-                appearance.boss.health -= 20  # 20ダメージを与える
-            gitem.kill()  # 重力場発動アイテムを削除する
-        
-        if len(pg.sprite.spritecollide(bird, boss_beams, True)) != 0:
-            bird.change_img(8, screen) # こうかとん悲しみエフェクト
-            score.update(screen)
-            pg.display.update()
-            time.sleep(2)
-            return
-        
-        if appearance.boss and appearance.boss_visible:
-            for beam in beams:
-                if appearance.boss.rect.colliderect(beam.rect):
-                    appearance.boss.health -= 1  # ビームが当たるたびに体力を1減らす
-                    beam.kill()  # ビームを消す
-            for drn in drns:
-                if appearance.boss.rect.colliderect(drn.rect):
-                    if not drn.has_damaged_boss:  # まだダメージを与えていない場合
-                        appearance.boss.health -= 1  
-                        drn.has_damaged_boss = True 
-                else:
-                    drn.has_damaged_boss = False # Bossと接触していない間はフラグをFalseに戻す
-            for ball in balls:
-                if appearance.boss.rect.colliderect(ball.rect):
-                    # ボールのx方向の中心とBossのx方向の中心の差の絶対値
-                    dx = abs(ball.rect.centerx - appearance.boss.rect.centerx)  
-                    # ボールのy方向の中心とBossのy方向の中心の差の絶対値
-                    dy = abs(ball.rect.centery - appearance.boss.rect.centery)  
-
-                    if dx > dy:  # 左右の衝突 (x方向の差が大きい)
-                        ball.vx *= -1  # x方向の速度を反転
-                    else:  # 上下の衝突 (y方向の差が大きい)
-                        ball.vy *= -1  # y方向の速度を反転
-
-                    if ball.rect.centerx > appearance.boss.rect.left and ball.rect.centerx < appearance.boss.rect.right and ball.rect.centery > appearance.boss.rect.top and ball.rect.centery < appearance.boss.rect.bottom:
-                        ball.rect.right = appearance.boss.rect.left - 50  #  ボールがボスにめり込んだ場合外に出す
-                    appearance.boss.health -= 1  # ボールが当たるたびに体力を1減らす
-                    
-                    
-            # ボス撃破時の爆発エフェクト生成
-            explosion = appearance.boss.__update__(screen)
-            if explosion:
-                exps.add(explosion)
-        
 
-        
+    def centers(self, group: pg.sprite.AbstractGroup) -> list[tuple]:
+        """
+        戻り値：(スプライト, Rectの中心のx, y)のリスト（グループの順，TargetIndex用）
+        """
+        sprites, rows = self.rows(group)
+        cx = (self.x[rows] + self.hw[rows]).astype(np.int64).tolist()
+        cy = (self.y[rows] + self.hh[rows]).astype(np.int64).tolist()
+        return list(zip(sprites, cx, cy))
+
+
+    def outside(self, group: pg.sprite.AbstractGroup, bounds: pg.Rect) -> list:
+        """
+        戻り値：boundsと重ならない敵のリスト（グループの順，Lifecycleの間引き用）
+        """
+        sprites, rows = self.rows(group)
+        if not sprites:
+            return []
+        return list(itertools.compress(sprites, (~self.overlaps(rows, bounds)).tolist()))
+
+
+    def capture(self):
+        """
+        描画の補間用にステップ前の位置を記録する
+        """
+        n = len(self.sprites)
+        self.px[:n], self.py[:n] = self.x[:n], self.y[:n]
+        self.captured[:n] = True
+
+
+    def draw(self, group: pg.sprite.AbstractGroup, screen: pg.Surface, alpha: float, cull: bool = False):
+        """
+        グループの敵を配列の位置から補間してblits1回で描く（Interpolation.drawと同じ位置）
+        引数1 group：敵のグループ
+        引数2 screen：描画先
+        引数3 alpha：前のステップから次のステップまでの割合（0～1）
+        引数4 cull：Trueなら画面の外にいる敵は描かない
+        """
+        sprites, rows = self.rows(group)
+        if cull and sprites:
+            keep = self.overlaps(rows, Interpolation.visible)
+            sprites, rows = list(itertools.compress(sprites, keep.tolist())), rows[keep]
+        if not sprites:
+            return
+        x, y = self.x[rows], self.y[rows]
+        if alpha < 1:
+            px, py, captured = self.px[rows], self.py[rows], self.captured[rows]
+            x = np.where(captured, px + (x - px) * alpha, x)
+            y = np.where(captured, py + (y - py) * alpha, y)
+            positions = zip(x.tolist(), y.tolist())
+        else:
+            positions = zip(x.astype(np.int64).tolist(), y.astype(np.int64).tolist())
+        screen.blits([(sprite.image, pos) for sprite, pos in zip(sprites, positions)], False)
+
+
+
+class SwarmGroup(pg.sprite.Group):
+    """
+    追加・削除（kill）されたスプライトをEnemySwarmやProjectilesにも登録・解除するグループ
+    """
+    def __init__(self, swarm: "EnemySwarm | Projectiles", *sprites):
+        """
+        引数1 swarm：スプライトをまとめて動かすEnemySwarmかProjectiles
+        引数2 sprites：最初に追加するスプライト
+        """
+        self.swarm = swarm
+        super().__init__(*sprites)
+
+
+    def add_internal(self, sprite, layer=None):
+        super().add_internal(sprite, layer)
+        self.swarm.add(sprite)
+
+
+    def remove_internal(self, sprite):
+        self.swarm.remove(sprite)
+        super().remove_internal(sprite)
+
+
+    def copy(self):
+        return pg.sprite.Group(self.sprites())
+
+
+
+class SwarmSprite:
+    """
+    EnemySwarmで動かす敵の共通部分
+    rectは読まれたときに，前に書き戻してから配列が動いていれば配列の位置を書き戻して返す
+    """
+    swarm = None  # 登録中のEnemySwarm（登録していなければNone）
+    synced = 0  # 最後にRectへ書き戻したときのEnemySwarm.epoch
+
+    @property
+    def rect(self) -> pg.Rect:
+        swarm = self.swarm
+        if swarm is not None and self.synced != swarm.epoch:
+            swarm.write(self)
+        return self._rect
+
+
+    @rect.setter
+    def rect(self, rect: pg.Rect):
+        self._rect = rect
+
+
+
+
+class Projectiles:
+    """
+    スキルの飛び道具（ドリアン・サッカーボール）の位置・速度を配列で持ち，全部をまとめて1ステップ進めるクラス
+    移動は掃引したAABBで判定するので，速くても壁・敵・ボスを通り抜けない（1ステップに何回でも反射する）
+    ドリアンは敵とボスを貫通し，サッカーボールは敵とボスで反射する（反射した敵は倒れる）
+    位置は配列が正で，スプライトのRectへはsyncしたときだけ書き戻す
+    """
+    PIERCE = 0  # Durian：敵を貫通する
+    BOUNCE = 1  # Soccerball：敵とボスで反射する
+    max_events = 8  # 1ステップで処理する反射の回数の上限
+
+    def __init__(self):
+        self.sprites = []  # 配列の各要素に対応するスプライト
+        self.slots = {}  # スプライト: 番号
+        self.x = []  # Rectの左端（小数）
+        self.y = []  # Rectの上端（小数）
+        self.w = []
+        self.h = []
+        self.vx = []  # 向き（+1か-1）
+        self.vy = []
+        self.speed = []  # 1ステップの各軸の移動量
+        self.kind = []
+        self.touching = []  # 前のステップでボスに触れていたか（ドリアンが1回の接触で1ダメージ）
+
+
+    def __len__(self) -> int:
+        return len(self.sprites)
+
+
+    def add(self, sprite: pg.sprite.Sprite):
+        """
+        飛び道具を配列の末尾に登録する
+        引数 sprite：DurianかSoccerball
+        """
+        if sprite in self.slots:
+            return
+        self.slots[sprite] = len(self.sprites)
+        self.sprites.append(sprite)
+        rect = sprite.rect
+        self.x.append(float(rect.x))
+        self.y.append(float(rect.y))
+        self.w.append(rect.width)
+        self.h.append(rect.height)
+        self.vx.append(sprite.vx)
+        self.vy.append(sprite.vy)
+        self.speed.append(sprite.speed)
+        self.kind.append(__class__.BOUNCE if isinstance(sprite, Soccerball) else __class__.PIERCE)
+        self.touching.append(False)
+
+
+    def remove(self, sprite: pg.sprite.Sprite):
+        """
+        飛び道具の登録を外す（最後の要素を空いた場所に移す）
+        引数 sprite：登録済みの飛び道具
+        """
+        i = self.slots.pop(sprite, None)
+        if i is None:
+            return
+        moved = self.sprites.pop()
+        arrays = (self.x, self.y, self.w, self.h, self.vx, self.vy, self.speed, self.kind, self.touching)
+        if moved is sprite:
+            for arr in arrays:
+                arr.pop()
+            return
+        self.sprites[i] = moved
+        self.slots[moved] = i
+        for arr in arrays:
+            arr[i] = arr.pop()
+
+
+    @staticmethod
+    def _wall(p: float, size: int, d: float, limit: int) -> float:
+        """
+        1軸の移動で壁に届くまでの割合
+        引数1 p：左端（上端）
+        引数2 size：幅（高さ）
+        引数3 d：このステップの残りの移動量
+        引数4 limit：画面の幅（高さ）
+        戻り値：0〜1の割合（届かなければ1より大きい値）
+        """
+        if d > 0:
+            return max(0.0, (limit - size - p) / d)
+        if d < 0:
+            return max(0.0, p / -d)
+        return 2.0
+
+
+    @staticmethod
+    def _travel(p: float, v: int, d: float, size: int, limit: int) -> tuple[float, int]:
+        """
+        壁だけで反射しながら1軸をdだけ進める（近くに敵もボスもいないとき用）
+        引数1 p：左端（上端）
+        引数2 v：向き（+1か-1）
+        引数3 d：移動量
+        引数4 size：幅（高さ）
+        引数5 limit：画面の幅（高さ）
+        戻り値：(進んだ後の左端（上端）, 向き)
+        """
+        for _ in range(__class__.max_events):
+            gap = limit - size - p if v > 0 else p  # 進む向きの壁までの距離
+            if gap >= d:
+                return p + v * d, v
+            if gap > 0:
+                p += v * gap
+                d -= gap
+            v = -v
+        return p, v
+
+
+    @staticmethod
+    def _sweep(x: float, y: float, dx: float, dy: float, box: tuple) -> tuple | None:
+        """
+        左上が(x, y)の矩形を(dx, dy)だけ動かしたときに相手と重なり始める割合（スラブ法）
+        引数5 box：左上がこの開区間にあれば相手と重なる範囲(左, 右, 上, 下)
+        戻り値：(重なり始め, 横の面から入ったか, 縦の面から入ったか)（このステップで重ならなければNone）
+        """
+        lox, hix, loy, hiy = box
+        if dx > 0:
+            txmin, txmax = (lox - x) / dx, (hix - x) / dx
+        elif dx < 0:
+            txmin, txmax = (hix - x) / dx, (lox - x) / dx
+        elif lox < x < hix:
+            txmin, txmax = -math.inf, math.inf
+        else:
+            return None
+        if dy > 0:
+            tymin, tymax = (loy - y) / dy, (hiy - y) / dy
+        elif dy < 0:
+            tymin, tymax = (hiy - y) / dy, (loy - y) / dy
+        elif loy < y < hiy:
+            tymin, tymax = -math.inf, math.inf
+        else:
+            return None
+        entry = txmin if txmin > tymin else tymin
+        leave = txmax if txmax < tymax else tymax
+        if entry >= leave or entry >= 1 or leave <= 0:
+            return None
+        return entry, txmin >= tymin, tymin >= txmin
+
+
+    def _area(self, i: int) -> pg.Rect:
+        """
+        i番目の飛び道具がこのステップで通りうる範囲
+        """
+        speed = self.speed[i]
+        return pg.Rect(int(self.x[i]) - speed - 1, int(self.y[i]) - speed - 1, self.w[i] + 2*speed + 2, self.h[i] + 2*speed + 2)
+
+
+    def areas(self) -> list[pg.Rect]:
+        """
+        戻り値：全ての飛び道具がこのステップで通りうる範囲のリスト
+        """
+        return [self._area(i) for i in range(len(self.sprites))]
+
+
+    def step(self, grid: SpatialHash, groups: tuple, boss: pg.Rect | None) -> tuple[list, int]:
+        """
+        全ての飛び道具を1ステップ分動かし，通り道で当たった敵とボスへのダメージを求める
+        引数1 grid：敵を登録済みの格子
+        引数2 groups：当たる敵のグループのタプル（格子に登録済みのもの）
+        引数3 boss：ボスのRect（出ていなければNone）
+        戻り値：(当たった敵のリスト（当たった順，killはしない）, ボスへのダメージ)
+        """
+        hits = {}  # 当たった敵: None（順序つきの集合として使う）
+        damage = 0
+        sweep, wall, travel = __class__._sweep, __class__._wall, __class__._travel
+        for i in range(len(self.sprites)):
+            x, y, w, h = self.x[i], self.y[i], self.w[i], self.h[i]
+            vx, vy, speed = self.vx[i], self.vy[i], self.speed[i]
+            bounce = self.kind[i] == __class__.BOUNCE
+            area = self._area(i)
+            obstacles = [  # (左上が重なる範囲, 相手のRect, スプライト)
+                ((r.left - w, r.right, r.top - h, r.bottom), r, sprite)
+                for group in groups for sprite in grid.query(area, group) for r in (sprite.rect,)
+            ]
+            if boss is not None and boss.colliderect(area):
+                obstacles.append(((boss.left - w, boss.right, boss.top - h, boss.bottom), boss, None))  # Noneがボス
+            if not obstacles:  # 壁だけなら軸ごとに進められる
+                self.x[i], self.vx[i] = travel(x, vx, speed, w, WIDTH)
+                self.y[i], self.vy[i] = travel(y, vy, speed, h, HEIGHT)
+                self.touching[i] = False
+                continue
+            touched = False  # このステップでボスに触れたか
+            left = 1.0  # このステップの残りの割合
+            for _ in range(__class__.max_events):
+                dx, dy = vx * speed * left, vy * speed * left
+                tx, ty = wall(x, w, dx, WIDTH), wall(y, h, dy, HEIGHT)
+                t = min(tx, ty, 1.0)
+                x0, x1 = (x, x + dx*t) if dx >= 0 else (x + dx*t, x)  # 壁までの通り道の範囲（左上）
+                y0, y1 = (y, y + dy*t) if dy >= 0 else (y + dy*t, y)
+                first, axes = [], (False, False)  # 反射する相手と面
+                for obstacle in obstacles:
+                    box = obstacle[0]
+                    if x1 <= box[0] or x0 >= box[1] or y1 <= box[2] or y0 >= box[3]:
+                        continue  # 通り道の範囲にかからない
+                    found = sweep(x, y, dx, dy, box)
+                    if found is None or found[0] > t:
+                        continue
+                    if obstacle[2] is None:
+                        touched = True
+                    elif not bounce:
+                        hits[obstacle[2]] = None  # 貫通しながら倒す
+                    if not bounce:
+                        continue
+                    entry = max(found[0], 0.0)
+                    if entry < t:
+                        t, first = entry, []
+                    first.append(obstacle)
+                    if found[0] < 0:  # 最初から重なっていたら浅い方の軸で押し返す
+                        rect = obstacle[1]
+                        px = min(x + w - rect.left, rect.right - x)
+                        py = min(y + h - rect.top, rect.bottom - y)
+                        axes = (px <= py, py <= px)
+                    else:
+                        axes = found[1:]
+                x += dx * t
+                y += dy * t
+                left *= 1.0 - t
+                if tx <= t:
+                    vx = -vx
+                if ty <= t:
+                    vy = -vy
+                for obstacle in first:
+                    obstacles.remove(obstacle)  # このステップでは同じ相手に2回当たらない
+                    _, rect, sprite = obstacle
+                    if sprite is None:
+                        damage += 1
+                    else:
+                        hits[sprite] = None
+                    if axes[0]:
+                        vx = 1 if x + w/2 >= rect.centerx else -1  # 相手から離れる向きにする
+                    if axes[1]:
+                        vy = 1 if y + h/2 >= rect.centery else -1
+                if left <= 1e-9:
+                    break
+            if not bounce:
+                if touched and not self.touching[i]:  # 触れ始めたときだけダメージ
+                    damage += 1
+                self.touching[i] = touched
+            self.x[i], self.y[i], self.vx[i], self.vy[i] = x, y, vx, vy
+        return list(hits), damage
+
+
+    def sync(self):
+        """
+        配列の位置と向きを各スプライトに書き戻す（描画・衝突判定の前に呼ぶ）
+        """
+        for sprite, x, y, vx, vy in zip(self.sprites, self.x, self.y, self.vx, self.vy):
+            sprite.rect.topleft = round(x), round(y)
+            sprite.vx, sprite.vy = vx, vy
+
+
+
+class Pool:
+    """
+    同じクラスのスプライトを使い回すオブジェクトプール
+    acquireで取り出し（空なら新しく作る），killされたスプライトはreleaseで戻ってくる
+    """
+    def __init__(self, cls: type):
+        """
+        引数 cls：Pooledを継承したスプライトのクラス（resetで初期化し直せること）
+        """
+        self.cls = cls
+        self.free = []  # 使われていないスプライト
+        self.live = 0  # 使用中の数
+        self.high = 0  # 使用中の数の最大値
+        self.acquires = 0  # 取り出した回数
+        self.misses = 0  # 空で新しく作った回数
+
+
+    def acquire(self, *args) -> "Pooled":
+        """
+        スプライトを取り出して引数で初期化する
+        引数 args：clsのコンストラクタと同じ引数
+        戻り値：初期化済みのスプライト
+        """
+        self.acquires += 1
+        if self.free:
+            obj = self.free.pop()
+            obj.reset(*args)
+        else:
+            self.misses += 1
+            obj = self.cls(*args)
+        self.adopt(obj)
+        return obj
+
+
+    def adopt(self, obj: "Pooled"):
+        """
+        スプライトを使用中として登録する（スナップショットから作り直したものもkillされたらこのプールに戻る）
+        引数 obj：Pooledを継承したスプライト
+        """
+        obj.pool = self
+        obj.generation += 1
+        self.live += 1
+        if self.live > self.high:
+            self.high = self.live
+
+
+    def release(self, obj: "Pooled"):
+        """
+        スプライトをグループから外してプールに戻す
+        引数 obj：acquireで取り出したスプライト
+        """
+        if obj.alive():
+            pg.sprite.Sprite.kill(obj)
+        obj.pool = None
+        self.free.append(obj)
+        self.live -= 1
+
+
+    def stats(self) -> dict:
+        """
+        使用状況を返す
+        戻り値：使用中の数，最大値，空き数，取り出し回数，新規作成回数の辞書
+        """
+        return {
+            "live": self.live,
+            "high": self.high,
+            "free": len(self.free),
+            "acquires": self.acquires,
+            "misses": self.misses,
+        }
+
+
+
+class Pooled:
+    """
+    Poolで使い回すスプライトの共通部分
+    killされたら取り出し元のPoolに戻る
+    """
+    def __init__(self, *args):
+        self.pool = None  # 取り出し元のPool（直接作ったときはNone）
+        self.generation = 0  # 使い回された回数（古い参照を見分けるため）
+        super().__init__()
+        self.reset(*args)
+
+
+    def reset(self, *args):
+        """
+        コンストラクタの引数で状態を初期化し直す（サブクラスで上書きする．既定では何もしない）
+        """
+
+
+    def kill(self):
+        was_alive = self.alive()
+        super().kill()
+        if was_alive and self.pool is not None:
+            self.pool.release(self)
+
+
+
+class Policy:
+    """
+    スプライトグループの寿命と上限の決まり
+    """
+    def __init__(self, margin: int | None = None, max_age: int | None = None, max_count: int | None = None):
+        """
+        引数1 margin：画面からこれ以上離れたら消す距離（Noneなら消さない）
+        引数2 max_age：グループに入ってからこのステップ数を過ぎたら消す（Noneなら消さない）
+        引数3 max_count：これを超えたら古い順に消す数（Noneなら上限なし）
+        """
+        self.margin = margin
+        self.max_age = max_age
+        self.max_count = max_count
+        if margin is not None:
+            self.bounds = pg.Rect(-margin, -margin, WIDTH+2*margin, HEIGHT+2*margin)  # この範囲に触れていれば残す
+
+
+
+class Lifecycle:
+    """
+    スプライトグループをPolicyに従って間引き，長時間遊んでもスプライト数が増え続けないようにするクラス
+    """
+    def __init__(self):
+        self.watched = {}  # 名前: (グループ, Policy)
+        self.born = {}  # 名前: {スプライト: (使い回し回数, 入ったステップ)}
+        self.culled = {}  # 名前: {理由: 消した数}
+        self.peaks = {}  # 名前: 間引く前のスプライト数の最大値
+        self.tick = 0  # sweepを呼んだ回数
+
+
+    def watch(self, name: str, group: "pg.sprite.Group | BossBullets", policy: Policy):
+        """
+        グループを間引きの対象にする
+        引数1 name：グループの名前
+        引数2 group：対象のグループ（スプライトを持たないBossBulletsも可）
+        引数3 policy：間引きの決まり
+        """
+        self.watched[name] = group, policy
+        self.born[name] = {}
+        self.culled[name] = {"margin": 0, "age": 0, "count": 0}
+        self.peaks[name] = len(group)
+
+
+    def sweep(self):
+        """
+        画面から離れすぎた・古すぎる・多すぎるスプライトを消す（1ステップに1回呼ぶ）
+        消すときはスコアも爆発も出さずにkillするだけ
+        """
+        self.tick += 1
+        for name, (group, policy) in self.watched.items():
+            culled = self.culled[name]
+            if len(group) > self.peaks[name]:
+                self.peaks[name] = len(group)
+            if isinstance(group, BossBullets):  # 配列で持つものは自分で間引く
+                group.cull(policy, culled)
+                continue
+            if policy.margin is not None and group:
+                swarm = getattr(group, "swarm", None)
+                if isinstance(swarm, EnemySwarm):  # 配列で判定するので敵のRectを書き戻さずに済む
+                    outside = swarm.outside(group, policy.bounds)
+                else:
+                    sprites = group.sprites()
+                    inside = policy.bounds.collidelistall(sprites)
+                    outside = []
+                    if len(inside) != len(sprites):
+                        inside = set(inside)
+                        outside = [sprite for i, sprite in enumerate(sprites) if i not in inside]
+                for sprite in outside:
+                    sprite.kill()
+                    culled["margin"] += 1
+            if policy.max_age is not None:
+                self._expire(name, group, policy.max_age)
+            if policy.max_count is not None and len(group) > policy.max_count:
+                for sprite in group.sprites()[:len(group)-policy.max_count]:  # グループは追加順なので先頭ほど古い
+                    sprite.kill()
+                    culled["count"] += 1
+
+
+    def _expire(self, name: str, group: pg.sprite.Group, max_age: int):
+        """
+        max_ageステップより前にグループに入ったスプライトを消す
+        使い回されたスプライトは使い回し回数が変わったところで入り直したとみなす
+        """
+        born, stamps = self.born[name], {}
+        for sprite in group.sprites():
+            generation = getattr(sprite, "generation", 0)
+            stamp = born.get(sprite)
+            if stamp is None or stamp[0] != generation:
+                stamp = generation, self.tick
+            if self.tick - stamp[1] >= max_age:
+                sprite.kill()
+                self.culled[name]["age"] += 1
+            else:
+                stamps[sprite] = stamp
+        self.born[name] = stamps  # 消えたスプライトの記録はここで捨てる
+
+
+    def counts(self) -> dict:
+        """
+        戻り値：名前: 生きているスプライト数の辞書
+        """
+        return {name: len(group) for name, (group, _) in self.watched.items()}
+
+
+
+POLICIES = {  # グループ名: 間引きの決まり
+    "beams": Policy(margin=100, max_count=1024),
+    "boss_beams": Policy(margin=50, max_count=4096),
+    "exps": Policy(max_count=512),
+    "emys": Policy(margin=1000, max_count=20000),  # 出現位置は画面の外なので広めに取る
+    "cemys": Policy(margin=1000, max_count=5000),
+    "gravities": Policy(max_count=4),
+    "items": Policy(max_age=15*FPS, max_count=8),
+    "gravityitems": Policy(max_age=20*FPS, max_count=3),
+    "drns": Policy(margin=100, max_count=16),
+    "balls": Policy(margin=100, max_count=16),
+}
+
+
+
+class Gravity(pg.sprite.Sprite):
+    """
+    重力場に関するクラス
+    """
+    band = None  # 低品質時に画面の上下に出す帯（最初に使うときに作る）
+
+    def __init__(self, life: int):
+        """
+        重力場Surfaceを生成する
+        引数 life：重力場の発動時間
+        """
+        super().__init__()
+        self.image = pg.Surface((WIDTH, HEIGHT))
+        self.image.set_alpha(128)  # 透明度を設定
+        self.image.fill((0, 0, 0))  # 黒い矩形
+        self.rect = self.image.get_rect()
+        self.life = life
+
+
+    def update(self):
+        """
+        発動時間を1減算し、0未満になったら消滅する
+        """
+        self.life -= 1
+        if self.life < 0:
+            self.kill()
+
+
+    @classmethod
+    def bands(cls) -> list:
+        """
+        半透明の全画面の代わりに画面の上下に描く黒い帯
+        戻り値：blitsに渡す(Surface, 位置)のリスト
+        """
+        if cls.band is None:
+            cls.band = pg.Surface((WIDTH, 24))
+            cls.band.fill((0, 0, 0))
+        return [(cls.band, (0, 0)), (cls.band, (0, HEIGHT - 24))]
+
+
+
+class GravityItem(pg.sprite.Sprite):
+    """
+    重力場発動アイテムに関するクラス
+    """
+    def __init__(self):
+        """
+        重力場発動アイテムを生成する
+        """
+        super().__init__()
+        self.image = ASSETS.get("fig/bakudan.png", 0.15)
+        self.rect = self.image.get_rect()
+        self.rect.center = random.randint(50, WIDTH-50), random.randint(50, HEIGHT-50)  # 画面内にランダムでアイテムを出現させる
+
+
+
+class Bird(pg.sprite.Sprite):
+    """
+    ゲームキャラクター（こうかとん）に関するクラス
+    """
+    delta = {  # 押下キーと移動量の辞書
+        pg.K_UP: (0, -1),
+        pg.K_DOWN: (0, +1),
+        pg.K_LEFT: (-1, 0),
+        pg.K_RIGHT: (+1, 0),
+    }
+    turns = {  # 向き: (回転角度, (横反転, 縦反転))　元画像は左向き
+        (+1, 0): (0, (True, False)),  # 右
+        (+1, -1): (45, (True, False)),  # 右上
+        (0, -1): (90, (True, False)),  # 上
+        (-1, -1): (-45, (False, False)),  # 左上
+        (-1, 0): (0, (False, False)),  # 左
+        (-1, +1): (45, (False, False)),  # 左下
+        (0, +1): (-90, (True, False)),  # 下
+        (+1, +1): (-45, (True, False)),  # 右下
+    }
+
+    def __init__(self, num: int, xy: tuple[int, int]):
+        """
+        こうかとん画像Surfaceを生成する
+        引数1 num：こうかとん画像ファイル名の番号
+        引数2 xy：こうかとん画像の位置座標タプル
+        """
+        super().__init__()
+        self.imgs = {dire: ASSETS.get(f"fig/{num}.png", 1.25, angle, flip) for dire, (angle, flip) in __class__.turns.items()}
+        self.dire = (+1, 0)
+        self.image = self.imgs[self.dire]
+        self.rect = self.image.get_rect()
+        self.rect.center = xy
+        self.speed = 10
+        self.state = "normal"  # 追加: 通常状態
+        self.hyper_life = 0    # 追加: 発動時間
+
+        self.skills = []  # スキルの格納リスト(手持ちのスキル)
+        self.wait_skill = False  # スキル選択画面の表示について
+
+
+    @classmethod
+    def variants(cls, num: int) -> list[tuple]:
+        """
+        アトラスに焼き込む8方向の画像のキー
+        引数 num：こうかとん画像ファイル名の番号
+        戻り値：(ファイル名, 倍率, 角度, 反転)のリスト
+        """
+        return [(f"fig/{num}.png", 1.25, angle, flip) for angle, flip in cls.turns.values()]
+
+
+    def change_img(self, num: int, screen: pg.Surface | None = None):
+        """
+        こうかとん画像を切り替え，画面に転送する
+        引数1 num：こうかとん画像ファイル名の番号
+        引数2 screen：画面Surface（Noneなら切り替えるだけ）
+        """
+        self.image = ASSETS.get(f"fig/{num}.png", 1.25)
+        if screen is not None:
+            screen.blit(self.image, self.rect)
+
+
+    def update(self, key_lst: list[bool], screen: pg.Surface | None = None):
+        """
+        押下キーに応じてこうかとんを移動させる
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 screen：画面Surface（Noneなら移動するだけ）
+        """
+        sum_mv = [0, 0]
+        for k, mv in __class__.delta.items():
+            if key_lst[k]:
+                sum_mv[0] += mv[0]
+                sum_mv[1] += mv[1]
+        self.rect.move_ip(self.speed*sum_mv[0], self.speed*sum_mv[1])
+        if check_bound(self.rect) != (True, True):
+            self.rect.move_ip(-self.speed*sum_mv[0], -self.speed*sum_mv[1])
+        if not (sum_mv[0] == 0 and sum_mv[1] == 0):
+            self.dire = tuple(sum_mv)
+            self.image = self.imgs[self.dire]
+        if screen is not None:
+            screen.blit(self.image, self.rect)
+
+
+
+class Beam(Pooled, pg.sprite.Sprite):
+    """
+    追尾機能付きビームに関するクラス
+    """
+    rotations = RotationCache("fig/beam.png")  # 全ビームで共有する回転画像テーブル（当たり判定のマスクにも使うので刻みは品質で変えない）
+
+    def reset(self, bird: Bird, xbeam: float, enemies: pg.sprite.Group, clown_enemies: pg.sprite.Group, appearance, targets: TargetIndex | None = None):
+        """
+        ビームを生成する
+        引数1 bird：ビームを放つこうかとん
+        引数2 xbeam：ビーム倍率
+        引数3 enemies：通常の敵機グループ
+        引数4 clown_enemies：ピエロの敵機グループ
+        引数5 targets：敵の探索用インデックス（Noneなら全ての敵を調べる）
+        """
+        self.aim(None)
+        self.image = ASSETS.get("fig/beam.png", 2.0)
+        self.rect = self.image.get_rect()
+        self.rect.center = bird.rect.center
+        self.speed = 10
+        self.appearance = appearance
+        
+        if self.appearance:
+            self.vx, self.vy = calc_orientation(self.rect, pg.Rect(WIDTH/2, 250, 0, 0))
+        else:
+            # 最も近い敵を特定
+            self.aim(self._find_nearest_enemy(bird, enemies, clown_enemies, targets))
+            # 初期の移動方向を設定
+            if self.target is None or self.target.rect.center == self.rect.center:
+                self.vx, self.vy = bird.dire
+            else:
+                self.vx, self.vy = calc_orientation(self.rect, self.target.rect)
+        
+        # 角度の計算と画像の回転
+        self.bucket = None
+        self.scale = None
+        self._rotate(xbeam)
+
+
+    def aim(self, target: pg.sprite.Sprite | None):
+        """
+        狙う敵を設定する
+        引数 target：狙う敵（いなければNone）
+        """
+        self.target = target
+        self.target_gen = getattr(target, "generation", 0)
+
+
+    def target_alive(self) -> bool:
+        """
+        狙っている敵が生きているか（倒された後にプールで使い回された敵は別の敵とみなす）
+        """
+        return self.target is not None and self.target.alive() and getattr(self.target, "generation", 0) == self.target_gen
+
+
+    def _rotate(self, xbeam: float):
+        """
+        進行方向の角度バケットか倍率が変わったときだけ画像を差し替える
+        引数 xbeam：ビーム倍率
+        """
+        angle = math.degrees(math.atan2(-self.vy, self.vx))
+        bucket = __class__.rotations.bucket(angle)
+        if bucket != self.bucket or xbeam != self.scale:
+            self.bucket = bucket
+            self.scale = xbeam
+            self.image = __class__.rotations.get(bucket, xbeam)
+
+
+    def _find_nearest_enemy(self, bird: Bird, enemies: pg.sprite.Group, clown_enemies: pg.sprite.Group, targets: TargetIndex | None = None) -> pg.sprite.Sprite:
+        """
+        全ての敵（通常の敵とピエロ）の中から最も近い敵を見つける
+        引数1 bird：こうかとん
+        引数2 enemies：通常の敵機グループ
+        引数3 clown_enemies：ピエロの敵機グループ
+        引数4 targets：敵の探索用インデックス（Noneなら全ての敵を調べる）
+        戻り値：最も近い敵のSprite（敵がいない場合はNone）
+        """
+        if targets is not None:
+            return targets.nearest(bird.rect.center)
+
+        nearest_enemy = None
+        min_distance = float('inf')
+        
+        # 通常の敵とピエロの敵を両方チェック
+        for enemy in list(enemies) + list(clown_enemies):
+            distance = math.hypot(bird.rect.centerx - enemy.rect.centerx,
+                                bird.rect.centery - enemy.rect.centery)
+            if distance < min_distance:
+                min_distance = distance
+                nearest_enemy = enemy
+        
+        return nearest_enemy
+
+
+    def update(self, xbeam: float, appearance):
+        """
+        ビームを移動させる
+        敵が生存している場合は追尾する
+        """
+        if self.appearance:
+            # ボスの中心座標を取得
+            boss_centerx = appearance.rect.centerx
+            boss_centery = appearance.rect.centery
+            
+            # ビームの現在座標を取得
+            beam_centerx = self.rect.centerx
+            beam_centery = self.rect.centery
+            
+            # ボスの中心座標への方向ベクトルを計算
+            dx = boss_centerx - beam_centerx
+            dy = boss_centery - beam_centery
+            distance = math.sqrt(dx**2 + dy**2)  # 距離を計算
+            
+            if distance != 0:  # 0で割るのを防ぐ
+                self.vx = dx / distance
+                self.vy = dy / distance
+            # 画面中央へ移動する処理
+            self.rect.move_ip(self.speed * self.vx, self.speed * self.vy)
+        else:
+            if self.target_alive() and self.target.rect.center != self.rect.center:  # 画素単位では当たらずに中心が重なったら向きを保つ
+                # ターゲットの方向を再計算
+                self.vx, self.vy = calc_orientation(self.rect, self.target.rect)
+                # 画像の角度を更新
+                self._rotate(xbeam)
+            self.rect.move_ip(self.speed * self.vx, self.speed * self.vy)
+        # 画面外に出たビームはGameのLifecycleが消す
+
+
+
+class BossBullets:
+    """
+    ボスビームの位置・速度・向きを配列で持ち，まとめて動かし・当たり判定をし・描画するクラス
+    ビームごとのスプライトは作らず，画像は全ビームで回転画像テーブルを共有する
+    NumPyがあれば配列演算で，なければリストで同じ計算をする
+    """
+    BIG = 0  # 扇状に撃つ太いビーム
+    SMALL = 1  # 弾幕用の細いビーム（数が多いので描画の負担を抑える）
+    scales = (2.0, 1.0)  # 大きさごとの画像の倍率
+    rotations = tuple(RotationCache("fig/bossbeam.png") for _ in scales)  # 大きさごとに全ボスビームで共有する回転画像テーブル
+    columns = ("x", "y", "px", "py", "dx", "dy", "w", "h", "image")  # 左上・ステップ前の左上・1ステップの移動量・大きさ・画像の番号
+
+    def __init__(self, capacity: int = 256):
+        """
+        引数 capacity：最初に確保する配列の長さ（足りなくなったら倍にする，NumPyがあるときだけ）
+        """
+        self.n = 0  # 生きているビームの数（配列の先頭n行）
+        self.images = [None] * sum(rotations.size for rotations in __class__.rotations)  # 大きさごとに全バケットを並べた回転画像
+        for name in __class__.columns:
+            if np is None:
+                setattr(self, name, [])
+            else:
+                setattr(self, name, np.zeros(capacity, dtype=np.intp if name == "image" else np.float64))
+
+
+    @classmethod
+    def variants(cls) -> list[tuple]:
+        """
+        アトラスに焼き込む全ての大きさと角度の画像のキー
+        戻り値：(ファイル名, 倍率, 角度, 反転)のリスト
+        """
+        return [key for rotations, scale in zip(cls.rotations, cls.scales) for key in rotations.variants(scale)]
+
+
+    def __len__(self) -> int:
+        return self.n
+
+
+    def _grow(self):
+        for name in __class__.columns:
+            old = getattr(self, name)
+            new = np.zeros(len(old) * 2, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, name, new)
+
+
+    def _keep(self, keep):
+        """
+        残すビームだけを順番を保ったまま前に詰める
+        引数 keep：残す行の真理値配列（リスト）かスライス
+        """
+        n = self.n
+        for name in __class__.columns:
+            col = getattr(self, name)
+            if np is not None:
+                rows = col[:n][keep]
+                col[:len(rows)] = rows
+                m = len(rows)
+            elif isinstance(keep, slice):
+                col[:] = col[keep]
+                m = len(col)
+            else:
+                col[:] = [value for value, alive in zip(col, keep) if alive]
+                m = len(col)
+        self.n = m
+
+
+    def add(self, cx: float, cy: float, angle: float, size: int = BIG, speed: float = 3, age: int = 0):
+        """
+        ビームを1本追加する
+        引数1 cx, 引数2 cy：発射位置（画像の中心）
+        引数3 angle：進む向き（度，反時計回り）
+        引数4 size：BIGかSMALL
+        引数5 speed：1ステップの移動量
+        引数6 age：発射してからのステップ数（その分進めた位置に置く）
+        """
+        rotations = __class__.rotations[size]
+        bucket = rotations.bucket(angle)
+        image = size * rotations.size + bucket
+        img = self.images[image]
+        if img is None:
+            img = self.images[image] = rotations.get(bucket, __class__.scales[size])
+        w, h = img.get_size()
+        dx = speed * math.cos(math.radians(angle))
+        dy = -speed * math.sin(math.radians(angle))
+        x, y = cx - w//2 + dx*age, cy - h//2 + dy*age
+        row = (x, y, x, y, dx, dy, w, h, image)
+        if np is None:
+            for name, value in zip(__class__.columns, row):
+                getattr(self, name).append(value)
+        else:
+            i = self.n
+            if i == len(self.x):
+                self._grow()
+            for name, value in zip(__class__.columns, row):
+                getattr(self, name)[i] = value
+        self.n += 1
+
+
+    def clear(self):
+        """
+        全てのビームを消す
+        """
+        self._keep(slice(self.n, None))
+
+
+    def dump(self) -> dict:
+        """
+        戻り値：列名: 生きているビームの値のリストの辞書（スナップショット用）
+        """
+        n = self.n
+        return {name: list(getattr(self, name)) if np is None else getattr(self, name)[:n].tolist()
+                for name in __class__.columns}
+
+
+    def load(self, columns: dict):
+        """
+        dumpした列でビームを置き換える
+        引数 columns：列名: 値のリストの辞書
+        """
+        n = len(columns["x"])
+        for name in __class__.columns:
+            if np is None:
+                setattr(self, name, list(columns[name]))
+            else:
+                col = getattr(self, name)
+                if len(col) < n:
+                    col = np.zeros(n, dtype=col.dtype)
+                    setattr(self, name, col)
+                col[:n] = columns[name]
+        self.n = n
+        size = __class__.rotations[0].size
+        for image in set(columns["image"]):  # 使われている画像を用意する
+            if self.images[image] is None:
+                self.images[image] = __class__.rotations[image // size].get(image % size, __class__.scales[image // size])
+
+
+    def capture(self):
+        """
+        描画の補間用にステップ前の位置を記録する
+        """
+        if np is None:
+            self.px[:], self.py[:] = self.x, self.y
+        else:
+            n = self.n
+            self.px[:n], self.py[:n] = self.x[:n], self.y[:n]
+
+
+    def step(self):
+        """
+        全てのビームを1ステップ分まっすぐ動かす（画面外に出たらGameのLifecycleが消す）
+        """
+        if np is None:
+            self.x[:] = [x + dx for x, dx in zip(self.x, self.dx)]
+            self.y[:] = [y + dy for y, dy in zip(self.y, self.dy)]
+        else:
+            n = self.n
+            self.x[:n] += self.dx[:n]
+            self.y[:n] += self.dy[:n]
+
+
+    def _overlap(self, rect: pg.Rect):
+        """
+        戻り値：各ビームの矩形がrectと重なっているかの真理値配列（リスト）
+        """
+        left, top, right, bottom = rect.left, rect.top, rect.right, rect.bottom
+        if np is None:
+            return [x < right and left < x + w and y < bottom and top < y + h
+                    for x, y, w, h in zip(self.x, self.y, self.w, self.h)]
+        n = self.n
+        x, y = self.x[:n], self.y[:n]
+        return (x < right) & (left < x + self.w[:n]) & (y < bottom) & (top < y + self.h[:n])
+
+
+    def hit(self, rect: pg.Rect, mask: pg.mask.Mask | None = None) -> int:
+        """
+        rectに当たったビームを消す
+        引数1 rect：当たり判定の相手（こうかとん）のRect
+        引数2 mask：相手の画像のマスク（あれば矩形が重なったビームだけ画素単位でも調べる）
+        戻り値：当たったビームの数
+        """
+        if self.n == 0:
+            return 0
+        inside = self._overlap(rect)
+        count = sum(inside) if np is None else int(np.count_nonzero(inside))
+        if count and mask is not None:
+            rows = [i for i, hit in enumerate(inside) if hit] if np is None else np.flatnonzero(inside).tolist()
+            for i in rows:
+                img = self.images[int(self.image[i])]
+                offset = rect.x - int(self.x[i]), rect.y - int(self.y[i])  # blitと同じく切り捨てた位置に描かれる
+                MASKS.checks += 1
+                if MASKS.get(img).overlap(mask, offset) is None:
+                    inside[i] = False
+                    count -= 1
+        if count:
+            self._keep([not hit for hit in inside] if np is None else ~inside)
+        return count
+
+
+    def cull(self, policy: "Policy", culled: dict):
+        """
+        Lifecycleから呼ばれ，画面から離れすぎた・多すぎるビームを消す（max_ageは使わない）
+        引数1 policy：間引きの決まり
+        引数2 culled：理由: 消した数の辞書（消した分を足す）
+        """
+        if policy.margin is not None and self.n:
+            inside = self._overlap(policy.bounds)
+            count = sum(inside) if np is None else int(np.count_nonzero(inside))
+            if count != self.n:
+                culled["margin"] += self.n - count
+                self._keep(inside)
+        if policy.max_count is not None and self.n > policy.max_count:
+            drop = self.n - policy.max_count
+            culled["count"] += drop
+            self._keep(slice(drop, None))  # 追加順に並んでいるので先頭ほど古い
+
+
+    def draw(self, screen: pg.Surface, alpha: float = 1.0, cull: bool = False):
+        """
+        全てのビームを補間した位置に1回のblitsで描画する
+        引数1 screen：描画先
+        引数2 alpha：前のステップから次のステップまでの割合（0～1）
+        引数3 cull：Trueなら画面の外にいるビームは描かない
+        """
+        n = self.n
+        if n == 0:
+            return
+        area = Interpolation.visible
+        if np is None:
+            rows = zip(self.x, self.y, self.px, self.py, self.w, self.h, self.image)
+            if alpha < 1:
+                rows = [(px + (x-px)*alpha, py + (y-py)*alpha, w, h, b) for x, y, px, py, w, h, b in rows]
+            else:
+                rows = [(x, y, w, h, b) for x, y, _, _, w, h, b in rows]
+            if cull:
+                rows = [row for row in rows if area.left < row[0] + row[2] and row[0] < area.right
+                        and area.top < row[1] + row[3] and row[1] < area.bottom]
+            xs, ys, images = [row[0] for row in rows], [row[1] for row in rows], [row[4] for row in rows]
+        else:
+            x, y = self.x[:n], self.y[:n]
+            if alpha < 1:
+                px, py = self.px[:n], self.py[:n]
+                x, y = px + (x-px)*alpha, py + (y-py)*alpha
+            images = self.image[:n]
+            if cull:
+                seen = (area.left < x + self.w[:n]) & (x < area.right) & (area.top < y + self.h[:n]) & (y < area.bottom)
+                x, y, images = x[seen], y[seen], images[seen]
+            xs, ys, images = x.tolist(), y.tolist(), images.tolist()
+        screen.blits(list(zip(map(self.images.__getitem__, images), zip(xs, ys))), False)
+
+
+
+class NeoBeam:
+    """
+    ボスの複数方向ビーム（弾幕）の撃ち方に関するクラス
+    fan：扇状，ring：全方向に等間隔，spiral：ステップごとに向きを回しながら全方向に等間隔
+    ringとspiralは数が多いので細いビームを撃つ
+    """
+    def __init__(self, boss, num: int, pattern: str = "fan", turn: float = 3):
+        """
+        引数1 boss：ビームを放つボス
+        引数2 num：1回に撃つビームの数
+        引数3 pattern：撃ち方（"fan"，"ring"，"spiral"）
+        引数4 turn：spiralで1ステップあたりに回す角度（度）
+        """
+        self.boss = boss
+        self.num = num
+        self.pattern = pattern
+        self.turn = turn
+
+
+    def angles(self, tmr: int = 0) -> list[float]:
+        """
+        1回分のビームの向きを求める
+        引数 tmr：ゲームのステップ数（spiralの向きに使う）
+        戻り値：角度（度）のリスト
+        """
+        vx, vy = self.boss.dire
+        base = math.degrees(math.atan2(-vy, vx))  # ボスの向きが基準
+        if self.pattern == "fan":
+            # 基準角度をランダムに決め (-180度から180度の間)，100度の範囲に扇状に広げる
+            base += random.randint(-180, 180)
+            angle_step = 100 / (self.num - 1) if self.num > 1 else 0
+            return [base - 50 + i * angle_step for i in range(self.num)]  # -50度から+50度まで
+        if self.pattern == "ring":
+            base += random.randint(0, 359)
+        elif self.pattern == "spiral":
+            base += tmr * self.turn
+        else:
+            raise ValueError(f"unknown pattern: {self.pattern}")
+        return [base + i * 360 / self.num for i in range(self.num)]
+
+
+    def fire(self, bullets: BossBullets, tmr: int = 0) -> int:
+        """
+        ボスの中心からビームを撃つ
+        引数1 bullets：ビームを追加する先
+        引数2 tmr：ゲームのステップ数
+        戻り値：撃ったビームの数
+        """
+        cx, cy = self.boss.rect.center
+        size = BossBullets.BIG if self.pattern == "fan" else BossBullets.SMALL
+        angles = self.angles(tmr)
+        for angle in angles:
+            bullets.add(cx, cy, angle, size)
+        return len(angles)
+
+
+
+class Explosion(Pooled, pg.sprite.Sprite):
+    """
+    爆発に関するクラス
+    """
+    def reset(self, obj: "Enemy", life: int):
+        self.imgs = [ASSETS.get(*key) for key in __class__.variants()]
+        self.image = self.imgs[0]
+        self.rect = self.image.get_rect(center=obj.rect.center)
+        self.life = life
+
+
+    def update(self):
+        """
+        爆発時間を1減算した爆発経過時間_lifeに応じて爆発画像を切り替えることで
+        爆発エフェクトを表現する
+        """
+        self.life -= 1
+        self.image = self.imgs[self.life//10%2]
+        if self.life < 0:
+            self.kill()
+
+
+    @staticmethod
+    def variants() -> list[tuple]:
+        """
+        爆発の2枚の画像のキー
+        戻り値：(ファイル名, 倍率, 角度, 反転)のリスト
+        """
+        return [("fig/explosion.gif", 1.0, 0, (False, False)), ("fig/explosion.gif", 1.0, 0, (True, True))]
+
+
+
+class Durian(pg.sprite.Sprite):
+    """
+    スキル:ドリアンのこと
+    ドリアンに関するクラス（動きと当たり判定はProjectilesがまとめて行う）
+    引数1 player：ドリアンの初期位置をbirdの位置にする
+    """
+    def __init__(self, player: Bird):
+        super().__init__()
+        self.image = ASSETS.get("fig/fruit_durian.png", 0.3)  # ドリアンの倍率設定
+        self.rect = self.image.get_rect()
+        self.rect.center = player.rect.center  # ドリアンの初期座標
+        self.vx = 1  # 初期速度(x方向)
+        self.vy = 1  # 初期速度(y方向)
+        self.speed = 3
+
+
+
+class Soccerball(pg.sprite.Sprite):
+    """
+    サッカーボールに関するクラス（動きと当たり判定はProjectilesがまとめて行う）
+    引数1 player：ボールの初期位置をbirdの位置にする
+    """
+    def __init__(self, player: Bird):
+        super().__init__()
+        self.image = ASSETS.get("fig/sport_soccerball.png", 0.1)  # サッカーボールの倍率設定
+        self.rect = self.image.get_rect()
+        self.rect.center = player.rect.center  # サッカーボールの初期座標
+        self.vx = 1  # 初期速度(x方向)
+        self.vy = 1  # 初期速度(y方向)
+        self.speed = 20  # 以前は1ステップに10ずつ2回動いていたので同じ速さにする
+
+
+
+class Enemy(SwarmSprite, Pooled, pg.sprite.Sprite):
+    image_key = ("fig/alien1.png", 0.5)  # 画像のファイル名と倍率
+
+    def reset(self, player: Bird, spawn_directions: int):
+        self.image = ASSETS.get(*__class__.image_key)
+        self.rect = self.image.get_rect()
+        
+        # 指定された方向数に基づいてランダムな角度を選択
+        self.rect.center = __class__.spawn_point(random.randint(0, spawn_directions-1), spawn_directions)
+        
+        self.player = player
+        self.speed = 3
+        self.visible = False  # 画面内に入ったかどうかのフラグ
+
+
+    def update(self):
+        if self.rect.center == self.player.rect.center:  # 重なったら動かない（EnemySwarmと同じ，無敵のときだけ起こる）
+            return
+        self.vx, self.vy = calc_orientation(self.rect, self.player.rect)
+        self.rect.move_ip(self.speed*self.vx, self.speed*self.vy)
+
+
+    @staticmethod
+    def spawn_point(index: int, spawn_directions: int) -> tuple[float, float]:
+        """
+        出現位置（中心）を求める
+        引数1 index：出現方向の番号（0～spawn_directions-1）
+        引数2 spawn_directions：出現方向数
+        """
+        angle_rad = math.radians(index * (360/spawn_directions))
+        radius = max(WIDTH, HEIGHT) + 100  # 画面外からの出現を確実にする
+        return WIDTH/2 + math.cos(angle_rad) * radius, HEIGHT/2 + math.sin(angle_rad) * radius
+
+
+
+class Score:
+    """
+    打ち落とした爆弾，敵機の数をスコアとして表示するクラス
+    爆弾：1点
+    敵機：10点
+    """
+    def __init__(self):
+        self.color = (0, 0, 255)
+        self.value = 0
+        self.shown = self.value  # 表示中の画像の点数
+        self.image = TEXT.render(50, f"Score: {self.value}", self.color, False)
+        self.rect = self.image.get_rect()
+        self.rect.center = 100, HEIGHT-50
+
+
+    def update(self, screen: pg.Surface):
+        if self.value != self.shown:  # 点数が変わったときだけ描き直す
+            self.image = TEXT.render(50, f"Score: {self.value}", self.color, False)
+            self.shown = self.value
+        screen.blit(self.image, self.rect)
+
+
+
+class ClownEnemy(SwarmSprite, Pooled, pg.sprite.Sprite):
+    """ピエロの敵クラス"""
+    image_key = ("fig/images.jpg", 0.25)  # 画像のファイル名と倍率
+
+    def reset(self, player: "Bird", spawn_directions: int):
+        # 基本の画像設定
+        self.image = ASSETS.get(*__class__.image_key)
+        self.rect = self.image.get_rect()
+        
+        # 出現位置の設定（画面外から確実に出現するように修正）
+        self.rect.center = __class__.spawn_point(random.randint(0, spawn_directions-1), spawn_directions)
+        self.player = player
+        self.base_speed = 2
+        self.speed = self.base_speed
+        self.points = 20
+        
+        # 移動用の変数
+        self.vx = 0
+        self.vy = 0
+        self.movement_phase = 0
+
+
+    def update(self):
+        """敵の更新処理"""
+        # プレイヤーへの方向を計算
+        target_x = self.player.rect.centerx - self.rect.centerx
+        target_y = self.player.rect.centery - self.rect.centery
+        
+        # 方向の正規化
+        distance = math.sqrt(target_x**2 + target_y**2)
+        if distance != 0:
+            self.vx = (target_x / distance) * self.speed
+            self.vy = (target_y / distance) * self.speed
+            
+        # ジグザグ動作の追加
+        self.movement_phase += 0.1
+        perpendicular_x = -self.vy  # 垂直方向のベクトル
+        perpendicular_y = self.vx
+        zigzag = math.sin(self.movement_phase) * 2  # ジグザグの振れ幅を調整
+        
+        # 最終的な移動を適用
+        self.rect.x += self.vx + perpendicular_x * zigzag
+        self.rect.y += self.vy + perpendicular_y * zigzag
+
+
+    @staticmethod
+    def spawn_point(index: int, spawn_directions: int) -> tuple[int, int]:
+        """
+        出現位置（中心）を求める（画面の四隅のすぐ外のどれか）
+        引数1 index：出現方向の番号（0～spawn_directions-1）
+        引数2 spawn_directions：出現方向数
+        """
+        # 画面の中心からの位置を計算
+        spawn_x, spawn_y = Enemy.spawn_point(index, spawn_directions)
+        
+        # 画面外になるように調整
+        spawn_x = -50 if spawn_x < WIDTH/2 else WIDTH + 50
+        spawn_y = -50 if spawn_y < HEIGHT/2 else HEIGHT + 50
+        return spawn_x, spawn_y
+
+
+
+class Item(pg.sprite.Sprite):
+    """
+    強化アイテムに関するクラス
+    """
+    def __init__(self):
+        """
+        強化アイテムSurfaceを生成する
+        """
+        super().__init__()
+        self.image = ASSETS.get("fig/kouseki_colorful.png", 0.1)
+        self.rect = self.image.get_rect()
+        self.rect.center = random.randint(50, WIDTH-50), random.randint(50, HEIGHT-50)
+
+
+
+class Boss:
+    def __init__(self, health: int = 200):
+        self.image = ASSETS.get("fig/fantasy_dragon.png", 0.7)
+        self.rect = self.image.get_rect()
+        self.rect.center = (WIDTH/2, 0)  # ボスの初期位置を設定
+        self.health = health  # ボスの体力（必要に応じて調整）
+        self.max_health = health  # 弾幕の切り替えに使う最初の体力
+        self.appearing=True
+        self.defeated = False  # ボス撃破フラグ
+        self.dire=(+1, 0)
+
+
+    def update(self) -> "Explosion | None":
+        """
+        登場時の移動と撃破判定を行う
+        戻り値：撃破した瞬間だけ爆発エフェクト
+        """
+        # ボスの移動
+        if self.appearing:
+            self.rect.y += 1
+            if self.rect.top >= 150:
+                self.rect.top = 150
+                self.appearing = False
+
+        if self.health <= 0:
+            self.health = 0
+
+        # ボス撃破時の処理
+        if self.health <= 0 and not self.defeated:
+            self.defeated = True
+            # 爆発エフェクトを生成
+            return Explosion(self, 100)
+        return None
+
+
+    def draw(self, screen: pg.Surface, pos=None):
+        """
+        体力とボス（撃破後はゲームクリア）を表示する
+        引数1 screen：画面Surface
+        引数2 pos：描画位置（Noneならself.rect）
+        """
+        # 体力表示
+        health_text = TEXT.render(50, f"Boss HP: {self.health}", (255, 0, 0))  # 体力が変わったときだけ描画される
+        screen.blit(health_text, (10, 10))
+
+        # 通常表示
+        if not self.defeated:
+            screen.blit(self.image, self.rect if pos is None else pos)
+
+        # ゲームクリア表示
+        else:
+            clear_text = TEXT.render(150, "GAME CLEAR!", (255, 215, 0))
+            clear_rect = clear_text.get_rect(center=(WIDTH//2, HEIGHT//2))
+            screen.blit(clear_text, clear_rect)
+
+
+
+class Appearance:
+    def __init__(self, score, threshold: int = 1000, boss_health: int = 200):
+        self.score = score  # Score クラスのインスタンス
+        self.threshold = threshold  # ボスが出現するスコア
+        self.boss_health = boss_health  # 出現するボスの体力
+        self.boss_appeared = False  # ボスが登場しているかのフラグ
+        self.boss = None  # ボスのインスタンス
+        self.warning = 0  # ボス襲来の警告を出す残りステップ数
+        self.flash_time = 0
+        self.boss_visible = False
+
+
+    def update(self, emys, cemys):
+        # ボスの出現条件
+        if self.score.value >= self.threshold and not self.boss_appeared:
+            self.boss_appeared = True
+            self.boss = Boss(self.boss_health)
+            for emy in emys:
+                emy.kill()  # 他の敵を削除
+            for cemy in cemys:
+                cemy.kill()
+            self.warning = 4 * FPS  # 通常の敵をすべて削除
+            self.flash_time = 0  # 点滅時間リセット
+            self.boss_visible = False  # 点滅状態に入る前に初期化
+
+        # ボスが登場している場合の更新
+        if self.warning > 0:
+            # ボス襲来の文字の点滅
+            self.warning -= 1
+            self.flash_time += 1
+            if self.flash_time % 80 < 10 and self.flash_time > 4:
+                self.boss_visible = True
+        elif self.boss and self.boss_visible:
+            # ボスが点滅状態を抜けた後も更新
+            self.boss.update()
+
+
+    def draw(self, screen, boss_pos=None):
+        """
+        ボス襲来の文字とボスを表示する
+        引数1 screen：画面Surface
+        引数2 boss_pos：ボスの描画位置（Noneならboss.rect）
+        """
+        if self.warning > 0 and self.flash_time % 80 < 10:
+            text = TEXT.render(100, "WARNING!!", (255, 0, 0))
+            screen.blit(text, (320, HEIGHT / 2))
+        if self.boss and self.boss_visible:
+            self.boss.draw(screen, boss_pos)
+
+
+
+class KeyState:
+    """
+    pg.key.get_pressed()の代わりに使う押下キーの真理値リスト
+    """
+    def __init__(self, pressed=()):
+        """
+        引数 pressed：押下中のキー定数の集まり
+        """
+        self.pressed = frozenset(pressed)
+
+
+    def __getitem__(self, key: int) -> bool:
+        return key in self.pressed
+
+
+
+class Keyboard:
+    """
+    実際のキーボードから入力を受け取るクラス
+    """
+    def poll(self, frame: int, bird: Bird) -> tuple:
+        """
+        引数1 frame：ループのフレーム番号
+        引数2 bird：こうかとん
+        戻り値：(押下キーの真理値リスト, イベントのリスト)
+        """
+        return pg.key.get_pressed(), pg.event.get()
+
+
+    def watch(self, view: "WorldView"):
+        """
+        ゲームの見え方を受け取る（キーボードの入力には使わない）
+        引数 view：ゲームの読み取り専用の見え方
+        """
+
+
+    def pressure(self, frame: int, level: int) -> int:
+        """
+        敵の出現に使う処理の重さを返す
+        引数1 frame：ループのフレーム番号
+        引数2 level：計測した処理時間から求めた重さ
+        戻り値：計測したままの重さ
+        """
+        return level
+
+
+
+class ScriptedInput:
+    """
+    フレーム番号ごとに決められた入力を返すクラス（ヘッドレス実行用）
+    """
+    def __init__(self, keys: dict | None = None, skills: tuple = (pg.K_1, pg.K_2)):
+        """
+        引数1 keys：{フレーム番号: 押下キーのタプル}（次の指定まで押しっぱなし）
+        引数2 skills：スキル選択画面で順番に押すキー
+        """
+        self.keys = dict(keys or {})
+        self.skills = skills
+        self.skill_count = 0
+        self.state = KeyState()
+
+
+    def poll(self, frame: int, bird: Bird) -> tuple:
+        """
+        引数1 frame：ループのフレーム番号
+        引数2 bird：こうかとん
+        戻り値：(押下キーの真理値リスト, イベントのリスト)
+        """
+        if frame in self.keys:
+            self.state = KeyState(self.keys[frame])
+        events = pg.event.get()  # ウィンドウのイベントキューは空にしておく
+        if bird.wait_skill and self.skills:
+            key = self.skills[self.skill_count % len(self.skills)]
+            self.skill_count += 1
+            events.append(pg.event.Event(pg.KEYDOWN, key=key))
+        return self.state, events
+
+
+    def watch(self, view: "WorldView"):
+        """
+        ゲームの見え方を受け取る（決められた入力を返すだけなので使わない）
+        引数 view：ゲームの読み取り専用の見え方
+        """
+
+
+    def pressure(self, frame: int, level: int) -> int:
+        """
+        戻り値：常に0（実行環境の速さで結果が変わらないように計測値は使わない）
+        """
+        return 0
+
+
+
+class Recorder:
+    """
+    入力元をそのまま使いながら，シミュレーションに効く入力を記録するクラス
+    記録するのは乱数シード，移動キーの押下状態（変化したフレームだけ），スキル選択のキー入力
+    再生する環境を確かめられるように描画品質の段階と画像のハッシュも残す
+    """
+    events = (pg.K_1, pg.K_2)  # 記録するKEYDOWNのキー
+    version = 3  # 記録の形式（2：スキル選択中はゲームの時間が止まる，3：品質と画像のハッシュを持つ）
+
+    def __init__(self, control, path: str, seed: int, params: dict | None = None, quality: int | None = None,
+                 assets: str | None = None):
+        """
+        引数1 control：記録する入力元（KeyboardやScriptedInput）
+        引数2 path：書き出すファイル名
+        引数3 seed：このゲームの乱数シード
+        引数4 params：このゲームのGameの引数
+        引数5 quality：固定した描画品質の段階（Noneなら処理時間に応じて変えた）
+        引数6 assets：AssetRegistry.digestの値
+        """
+        self.control = control
+        self.path = path
+        self.seed = seed
+        self.params = params or {}
+        self.quality = quality
+        self.assets = assets
+        self.keys = {}  # フレーム番号: 押下中の移動キーのタプル（変化したときだけ）
+        self.keydowns = {}  # フレーム番号: 押されたキーのリスト
+        self.levels = {}  # フレーム番号: 処理の重さ（変化したときだけ）
+        self.pressed = ()  # 直前のフレームの移動キー
+        self.level = 0  # 直前のフレームの処理の重さ
+        self.frames = 0  # 記録したフレーム数
+
+
+    def poll(self, frame: int, bird: Bird) -> tuple:
+        """
+        引数1 frame：ループのフレーム番号
+        引数2 bird：こうかとん
+        戻り値：(押下キーの真理値リスト, イベントのリスト)
+        """
+        key_lst, events = self.control.poll(frame, bird)
+        pressed = tuple(k for k in Bird.delta if key_lst[k])
+        if pressed != self.pressed:
+            self.keys[frame] = self.pressed = pressed
+        keydowns = [event.key for event in events if event.type == pg.KEYDOWN and event.key in __class__.events]
+        if keydowns:
+            self.keydowns[frame] = keydowns
+        self.frames = frame
+        return KeyState(pressed), events  # 記録したものと同じ入力でシミュレーションを進める
+
+
+    def watch(self, view: "WorldView"):
+        """
+        ゲームの見え方を記録する入力元に渡す
+        引数 view：ゲームの読み取り専用の見え方
+        """
+        self.control.watch(view)
+
+
+    def pressure(self, frame: int, level: int) -> int:
+        """
+        入力元が返す処理の重さを記録する（実行環境の速さも入力として再生できるようにする）
+        """
+        level = self.control.pressure(frame, level)
+        if level != self.level:
+            self.levels[frame] = self.level = level
+        return level
+
+
+    def save(self):
+        """
+        記録をJSONファイルに書き出す
+        """
+        with open(self.path, "w") as f:
+            json.dump({
+                "version": __class__.version,
+                "seed": self.seed,
+                "params": self.params,
+                "quality": self.quality,
+                "assets": self.assets,
+                "frames": self.frames,
+                "keys": self.keys,
+                "keydowns": self.keydowns,
+                "levels": self.levels,
+            }, f, separators=(",", ":"))
+
+
+
+class Replay(ScriptedInput):
+    """
+    Recorderで記録した入力を再生するクラス
+    """
+    def __init__(self, path: str):
+        """
+        引数 path：Recorderが書き出したファイル名
+        """
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != Recorder.version:  # 形式が違うと同じ入力でも結果が変わる
+            raise ValueError(f"{path}: 記録の形式{data.get('version')}は再生できない（{Recorder.version}のみ）")
+        super().__init__({int(frame): tuple(keys) for frame, keys in data["keys"].items()}, skills=())
+        self.seed = data["seed"]
+        self.params = data.get("params", {})
+        self.quality = data.get("quality")  # 記録したときの描画品質の段階
+        self.assets = data.get("assets")  # 記録したときの画像のハッシュ
+        self.frames = data["frames"]  # 記録されたフレーム数
+        self.keydowns = {int(frame): keys for frame, keys in data["keydowns"].items()}
+        self.levels = {int(frame): level for frame, level in data.get("levels", {}).items()}
+        self.level = 0
+
+
+    def poll(self, frame: int, bird: Bird) -> tuple:
+        """
+        引数1 frame：ループのフレーム番号
+        引数2 bird：こうかとん
+        戻り値：(押下キーの真理値リスト, イベントのリスト)
+        """
+        state, events = super().poll(frame, bird)
+        events = [event for event in events if event.type == pg.QUIT]  # ウィンドウを閉じる操作だけは受け付ける
+        events += [pg.event.Event(pg.KEYDOWN, key=key) for key in self.keydowns.get(frame, ())]
+        return state, events
+
+
+    def pressure(self, frame: int, level: int) -> int:
+        """
+        戻り値：記録された処理の重さ（次の変化まで同じ値）
+        """
+        self.level = self.levels.get(frame, self.level)
+        return self.level
+
+
+
+class WorldView:
+    """
+    ボットに渡すゲームの読み取り専用の見え方
+    どのメソッドも位置の写しを返すので，ボットからゲームの状態を書き換えることはできない
+    """
+    def __init__(self, game: "Game"):
+        """
+        引数 game：見せるゲーム
+        """
+        self._game = game
+
+
+    @property
+    def bird(self) -> pg.Rect:
+        """
+        こうかとんのRectの写し
+        """
+        return self._game.bird.rect.copy()
+
+
+    @property
+    def speed(self) -> int:
+        """
+        こうかとんの1ステップの移動量
+        """
+        return self._game.bird.speed
+
+
+    @property
+    def wait_skill(self) -> bool:
+        """
+        スキル選択画面を待っているか
+        """
+        return self._game.bird.wait_skill
+
+
+    @property
+    def boss(self) -> pg.Rect | None:
+        """
+        画面に出ているボスのRectの写し（いなければNone）
+        """
+        appearance = self._game.appearance
+        boss = appearance.boss
+        if boss is None or not appearance.boss_visible or boss.defeated:
+            return None
+        return boss.rect.copy()
+
+
+    def skills(self) -> dict:
+        """
+        戻り値：SkillSelect.skillsのグループ名: 手持ちの数の辞書
+        """
+        return {name: len(self._game.groups[name]) for name, _ in SkillSelect.skills.values()}
+
+
+    def enemies(self, within: float | None = None) -> list[tuple[int, int, float, float]]:
+        """
+        通常の敵とピエロの(中心のx, 中心のy, 幅の半分, 高さの半分)
+        引数 within：こうかとんから中心までがこの距離以内のものだけにする（Noneなら全部）
+        """
+        game = self._game
+        return self._near([(*rect.center, rect.width/2, rect.height/2)
+                           for group in (game.emys, game.cemys) for rect in (sprite.rect for sprite in group)], within)
+
+
+    def bullets(self, within: float | None = None) -> list[tuple[float, ...]]:
+        """
+        ボスビームの(中心のx, 中心のy, 幅の半分, 高さの半分, 1ステップのxの移動量, yの移動量)
+        引数 within：こうかとんから中心までがこの距離以内のものだけにする（Noneなら全部）
+        """
+        bullets = self._game.boss_beams
+        n = bullets.n
+        cols = [getattr(bullets, name)[:n] for name in ("x", "y", "w", "h", "dx", "dy")]
+        if np is not None:
+            cols = [col.tolist() for col in cols]
+        return self._near([(x + w/2, y + h/2, w/2, h/2, dx, dy) for x, y, w, h, dx, dy in zip(*cols)], within)
+
+
+    def items(self, within: float | None = None) -> list[tuple[int, int]]:
+        """
+        強化アイテムの中心
+        引数 within：こうかとんからこの距離以内のものだけにする（Noneなら全部）
+        """
+        return self._near([sprite.rect.center for sprite in self._game.items], within)
+
+
+    def gravity_items(self, within: float | None = None) -> list[tuple[int, int]]:
+        """
+        重力場発動アイテムの中心（取ると重力場が画面の敵をしばらく倒し続ける）
+        引数 within：こうかとんからこの距離以内のものだけにする（Noneなら全部）
+        """
+        return self._near([sprite.rect.center for sprite in self._game.gravityitems], within)
+
+
+    def spawns(self, steps: int) -> list[tuple[float, ...]]:
+        """
+        stepsステップ以内に来る敵とピエロの波が出現しうる全ての位置
+        どの方向から出るかは乱数で決まるので，今の出現方向数で選ばれうる位置をすべて返す
+        引数 steps：何ステップ先までの波を見るか
+        戻り値：(中心のx, 中心のy, 幅の半分, 高さの半分, 出現までのステップ数)のリスト（ボスの出現中は出ないので空）
+        """
+        game = self._game
+        if game.appearance.boss_appeared:
+            return []
+        director, tmr = game.director, game.tmr
+        points = []
+        for cls, due in ((Enemy, director.next_enemy), (ClownEnemy, director.next_clown)):
+            if due - tmr > steps:
+                continue
+            w, h = ASSETS.get(*cls.image_key).get_size()
+            for x, y in {cls.spawn_point(i, director.directions) for i in range(director.directions)}:
+                points.append((x, y, w/2, h/2, max(due - tmr, 0)))
+        return sorted(points)
+
+
+    def _near(self, points: list[tuple], within: float | None) -> list[tuple]:
+        if within is None:
+            return points
+        bx, by = self._game.bird.rect.center
+        r2 = within * within
+        return [p for p in points if (p[0] - bx)**2 + (p[1] - by)**2 <= r2]
+
+
+
+class Bot:
+    """
+    Autoplayerに差し込むボットの基底クラス（動かず，スキルは手持ちの少ない方を選ぶ）
+    decideとchooseを上書きして方針を変える
+    """
+    def decide(self, view: WorldView) -> tuple:
+        """
+        このステップで押す移動キーを決める
+        引数 view：ゲームの読み取り専用の見え方
+        戻り値：押下するBird.deltaのキーのタプル
+        """
+        return ()
+
+
+    def choose(self, view: WorldView) -> int:
+        """
+        スキル選択画面で押すキーを決める
+        引数 view：ゲームの読み取り専用の見え方
+        戻り値：SkillSelect.skillsのキー
+        """
+        owned = view.skills()
+        return min(SkillSelect.skills, key=lambda key: owned[SkillSelect.skills[key][0]])
+
+
+
+class DodgeBot(Bot):
+    """
+    敵とボスビームを避け，余裕があればアイテムを取りに行く既定のボット
+    止まるを含む9通りの移動ごとに，その向きに進み続けたときの数ステップ先までを簡単に先読みし，
+    ぶつかるまでの時間・行き着く先の敵の混み具合・壁際・アイテムまでの距離から最も良い移動を選ぶ
+    先読みでは敵はこうかとんへ毎ステップchaseずつ近づき，ボスビームは今の向きのまま進むものとする
+    もうすぐ来る波は出現しうる位置に敵がいるものとして先読みに加え（ピエロは画面の隅のすぐ外に出る），
+    近くの敵が多いほど壁際を強く避ける．重力場発動アイテムは画面の敵をまとめて倒せるので強化アイテムより優先する
+    乱数は使わないので，シードが同じなら同じ動きになる
+    """
+    moves = [(mx, my) for mx in (-1, 0, 1) for my in (-1, 0, 1)]
+    directions = [(mx / math.hypot(mx, my), my / math.hypot(mx, my)) for mx, my in moves if mx or my]  # 逃げ道を調べる単位ベクトル
+    keys = {  # 移動の向き: 押下するキーのタプル
+        move: tuple(k for k, (dx, dy) in Bird.delta.items() if (dx and dx == move[0]) or (dy and dy == move[1]))
+        for move in moves
+    }
+    horizon = 10  # 先読みするステップ数
+    stride = 1  # 先読みの刻み（ステップ）
+    chase = 3  # 敵が1ステップで近づく距離（Enemyの速さ）
+    nearest = 40  # 先読みする敵とボスビームのそれぞれの数の上限（近い順，敵が多くても時間がかからないように）
+    radius = 60  # 敵やボスビームとの矩形の隙間がこれより狭いと危ない
+    danger = 10.0  # 近くの敵やボスビームを避ける強さ
+    fatal = 1000.0  # ぶつかると見込まれる移動を避ける強さ（早くぶつかるほど大きい）
+    runway = 400  # 行き着く先から逃げられる距離をこれまで数える
+    routes = 3  # 逃げ道の良さは長い方からこの数の方向で測る
+    escape = 20.0  # 逃げ道の少ない場所を避ける強さ
+    pressure_radius = 250  # こうかとんからこの距離以内の敵の数で追い詰められ具合を測る
+    crowded = 12  # 近くの敵がこの数以上なら壁際を最も強く避け，アイテムを最も後回しにする
+    boss_radius = 300  # ボスの近くはビームが出てくるので避ける
+    boss_weight = 30.0  # ボスの近くを避ける強さ
+    margin = 120  # 壁がこれより近いと追い詰められやすい
+    wall = 10.0  # 壁際や隅を避ける強さ（近くに敵がいないとき）
+    wall_pressure = 30.0  # 近くの敵が多いときに壁際を避ける強さに足す分
+    orbit = 1.0  # 画面中央の周りを回り続ける強さ（追ってくる敵を後ろに引き連れる）
+    orbit_radius = 220  # 回る円の半径
+    item_weight = 10.0  # 強化アイテムへの近づきやすさ（近くの敵が少ないときほど強い）
+    gravity_weight = 15.0  # 重力場発動アイテムへの近づきやすさ
+    inertia = 0.2  # 同じ向きに動き続けやすくして小刻みな往復を防ぐ
+
+    def __init__(self):
+        self.last = (0, 0)  # 直前に選んだ移動
+
+
+    def decide(self, view: WorldView) -> tuple:
+        cls = __class__
+        bird = view.bird
+        speed = view.speed
+        hw, hh = bird.width / 2, bird.height / 2
+        cx, cy = bird.center
+        reach = max(bird.width, bird.height) + 200 + (speed + cls.chase) * cls.horizon  # 大きい敵（ピエロ）も含める
+        enemies = heapq.nsmallest(cls.nearest, view.enemies(reach), key=lambda e: (e[0] - cx)**2 + (e[1] - cy)**2)
+        enemies = [(*e, 0) for e in enemies]
+        enemies += [s for s in view.spawns(cls.horizon)  # まだいない敵は出現するステップから動かす
+                    if (s[0] - cx)**2 + (s[1] - cy)**2 <= (reach + cls.chase * cls.horizon)**2]
+        bullets = heapq.nsmallest(cls.nearest, view.bullets(reach + 6 * cls.horizon), key=lambda b: (b[0] - cx)**2 + (b[1] - cy)**2)
+        boss = view.boss
+        items = view.items()
+        gravity_items = view.gravity_items()
+        pressure = min(len(view.enemies(cls.pressure_radius)) / cls.crowded, 1.0)  # 0（周りに敵がいない）～1（囲まれかけている）
+        wall_weight = cls.wall + cls.wall_pressure * pressure
+        travel = speed * cls.horizon * 2  # アイテムまでの距離の物差し
+        steps = range(cls.stride, cls.horizon + 1, cls.stride)
+        radius, margin = cls.radius, cls.margin
+        ox, oy = cx - WIDTH/2, cy - HEIGHT/2  # 円の中心から見た位置
+        r = max(math.hypot(ox, oy), 1.0)
+        pull = (cls.orbit_radius - r) / cls.orbit_radius  # 円より内側なら外へ，外側なら内へ
+        wx, wy = -oy / r + pull * ox / r, ox / r + pull * oy / r  # 進みたい向き（反時計回りの接線＋半径方向）
+        wn = max(math.hypot(wx, wy), 1e-9)
+
+        best, best_cost = (0, 0), float("inf")
+        for move in cls.moves:
+            mx, my = move
+            if move != (0, 0) and check_bound(bird.move(mx*speed, my*speed)) != (True, True):
+                continue  # 壁で止められる移動はBird.updateで打ち消される
+            cost = 0.0
+            px, py = cx, cy
+            chasers = [list(e) for e in enemies]
+            for t in steps:
+                nx, ny = px + mx*speed*cls.stride, py + my*speed*cls.stride
+                if hw <= nx <= WIDTH - hw and hh <= ny <= HEIGHT - hh:  # 壁にぶつかったらそこで止まる（Bird.updateと同じ）
+                    px, py = nx, ny
+                closest = radius
+                for e in chasers:  # こうかとんが動いた後に敵が近づく
+                    x, y, ew, eh, due = e
+                    if due >= t:
+                        continue
+                    d = math.hypot(px - x, py - y)
+                    step = min(cls.chase * min(cls.stride, t - due), d)
+                    if d > 0:
+                        e[0] = x = x + (px - x) * step / d
+                        e[1] = y = y + (py - y) * step / d
+                    gap = math.hypot(max(abs(px - x) - hw - ew, 0.0), max(abs(py - y) - hh - eh, 0.0))
+                    if gap < radius:
+                        cost += cls.danger * (radius - gap) / radius / t
+                        closest = min(closest, gap)
+                for x, y, ew, eh, dx, dy in bullets:
+                    gap = math.hypot(max(abs(px - x - dx*t) - hw - ew, 0.0), max(abs(py - y - dy*t) - hh - eh, 0.0))
+                    if gap < radius:
+                        cost += cls.danger * (radius - gap) / radius / t
+                        closest = min(closest, gap)
+                if closest <= 0:  # この先はぶつかるので読まない
+                    cost += cls.fatal / t
+                    break
+            cost += cls.escape * (1 - self.freedom(px, py, hw, hh, speed, chasers))
+            if boss is not None:
+                d = math.hypot(px - boss.centerx, py - boss.centery)
+                cost += cls.boss_weight * max(cls.boss_radius - d, 0.0) / cls.boss_radius
+            for wall in (px - hw, WIDTH - hw - px, py - hh, HEIGHT - hh - py):
+                if wall < margin:
+                    cost += wall_weight * ((margin - wall) / margin)**2
+            cost += cls.orbit * (1 - (mx*wx + my*wy) / (wn * max(math.hypot(mx, my), 1.0)))
+            if items:  # 先読みの間に進める距離を1として近づいた分を比べる
+                cost += cls.item_weight * (1 - 0.7*pressure) * min(min(math.hypot(px - x, py - y) for x, y in items) / travel, 1.0)
+            if gravity_items:
+                cost += cls.gravity_weight * min(min(math.hypot(px - x, py - y) for x, y in gravity_items) / travel, 1.0)
+            if move == self.last:
+                cost -= cls.inertia
+            if cost < best_cost:
+                best, best_cost = move, cost
+        self.last = best
+        return cls.keys[best]
+
+
+    def freedom(self, px: float, py: float, hw: float, hh: float, speed: float, enemies: list) -> float:
+        """
+        (px, py)から8方向にまっすぐ逃げたとき，敵に先回りされるか壁に着くまでに進める距離から逃げ道の良さを求める
+        敵は逃げる先へ最短で向かうものとし，こうかとんより先に着ける地点があればそこで逃げ道が塞がる
+        引数1 px, 引数2 py：こうかとんの中心
+        引数3 hw, 引数4 hh：こうかとんの幅と高さの半分
+        引数5 speed：こうかとんの1ステップの移動量
+        引数6 enemies：[中心のx, 中心のy, 幅の半分, 高さの半分, 出現までのステップ数]のリスト
+        戻り値：0（逃げ道がない）～1（どの方向にもrunwayまで逃げられる）
+        """
+        cls = __class__
+        runway = cls.runway
+        k = cls.chase / max(speed, cls.chase + 1)  # 敵の速さの比（こうかとんの方が速い）
+        a2 = 1 - k*k
+        near = []
+        for x, y, ew, eh, due in enemies:
+            qx, qy, r = x - px, y - py, max(ew, eh) + max(hw, hh)
+            if qx*qx + qy*qy < (runway + r)**2:
+                near.append((qx, qy, r, qx*qx + qy*qy - r*r))
+        lengths = []
+        for ux, uy in cls.directions:
+            free = runway  # 壁までの距離で打ち切る
+            if ux:
+                free = min(free, ((WIDTH - hw - px) if ux > 0 else (px - hw)) / abs(ux))
+            if uy:
+                free = min(free, ((HEIGHT - hh - py) if uy > 0 else (py - hh)) / abs(uy))
+            for qx, qy, r, c in near:
+                if c <= 0:  # もう重なっている
+                    free = 0.0
+                    break
+                b = qx*ux + qy*uy + k*r  # 距離sの地点に敵が先に着く条件：a2*s^2 - 2b*s + c <= 0
+                d = b*b - a2*c
+                if b > 0 and d >= 0:
+                    free = min(free, (b - math.sqrt(d)) / a2)
+            lengths.append(max(free, 0.0))
+        return sum(sorted(lengths)[-cls.routes:]) / (cls.routes * runway)
+
+
+
+class Autoplayer:
+    """
+    ボットがゲームの見え方から移動キーを決め，スキルも自動で選ぶ入力元（耐久試験・負荷試験用）
+    """
+    def __init__(self, bot: Bot | None = None):
+        """
+        引数 bot：操作を決めるボット（Noneなら既定のDodgeBot）
+        """
+        self.bot = bot if bot is not None else DodgeBot()
+        self.view = None  # watchで受け取るゲームの見え方
+
+
+    def watch(self, view: WorldView):
+        """
+        引数 view：ボットに渡すゲームの読み取り専用の見え方
+        """
+        self.view = view
+
+
+    def poll(self, frame: int, bird: Bird) -> tuple:
+        """
+        引数1 frame：ループのフレーム番号
+        引数2 bird：こうかとん
+        戻り値：(押下キーの真理値リスト, イベントのリスト)
+        """
+        events = pg.event.get()  # ウィンドウを閉じる操作やF3などはそのまま通す
+        if self.view is None:
+            return KeyState(), events
+        if bird.wait_skill:
+            events.append(pg.event.Event(pg.KEYDOWN, key=self.bot.choose(self.view)))
+        return KeyState(self.bot.decide(self.view)), events
+
+
+    def pressure(self, frame: int, level: int) -> int:
+        """
+        戻り値：常に0（ScriptedInputと同じく，実行環境の速さで結果が変わらないようにする）
+        """
+        return 0
+
+
+
+class Interpolation:
+    """
+    最後のステップの直前の位置を覚えておき，描画時にステップ間の位置を補間するクラス
+    """
+    visible = pg.Rect(-32, -32, WIDTH + 64, HEIGHT + 64)  # 補間で動く分の余裕をとった画面の範囲
+    def __init__(self):
+        self.prev = {}  # スプライト: ステップ前の左上座標
+
+
+    def capture(self, *groups, extra=()):
+        """
+        ステップ前の位置を記録する
+        引数1 groups：記録するスプライトグループ
+        引数2 extra：グループに入っていない記録対象（こうかとん，ボスなど）
+        """
+        self.prev = {sprite: sprite.rect.topleft for group in groups for sprite in group}
+        for obj in extra:
+            if obj is not None:
+                self.prev[obj] = obj.rect.topleft
+
+
+    def pos(self, obj, alpha: float):
+        """
+        補間した描画位置を返す
+        引数1 obj：rectを持つオブジェクト
+        引数2 alpha：前のステップから次のステップまでの割合（0～1）
+        """
+        prev = self.prev.get(obj)
+        if prev is None or alpha >= 1:
+            return obj.rect
+        x0, y0 = prev
+        x1, y1 = obj.rect.topleft
+        return x0 + (x1-x0)*alpha, y0 + (y1-y0)*alpha
+
+
+    def draw(self, group, screen: pg.Surface, alpha: float, cull: bool = False):
+        """
+        グループを補間した位置にまとめて描画する
+        引数1 group：スプライトグループかスプライトのリスト
+        引数2 screen：描画先
+        引数3 alpha：前のステップから次のステップまでの割合（0～1）
+        引数4 cull：Trueなら画面の外にいるスプライトは描かない
+        """
+        sprites = group.sprites() if isinstance(group, pg.sprite.AbstractGroup) else group
+        if cull and sprites:
+            sprites = [sprites[i] for i in __class__.visible.collidelistall(sprites)]
+        screen.blits([(sprite.image, self.pos(sprite, alpha)) for sprite in sprites], False)
+
+
+
+class Renderer:
+    """
+    前回と今回描いた矩形だけ背景で消して描き直し，その範囲だけ画面に反映するクラス
+    画面Surfaceと同じblit・blits・fillを持つので，描画処理にはscreenの代わりに渡せる
+    """
+    def __init__(self, screen: pg.Surface, bg: pg.Surface, full: bool = False):
+        """
+        引数1 screen：画面Surface
+        引数2 bg：背景Surface（convert済みのもの）
+        引数3 full：Trueなら毎フレーム画面全体を描き直す（比較用）
+        """
+        self.screen = screen
+        self.bg = bg
+        self.full = full
+        self.area = screen.get_rect()
+        self.prev = []  # 前のフレームで描いた矩形
+        self.dirty = []  # このフレームで描いた矩形
+        self.force = True  # 次のフレームは全体を描き直す
+        self.whole = True  # このフレームは全体を画面に反映する
+        self.prev_drawn = False  # 前のフレームで描いた範囲が広かったか
+        self.rects = 0  # 直前のpresentで反映した矩形数（全体なら1）
+
+
+    def invalidate(self):
+        """
+        次のフレームを全体の描き直しにする（画面を塗りつぶしたときなど）
+        """
+        self.force = True
+
+
+    def begin(self):
+        """
+        前のフレームで描いた部分を背景で消す
+        """
+        self.whole = self.full or self.force
+        if self.whole:
+            self.screen.blit(self.bg, (0, 0))
+        elif self.prev:
+            self.screen.blits([(self.bg, rect, rect) for rect in self.prev], False)
+        self.force = False
+
+
+    def blit(self, source: pg.Surface, dest, area=None, special_flags: int = 0) -> pg.Rect:
+        rect = self.screen.blit(source, dest, area, special_flags)
+        self.dirty.append(rect)
+        return rect
+
+
+    def blits(self, blit_sequence, doreturn: bool = True) -> list[pg.Rect] | None:
+        rects = self.screen.blits(blit_sequence, True)
+        self.dirty.extend(rects)
+        return rects if doreturn else None
+
+
+    def fill(self, color, rect=None) -> pg.Rect:
+        """
+        塗りつぶす（背景が残らないので前後のフレームは全体を描き直す）
+        """
+        self.whole = True
+        self.force = True
+        return self.screen.fill(color, rect)
+
+
+    def present(self, show: bool = True):
+        """
+        描き直した範囲を画面に反映する
+        引数 show：Falseなら反映せず記録だけ進める（ヘッドレス用）
+        """
+        half = self.area.w * self.area.h // 2
+        drawn = len(self.dirty) > 256 or sum(rect.w*rect.h for rect in self.dirty) >= half  # 描いた範囲が広いか
+        whole = self.whole or drawn or self.prev_drawn  # 広いときは矩形ごとより全体の方が速い
+        if show:
+            if whole:
+                pg.display.update()
+            else:
+                pg.display.update(self.prev + self.dirty)  # 消した場所と描いた場所
+        self.rects = 1 if whole else len(self.prev) + len(self.dirty)
+        self.force = self.force or drawn  # 次のフレームも背景ごと描き直す
+        self.prev_drawn = drawn
+        self.prev, self.dirty = self.dirty, []
+
+
+
+def _no_lap(name: str):
+    pass
+
+
+
+class Profiler:
+    """
+    1フレームの処理時間を区間ごとに計るクラス
+    lapを呼ぶと前回のlapからの時間をその区間に足す．無効の間はlapが何もしない関数になる
+    """
+    def __init__(self, window: int = 300):
+        """
+        引数 window：統計に使う直近のフレーム数
+        """
+        self.window = window
+        self.enabled = False
+        self.overlay = False  # 画面に結果を重ねて表示するか
+        self.lap = _no_lap
+        self.frames = collections.deque(maxlen=window)  # 直近のフレーム時間（秒）
+        self.totals = {}  # 区間名: 直近windowフレームの合計時間の近似（秒）
+        self.current = {}  # 区間名: このフレームの時間（秒）
+        self.frame = 0  # 計測したフレーム数
+        self.start = self.last = 0.0
+        self.csv = None  # CSVの書き出し先
+        self.writer = None
+        self.panel = None  # 表示中のオーバーレイ画像
+
+
+    def enable(self, enabled: bool = True):
+        """
+        計測を有効・無効にする
+        """
+        self.enabled = enabled
+        self.lap = self._lap if enabled else _no_lap
+        self.current = {}
+        self.last = time.perf_counter()
+
+
+    def toggle_overlay(self):
+        """
+        オーバーレイの表示を切り替える（表示するときは計測も有効にする）
+        """
+        self.overlay = not self.overlay
+        if self.overlay and not self.enabled:
+            self.enable()
+        self.panel = None
+
+
+    def open_csv(self, path: str):
+        """
+        フレームごとの計測結果をCSVに書き出し始める
+        引数 path：CSVファイル名（1行に フレーム番号, 区間名, 値）
+        """
+        self.csv = open(path, "w", newline="")
+        self.writer = csv.writer(self.csv)
+        self.writer.writerow(["frame", "name", "value"])
+        if not self.enabled:
+            self.enable()
+
+
+    def close(self):
+        if self.csv is not None:
+            self.csv.close()
+            self.csv = None
+
+
+    def begin(self):
+        """
+        フレームの計測を始める
+        """
+        if self.enabled:
+            self.start = self.last = time.perf_counter()
+
+
+    def _lap(self, name: str):
+        now = time.perf_counter()
+        self.current[name] = self.current.get(name, 0.0) + now - self.last
+        self.last = now
+
+
+    def end(self, counts: dict):
+        """
+        フレームの計測を終えて記録する
+        引数 counts：グループ名: スプライト数の辞書
+        """
+        if not self.enabled:
+            return
+        self.lap("other")  # 最後のlapから後の時間
+        total = self.last - self.start
+        self.frame += 1
+        self.frames.append(total)
+        decay = 1 - 1/self.window  # 古いフレームほど小さく数える
+        for name in self.totals.keys() - self.current.keys():
+            self.totals[name] *= decay
+        for name, sec in self.current.items():
+            self.totals[name] = self.totals.get(name, 0.0) * decay + sec
+        if self.csv is not None:
+            rows = [(self.frame, "frame", f"{total*1000:.4f}")]
+            rows += [(self.frame, name, f"{sec*1000:.4f}") for name, sec in self.current.items()]
+            rows += [(self.frame, f"count.{name}", n) for name, n in counts.items()]
+            self.writer.writerows(rows)
+        if self.overlay and (self.panel is None or self.frame % 15 == 0):  # 数字が読めるよう15フレームごとに描き直す
+            self.panel = self._render(counts)
+        self.current = {}
+
+
+    def percentiles(self) -> dict:
+        """
+        戻り値：直近のフレーム時間の50・95・99パーセンタイル（ミリ秒）の辞書
+        """
+        if not self.frames:
+            return {}
+        ms = sorted(sec * 1000 for sec in self.frames)
+        return {f"p{p}": ms[min(len(ms)-1, len(ms)*p//100)] for p in (50, 95, 99)}
+
+
+    def summary(self) -> dict:
+        """
+        戻り値：パーセンタイルと区間ごとの平均時間（ミリ秒）の辞書
+        """
+        scale = 1000 / (min(self.frame, self.window) or 1)  # 減衰させた合計をおおよその平均に直す
+        phases = {name: sec * scale for name, sec in sorted(self.totals.items(), key=lambda item: -item[1])}
+        return {"frames": self.frame, **self.percentiles(), "phases": phases}
+
+
+    def _render(self, counts: dict) -> pg.Surface:
+        """
+        オーバーレイの画像を作る
+        """
+        font = TEXT.font(20)
+        summary = self.summary()
+        phases = list(summary["phases"].items())[:12]
+        lines = [" ".join(f"{k}={summary[k]:.1f}ms" for k in ("p50", "p95", "p99") if k in summary)]
+        lines += [" ".join(f"{name}:{n}" for name, n in counts.items() if n)]
+        width, height = 360, 16 * (len(lines) + len(phases)) + 8
+        panel = pg.Surface((width, height), pg.SRCALPHA)
+        panel.fill((0, 0, 0, 160))
+        y = 4
+        for line in lines:
+            panel.blit(font.render(line, True, (255, 255, 255)), (4, y))
+            y += 16
+        longest = max((ms for _, ms in phases), default=0) or 1
+        for name, ms in phases:
+            panel.fill((80, 200, 80), (150, y + 3, int(200 * ms / longest), 10))  # 区間ごとの棒
+            panel.blit(font.render(f"{name} {ms:.2f}", True, (255, 255, 255)), (4, y))
+            y += 16
+        return panel
+
+
+    def draw(self, screen):
+        """
+        オーバーレイを右上に表示する
+        引数 screen：描画先（Renderer）
+        """
+        if self.overlay and self.panel is not None:
+            screen.blit(self.panel, (WIDTH - self.panel.get_width() - 10, 10))
+
+
+
+class SpawnDirector:
+    """
+    敵の出現を波ごとにまとめて決めるクラス
+    時間とともに1波の数と出現方向を増やすが，生きている敵の数はmax_liveまでにし，
+    処理時間が予算に近づいたら1波の数を減らし，超えそうなら波を後回しにする
+    """
+    throttle = 0.7  # 予算に対してこの割合を超えたら1波の数を半分にする
+    defer = 0.9  # 予算に対してこの割合を超えたら波を後回しにする
+
+    def __init__(self, directions: int = 4, enemy_interval: int = 20, clown_interval: int = 100,
+                 max_live: int = 300, budget_ms: float = 1000 / FPS, max_directions: int = 36):
+        """
+        引数1 directions：初期の出現方向数
+        引数2 enemy_interval：敵の波の間隔（ステップ）
+        引数3 clown_interval：ピエロの波の間隔（ステップ）
+        引数4 max_live：同時に生きている敵とピエロの数の上限
+        引数5 budget_ms：描画1回あたりの処理時間の予算（ミリ秒）
+        引数6 max_directions：出現方向数の上限
+        """
+        self.directions = directions
+        self.enemy_interval = enemy_interval
+        self.clown_interval = clown_interval
+        self.max_live = max_live
+        self.budget_ms = budget_ms
+        self.max_directions = max_directions
+        self.per_wave = 1  # 1波あたりの敵の数
+        self.last_ramp = 0  # 最後に難易度を上げた時間（秒）
+        self.next_enemy = 0  # 次の敵の波のステップ
+        self.next_clown = 0  # 次のピエロの波のステップ
+        self.level = 0  # 処理の重さ（0：余裕あり，1：予算に近い，2：予算を超えそう）
+        self.spawned = 0  # 出現させた数
+        self.throttled = 0  # 数を減らした波の数
+        self.deferred = 0  # 後回しにした波の数
+        self.capped = 0  # 上限で出せなかった数
+
+
+    def pressure(self, frame_ms: float) -> int:
+        """
+        処理時間から重さの段階を求める
+        引数 frame_ms：描画1回あたりの処理時間（ミリ秒）
+        戻り値：0，1，2のいずれか
+        """
+        if frame_ms >= self.budget_ms * __class__.defer:
+            return 2
+        if frame_ms >= self.budget_ms * __class__.throttle:
+            return 1
+        return 0
+
+
+    def plan(self, tmr: int, live: int) -> tuple[int, int]:
+        """
+        このステップで出現させる数を決める
+        引数1 tmr：ステップ数
+        引数2 live：生きている敵とピエロの数
+        戻り値：(敵の数, ピエロの数)
+        """
+        seconds = tmr // FPS
+        if seconds - self.last_ramp >= 5:  # 5秒ごとに1波の数と出現方向を増やす
+            self.per_wave += 1
+            self.directions = min(self.directions + 2, self.max_directions)
+            self.last_ramp = seconds
+
+        room = max(0, self.max_live - live)
+        enemies = clowns = 0
+        if tmr >= self.next_enemy:
+            enemies, self.next_enemy = self._wave(tmr, self.per_wave, self.enemy_interval)
+            enemies = self._fit(enemies, room)
+            room -= enemies
+        if tmr >= self.next_clown:
+            clowns, self.next_clown = self._wave(tmr, 1, self.clown_interval)
+            clowns = self._fit(clowns, room)
+        return enemies, clowns
+
+
+    def _fit(self, size: int, room: int) -> int:
+        """
+        上限に収まる数に減らして出現数を記録する
+        """
+        fit = min(size, room)
+        self.capped += size - fit
+        self.spawned += fit
+        return fit
+
+
+    def _wave(self, tmr: int, size: int, interval: int) -> tuple[int, int]:
+        """
+        重さに応じて1波の数と次の波のステップを決める
+        戻り値：(この波の数, 次の波のステップ)
+        """
+        if self.level >= 2:
+            self.deferred += 1
+            return 0, tmr + max(1, interval // 4)  # 少し待ってからもう一度試す
+        if self.level == 1 and size > 1:
+            self.throttled += 1
+            size //= 2
+        return size, tmr + interval
+
+
+    def stats(self) -> dict:
+        """
+        戻り値：出現数，減らした波，後回しにした波，上限で出せなかった数，現在の1波の数と方向数の辞書
+        """
+        return {
+            "spawned": self.spawned,
+            "throttled": self.throttled,
+            "deferred": self.deferred,
+            "capped": self.capped,
+            "per_wave": self.per_wave,
+            "directions": self.directions,
+        }
+
+
+
+class Quality:
+    """
+    処理時間に応じて描画の品質を段階的に下げ，余裕ができたら戻すクラス
+    変えるのは描画する爆発の数・重力場の表現・画面外の間引きだけで，シミュレーションが読む値（ビームの回転画像など）には触れない
+    """
+    levels = [  # 段階ごとの設定（0が最高品質）
+        {"explosion_tail": None, "explosion_limit": None, "gravity_overlay": True, "cull": False},
+        {"explosion_tail": 50, "explosion_limit": 64, "gravity_overlay": True, "cull": True},
+        {"explosion_tail": 30, "explosion_limit": 16, "gravity_overlay": False, "cull": True},
+    ]
+    degrade = 0.9  # 予算に対してこの割合を超え続けたら品質を下げる
+    recover = 0.6  # 予算に対してこの割合を下回り続けたら品質を上げる
+
+    def __init__(self, budget_ms: float = 1000 / FPS, fixed: int | None = None, down_frames: int = 30, up_frames: int = 120):
+        """
+        引数1 budget_ms：描画1回あたりの処理時間の予算（ミリ秒）
+        引数2 fixed：品質を固定する段階（Noneなら処理時間に応じて変える）
+        引数3 down_frames：品質を下げるまでに予算超えが続くフレーム数
+        引数4 up_frames：品質を上げるまでに余裕のある状態が続くフレーム数
+        """
+        self.budget_ms = budget_ms
+        self.fixed = fixed
+        self.down_frames = down_frames
+        self.up_frames = up_frames
+        self.over = 0  # 予算超えが続いたフレーム数
+        self.under = 0  # 余裕のある状態が続いたフレーム数
+        self.changes = 0  # 段階を変えた回数
+        self.level = None
+        self.set_level(0 if fixed is None else fixed)
+
+
+    def set_level(self, level: int):
+        """
+        段階を変えて設定を反映する
+        """
+        level = max(0, min(level, len(__class__.levels) - 1))
+        if level == self.level:
+            return
+        if self.level is not None:
+            self.changes += 1
+        self.level = level
+        self.settings = __class__.levels[level]
+        self.over = self.under = 0
+
+
+    def update(self, frame_ms: float):
+        """
+        直近の処理時間から段階を決める（1フレームに1回呼ぶ）
+        引数 frame_ms：描画1回あたりの処理時間の移動平均（ミリ秒）
+        """
+        if self.fixed is not None:
+            return
+        if frame_ms > self.budget_ms * __class__.degrade:
+            self.over += 1
+            self.under = 0
+            if self.over >= self.down_frames:
+                self.set_level(self.level + 1)
+        elif frame_ms < self.budget_ms * __class__.recover:
+            self.under += 1
+            self.over = 0
+            if self.under >= self.up_frames:
+                self.set_level(self.level - 1)
+        else:  # 間にいる間はどちらにも動かさない
+            self.over = self.under = 0
+
+
+    def explosions(self, exps: pg.sprite.Group) -> list:
+        """
+        描画する爆発を選ぶ（品質が低いときは終わりかけのものだけを新しい順に上限まで）
+        """
+        tail, limit = self.settings["explosion_tail"], self.settings["explosion_limit"]
+        sprites = exps.sprites()
+        if tail is not None:
+            sprites = [exp for exp in sprites if exp.life < tail]
+        if limit is not None:
+            sprites = sprites[-limit:]
+        return sprites
+
+
+    def stats(self) -> dict:
+        """
+        戻り値：現在の段階と変えた回数の辞書
+        """
+        return {"level": self.level, "changes": self.changes}
+
+
+
+class Game:
+    """
+    1ゲーム分の状態を持ち，固定間隔のシミュレーション（step）と描画（draw）を分けて行うクラス
+    """
+    def __init__(self, spawn_directions: int = 4, enemy_interval: int = 20, clown_interval: int = 100,
+                 item_interval: int = 100, gravity_item_interval: int = 1000,
+                 boss_threshold: int = 1000, boss_health: int = 200, max_live: int = 300,
+                 pixel_collide: bool = False, invincible: bool = False):
+        """
+        引数1 spawn_directions：敵の初期の出現方向数
+        引数2 enemy_interval：敵の波の間隔（ステップ）
+        引数3 clown_interval：ピエロの波の間隔（ステップ）
+        引数4 item_interval：強化アイテムを出現させる間隔（ステップ）
+        引数5 gravity_item_interval：重力場発動アイテムを出現させる間隔（ステップ）
+        引数6 boss_threshold：ボスが出現するスコア
+        引数7 boss_health：ボスの体力
+        引数8 max_live：同時に生きている敵とピエロの数の上限
+        引数9 pixel_collide：Trueなら矩形で当たったものを画像の画素単位でも調べる（透明な角では当たらない）
+        引数10 invincible：Trueならこうかとんがやられない（ベンチマーク・耐久試験用）
+        """
+        self.bg_img = ASSETS.get("fig/pg_bg.jpg")
+        self.score = Score()
+        self.level_save = 0
+
+        self.bird = Bird(3, (900, 400))
+        self.beams = pg.sprite.Group()
+        self.boss_beams = BossBullets()  # ボスビームはスプライトを作らず配列で持つ
+        self.exps = pg.sprite.Group()
+        self.swarm = EnemySwarm() if np is not None else None  # 敵をまとめて動かす配列（NumPyがなければ使わない）
+        self.emys = SwarmGroup(self.swarm) if self.swarm is not None else pg.sprite.Group()
+        self.cemys = SwarmGroup(self.swarm) if self.swarm is not None else pg.sprite.Group()
+        self.gravities = pg.sprite.Group()
+        self.items = pg.sprite.Group()
+        self.gravityitems = pg.sprite.Group()
+        self.projectiles = Projectiles()  # スキルの飛び道具をまとめて動かす配列
+        self.drns = SwarmGroup(self.projectiles)  # ドリアンのグループ
+        self.balls = SwarmGroup(self.projectiles)  # サッカーボールのグループ
+        self.appearance = Appearance(self.score, boss_threshold, boss_health)
+
+        self.tmr = 0
+        self.beam_timer = 0  # 追加: ビーム発射のタイマー
+        self.director = SpawnDirector(spawn_directions, enemy_interval, clown_interval, max_live)  # 敵の出現の決定
+        self.item_interval = item_interval
+        self.gravity_item_interval = gravity_item_interval
+        self.xbeam = 1.0  # 初期のビーム倍率
+        self.beam_span = 0  # ビーム発射のスパン
+        self.item_count = 0  # アイテム獲得数
+        self.gameover_steps = GAMEOVER_STEPS  # やられた画面を見せるステップ数（ヘッドレスでは0）
+        self.invincible = bool(invincible)
+        self.grid = SpatialHash()  # 衝突判定の格子
+        self.collided = MASKS.collide if pixel_collide else None  # 矩形で当たった後の絞り込み
+        self.targets = TargetIndex(self.emys, self.cemys)  # ビームの狙う敵を探すインデックス
+        self.interp = Interpolation()
+        self.pools = {  # 頻繁に作っては消すスプライトのプール
+            "beams": Pool(Beam),
+            "exps": Pool(Explosion),
+            "emys": Pool(Enemy),
+            "cemys": Pool(ClownEnemy),
+        }
+        self.lifecycle = Lifecycle()  # 画面外や古いスプライトを間引く
+        for name, group in self.groups.items():
+            self.lifecycle.watch(name, group, POLICIES[name])
+        self.profiler = Profiler()  # 区間ごとの処理時間（既定では計らない）
+        self.quality = Quality()  # 描画の品質
+
+
+    @property
+    def groups(self) -> dict:
+        """
+        名前: スプライトグループの辞書
+        """
+        return {
+            "beams": self.beams, "boss_beams": self.boss_beams, "exps": self.exps, "emys": self.emys,
+            "cemys": self.cemys, "gravities": self.gravities, "items": self.items,
+            "gravityitems": self.gravityitems, "drns": self.drns, "balls": self.balls,
+        }
+
+
+    def handle(self, events: list) -> str | None:
+        """
+        どのシーンでも共通のイベントを処理する（スキルの選択はSkillSelectが行う）
+        引数 events：pg.eventのリスト
+        戻り値：ウィンドウが閉じられたら"quit"
+        """
+        for event in events:
+            if event.type == pg.QUIT:
+                return "quit"
+            if event.type == pg.KEYDOWN and event.key == pg.K_F3:  # F3で処理時間の表示を切り替える
+                self.profiler.toggle_overlay()
+        return None
+
+
+    def capture(self):
+        """
+        描画の補間用にステップ前の位置を記録する
+        """
+        self.boss_beams.capture()
+        if self.swarm is not None:
+            self.swarm.capture()  # 敵は配列で記録する
+            self.interp.capture(self.beams, self.drns, self.balls, extra=(self.bird, self.appearance.boss))
+        else:
+            self.interp.capture(self.beams, self.emys, self.cemys, self.drns, self.balls,
+                                extra=(self.bird, self.appearance.boss))
+
+
+    def step(self, key_lst) -> str | None:
+        """
+        シミュレーションを1ステップ進める
+        引数 key_lst：押下キーの真理値リスト
+        戻り値：やられたら"dead"，スキル選択画面に入ったら"pause"
+        """
+        lap = self.profiler.lap
+        self.fire()
+        lap("fire")
+        self.spawn()
+        lap("spawn")
+        result = self.collide()
+        if result is not None:  # やられたかスキル選択に入ったら残りの処理をしない
+            return result
+        self.advance(key_lst)
+        self.tmr += 1
+        return None
+
+
+    def fire(self):
+        """
+        定期的に自動発射
+        """
+        self.targets.invalidate()  # 前のステップで敵が動いたので作り直す
+        self.beam_timer += 1
+        if self.beam_span >= 29:
+            self.beam_span = 29
+        if self.beam_timer % (30 - self.beam_span) == 0:  # 30ステップごとにビームを自動発射
+            self.beams.add(self.pools["beams"].acquire(self.bird, self.xbeam, self.emys, self.cemys, self.appearance.boss_appeared, self.targets))  # emysグループを渡す
+            self.beam_timer = 0  # タイマーをリセット
+
+
+    def spawn(self):
+        """
+        敵・アイテム・ボスビームを出現させる
+        """
+        tmr, appearance = self.tmr, self.appearance
+        if not appearance.boss_appeared:  # ボスの出現中は敵を出さない
+            director = self.director
+            enemies, clowns = director.plan(tmr, len(self.emys) + len(self.cemys))
+            for _ in range(enemies):  # 敵の波（方向は出現方向の中からそれぞれ選ぶ）
+                self.emys.add(self.pools["emys"].acquire(self.bird, director.directions))
+            for _ in range(clowns):
+                self.cemys.add(self.pools["cemys"].acquire(self.bird, director.directions))
+
+        if tmr != 0:
+            if tmr%self.item_interval == 0:  # 100ステップに1回、強化アイテムを出現させる
+                self.items.add(Item())
+
+        if tmr != 0:
+            if tmr%self.gravity_item_interval == 0:  # 1000ステップに1回、重力場発動アイテムを出現させる
+                self.gravityitems.add(GravityItem())
+
+        if appearance.boss_appeared:
+            boss, bullets = appearance.boss, self.boss_beams
+            if boss.health <= 0:  # 倒したら残りのビームを消して撃つのをやめる
+                bullets.clear()
+            else:
+                if tmr%100 == 0:
+                    NeoBeam(boss, 3).fire(bullets)  # ボスが3本のビームを扇状に発射
+                if tmr%100 == 50 and boss.health*2 <= boss.max_health:  # 体力が半分を切ったら全方向にも撃つ
+                    NeoBeam(boss, 12, "ring").fire(bullets)
+                if tmr%6 == 0 and boss.health*4 <= boss.max_health:  # 4分の1を切ったら渦巻き状にも撃つ
+                    NeoBeam(boss, 2, "spiral").fire(bullets, tmr)
+
+
+    def reach(self) -> pg.Rect:
+        """
+        このステップで敵に当たりうるもの（こうかとん・ビーム・重力場・飛び道具の通り道）をすべて含む範囲
+        これと重ならない敵は何にも当たらないので，衝突判定の格子に登録しない
+        """
+        rects = [self.bird.rect, *(beam.rect for beam in self.beams), *(g.rect for g in self.gravities)]
+        return pg.Rect(0, 0, WIDTH, HEIGHT).unionall(rects + self.projectiles.areas())
+
+
+    def narrow(self, obj, sprites: list) -> list:
+        """
+        矩形で当たった候補を画素単位の判定で絞り込む（pixel_collideがFalseならそのまま返す）
+        引数1 obj：imageとrectを持つ判定の相手（こうかとん，ボス）
+        引数2 sprites：矩形が重なったスプライトのリスト
+        戻り値：当たったスプライトのリスト
+        """
+        collided = self.collided
+        if collided is None or not sprites:
+            return sprites
+        return [sprite for sprite in sprites if collided(obj, sprite)]
+
+
+    def collide(self) -> str | None:
+        """
+        衝突判定ブロック
+        戻り値：やられたら"dead"，スキル選択画面に入ったら"pause"
+        """
+        bird, score, exps, grid = self.bird, self.score, self.exps, self.grid
+        emys, cemys, beams = self.emys, self.cemys, self.beams
+        gravities = self.gravities
+        appearance = self.appearance
+        explode = self.pools["exps"].acquire
+        collided, narrow = self.collided, self.narrow
+        lap = self.profiler.lap
+
+        self.targets.invalidate()  # 出現した敵も狙えるようにする
+        grid.build(emys, cemys, beams, area=self.reach())  # このステップの衝突判定はすべて格子から求める
+        lap("collide.build")
+
+        # 通常の敵との衝突判定
+        if narrow(bird, grid.query(bird.rect, emys)) and not self.invincible:
+            bird.change_img(8)  # こうかとん悲しみエフェクト
+            return "dead"
+
+        # ピエロとの衝突判定
+        if narrow(bird, grid.query(bird.rect, cemys)) and not self.invincible:
+            bird.change_img(8)  # こうかとん悲しみエフェクト
+            return "dead"
+        lap("collide.bird")
+
+        for emy in grid.collide(emys, beams, True, True, collided).keys():
+            exps.add(explode(emy, 100))  # 爆発エフェクト
+            score.value += 10  # 10点アップ
+            bird.change_img(6)  # こうかとん喜びエフェクト
+
+            if int(score.value / 150) > self.level_save:  # 150点ごとにスキルの選択
+                bird.wait_skill = True
+                self.level_save = int(score.value / 150)
+
+        lap("collide.beams")
+        if bird.wait_skill:
+            return "pause"  # これがないと下のアップデートが実行されてしまうため必須
+
+        # スキルの飛び道具をまとめて動かし，通り道の敵を倒す（ドリアンは貫通，サッカーボールは反射）
+        boss = appearance.boss
+        target = boss.rect if boss and appearance.boss_visible and not boss.defeated else None
+        hit, damage = self.projectiles.step(grid, (emys, cemys), target)
+        self.projectiles.sync()
+        for emy in hit:
+            exps.add(explode(emy, 100))
+            score.value += 5
+            emy.kill()
+        if damage:
+            boss.health -= damage  # 当たるたびに体力を1減らす（ドリアンは1回の接触で1）
+        lap("collide.skills")
+
+        for cemy in grid.collide(cemys, beams, True, True, collided).keys():
+            exps.add(explode(cemy, 100))  # 爆発エフェクト
+            score.value += 10  # 10点アップ
+            bird.change_img(6)  # こうかとん喜びエフェクト
+            if int(score.value / 150) > self.level_save:  # 150点ごとにスキルの選択
+                bird.wait_skill = True
+                self.level_save = int(score.value / 150)
+
+        lap("collide.cemys")
+
+        for emy in grid.collide(emys, gravities, True, False).keys():
+            exps.add(explode(emy, 100))  # 爆発エフェクト
+            score.value += 10  # 10点アップ
+
+        for cemy in grid.collide(cemys, gravities, True, False).keys():
+            exps.add(explode(cemy, 100))  # 爆発エフェクト
+            score.value += 10  # 10点アップ
+
+        lap("collide.gravities")
+
+        for item in pg.sprite.spritecollide(bird, self.items, True, collided):  # こうかとんと強化アイテムがぶつかったら
+            self.xbeam += 0.2  # ビームの倍率をあげる
+            score.value += 10  # 10点アップ
+            if bird.speed <= 20:  # こうかとんのスピードの最大値を設定
+                bird.speed *= 1.1
+            self.item_count += 1
+            if self.item_count % 2 == 0:  # 2回に一回、アイテムを獲得するとビームのスパンをあげる
+                self.beam_span += 1
+            item.kill()  # 強化アイテムを削除する
+
+        for gitem in pg.sprite.spritecollide(bird, self.gravityitems, True, collided):  # こうかとんと重力場発動アイテムがぶつかったら
+            gravities.add(Gravity(80))
+            if appearance.boss_appeared:  # もしボスが現れている場合
+                appearance.boss.health -= 20  # 20ダメージを与える
+            gitem.kill()  # 重力場発動アイテムを削除する
+
+        lap("collide.items")
+
+        if self.boss_beams.hit(bird.rect, MASKS.get(bird.image) if collided else None) and not self.invincible:
+            bird.change_img(8)  # こうかとん悲しみエフェクト
+            return "dead"
+
+        if appearance.boss and appearance.boss_visible:
+            for beam in narrow(appearance.boss, grid.query(appearance.boss.rect, beams)):
+                appearance.boss.health -= 1  # ビームが当たるたびに体力を1減らす
+                beam.kill()  # ビームを消す
+
+            # ボス撃破時の爆発エフェクト生成
+            explosion = appearance.boss.update()
+            if explosion:
+                exps.add(explosion)
+        lap("collide.boss")
+        return None
+
+
+    def advance(self, key_lst):
+        """
+        こうかとん・ビーム・敵・エフェクトを1ステップ分動かす
+        引数 key_lst：押下キーの真理値リスト
+        """
+        lap = self.profiler.lap
+        self.bird.update(key_lst)
+        lap("update.bird")
+        self.targets.retarget(self.beams)  # 倒された敵を狙っていたビームは別の敵を狙う
+        lap("update.retarget")
+        self.beams.update(self.xbeam, self.appearance.boss)
+        lap("update.beams")
+        self.boss_beams.step()
+        lap("update.boss_beams")
+        if self.swarm is not None:
+            self.swarm.step(self.bird.rect)  # 通常の敵とピエロをまとめて動かす（Rectは読まれたときに書き戻す）
+        else:
+            self.emys.update()
+            self.cemys.update()
+        lap("update.enemies")
+        self.exps.update()
+        self.gravities.update()
+        lap("update.effects")
+        self.appearance.update(self.emys, self.cemys)
+        lap("update.appearance")
+        self.lifecycle.sweep()
+        lap("update.lifecycle")
+
+
+    def draw(self, screen: Renderer, alpha: float = 1.0):
+        """
+        現在の状態を描画する
+        引数1 screen：描画先のRenderer
+        引数2 alpha：直前のステップからの経過割合（位置の補間に使う）
+        """
+        interp, lap = self.interp, self.profiler.lap
+        quality = self.quality.settings
+        cull = quality["cull"]
+        screen.begin()  # 前のフレームで描いた部分を背景で消す
+        lap("draw.erase")
+        screen.blit(self.bird.image, interp.pos(self.bird, alpha))
+        interp.draw(self.beams, screen, alpha, cull)
+        lap("draw.beams")
+        self.boss_beams.draw(screen, alpha, cull)
+        lap("draw.boss_beams")
+        draw_enemies = interp.draw if self.swarm is None else self.swarm.draw  # 配列があれば配列の位置からまとめて描く
+        draw_enemies(self.emys, screen, alpha, cull)
+        lap("draw.emys")
+        interp.draw(self.quality.explosions(self.exps), screen, 1.0)
+        if quality["gravity_overlay"]:
+            interp.draw(self.gravities, screen, 1.0)
+        elif self.gravities:
+            screen.blits(Gravity.bands(), False)  # 半透明の全画面より安い表現
+        lap("draw.effects")
+        interp.draw(self.drns, screen, alpha)
+        interp.draw(self.balls, screen, alpha)  # スキル機能の描画
+        interp.draw(self.items, screen, 1.0)  # 強化アイテムを画面に描画
+        interp.draw(self.gravityitems, screen, 1.0)  # 重力場発動アイテムを画面に描画
+        lap("draw.items")
+        self.score.update(screen)
+        draw_enemies(self.cemys, screen, alpha, cull)
+        lap("draw.cemys")
+        boss = self.appearance.boss
+        self.appearance.draw(screen, interp.pos(boss, alpha) if boss else None)
+        lap("draw.appearance")
+        self.profiler.draw(screen)
+
+
+
+
+class Scene:
+    """
+    メインループが1ステップごとに進める画面の基底クラス
+    stepは次のシーン（変わらなければ自分）か，ゲームを終える理由の文字列を返す
+    """
+    idle = False  # Trueなら描いた後は変化がないので描き直さず，ループの間隔も空ける
+
+    def __init__(self, game: Game):
+        """
+        引数 game：進めるゲーム
+        """
+        self.game = game
+        self.shown = False  # idleのシーンを描画済みか
+
+
+    def step(self, key_lst, events: list) -> "Scene | str":
+        """
+        シーンを1ステップ進める
+        引数1 key_lst：押下キーの真理値リスト
+        引数2 events：このステップのイベントのリスト
+        戻り値：次のシーンか終了理由
+        """
+        return self
+
+
+    def draw(self, screen: Renderer, alpha: float):
+        """
+        シーンを描画する
+        引数1 screen：描画先のRenderer
+        引数2 alpha：直前のステップからの経過割合
+        """
+        self.game.draw(screen, alpha)
+
+
+
+class Play(Scene):
+    """
+    ゲームを進めるシーン
+    """
+    def step(self, key_lst, events: list) -> Scene | str:
+        scene = self.advance(key_lst)
+        if scene is not None:
+            return scene
+        boss = self.game.appearance.boss
+        return Victory(self.game) if boss and boss.defeated else self
+
+
+    def advance(self, key_lst) -> Scene | str | None:
+        """
+        ゲームを1ステップ進める
+        引数 key_lst：押下キーの真理値リスト
+        戻り値：やられたかスキル選択に入ったら次のシーンか終了理由，それ以外はNone
+        """
+        game = self.game
+        result = game.step(key_lst)
+        if result == "dead":
+            return GameOver(game) if game.gameover_steps > 0 else "dead"
+        if result == "pause":
+            return SkillSelect(game, self)  # 選んだ後はこのシーンに戻る
+        return None
+
+
+
+class SkillSelect(Scene):
+    """
+    スキル選択画面（選ぶまでゲームの時間は止まる）
+    キーボードでスキルの選択：1 ドリアン，2 サッカーボール
+    """
+    idle = True
+    skills = {pg.K_1: ("drns", Durian), pg.K_2: ("balls", Soccerball)}  # キー: (追加するグループ名, スキルのクラス)
+
+    def __init__(self, game: Game, resume: Scene):
+        """
+        引数1 game：進めるゲーム
+        引数2 resume：選んだ後に戻るシーン
+        """
+        super().__init__(game)
+        self.resume = resume
+
+
+    def step(self, key_lst, events: list) -> Scene | str:
+        game = self.game
+        for event in events:
+            if event.type == pg.KEYDOWN and event.key in __class__.skills:
+                name, skill = __class__.skills[event.key]
+                game.groups[name].add(skill(game.bird))
+                game.bird.wait_skill = False  # この画面を消す
+                return self.resume.step(key_lst, events)  # 選んだステップからゲームを再開する
+        return self
+
+
+    def draw(self, screen: Renderer, alpha: float):
+        screen.begin()
+        screen.fill((0, 0, 0))  # 黒画面
+        text = TEXT.render(50, "Select Skill - 1:Durian 2:Soccerball", (255, 255, 255))  # 書く文字と白色
+        screen.blit(text, ((WIDTH//4) - 20, HEIGHT//2))  # 描写位置
+        self.game.profiler.draw(screen)
+
+
+
+class GameOver(Scene):
+    """
+    やられた画面をgame.gameover_stepsステップ見せてから終わるシーン（キーを押せばすぐ終わる）
+    """
+    idle = True
+
+    def __init__(self, game: Game):
+        super().__init__(game)
+        self.left = game.gameover_steps  # 終わるまでの残りステップ数
+
+
+    def step(self, key_lst, events: list) -> Scene | str:
+        self.left -= 1
+        if self.left <= 0 or any(event.type == pg.KEYDOWN for event in events):
+            return "dead"
+        return self
+
+
+    def draw(self, screen: Renderer, alpha: float):
+        self.game.draw(screen, 1.0)
+        text = TEXT.render(150, "GAME OVER", (255, 0, 0))
+        screen.blit(text, text.get_rect(center=(WIDTH//2, HEIGHT//2)))
+
+
+
+class Victory(Play):
+    """
+    ボス撃破後もゲームを進め，クリア表示と爆発をしばらく見せてから終わるシーン
+    """
+    def __init__(self, game: Game):
+        super().__init__(game)
+        self.left = CLEAR_STEPS - 1  # 撃破したステップも数に入れる
+
+
+    def step(self, key_lst, events: list) -> Scene | str:
+        scene = self.advance(key_lst)
+        if scene is not None:
+            return scene
+        self.left -= 1
+        return "clear" if self.left <= 0 else self
+
+
+class Snapshot:
+    """
+    ゲームの状態を版付きの小さなバイナリ（structで詰めてzlibで圧縮）に書き出し・読み込むクラス
+    全てのスプライトグループ，こうかとん・ボス・出現の状態，間引きの記録，シーン，乱数の状態を含む
+    ステップの区切りで保存すれば，読み込んで続けても途切れずに続けた場合と同じように進む
+    """
+    magic = b"KKSV"  # ファイルの識別子
+    version = 2  # 形式の版（変えたら古いスナップショットは読み込まない．2：ビームの向きを角度で持つ）
+    header = struct.Struct("<4sHI")  # 識別子，形式の版，展開後の長さ
+    scenes = (Play, SkillSelect, GameOver, Victory)  # 番号: シーンのクラス
+    NO_TARGET = -1  # ビームが何も狙っていない
+    LOST = -2  # ビームが狙っていた敵はもういない（次のステップで狙い直す）
+
+    def __init__(self, data: bytes = b""):
+        """
+        引数 data：読み込むときは展開済みの中身（書き出すときは省略）
+        """
+        self.data = data
+        self.pos = 0  # 読み込み位置
+        self.chunks = []  # 書き出した断片
+
+
+    def put(self, fmt: str, *values):
+        self.chunks.append(struct.pack("<" + fmt, *values))
+
+
+    def get(self, fmt: str) -> tuple:
+        layout = struct.Struct("<" + fmt)
+        values = layout.unpack_from(self.data, self.pos)
+        self.pos += layout.size
+        return values
+
+
+    def put_array(self, code: str, values: list):
+        """
+        同じ型の値を個数付きで詰める（スプライトの属性を列ごとに並べると圧縮が効く）
+        """
+        self.put(f"I{len(values)}{code}", len(values), *values)
+
+
+    def get_array(self, code: str) -> list:
+        n, = self.get("I")
+        return list(self.get(f"{n}{code}"))
+
+
+    def put_str(self, text: str):
+        self.put_array("B", list(text.encode()))
+
+
+    def get_str(self) -> str:
+        return bytes(self.get_array("B")).decode()
+
+
+    @staticmethod
+    def _blank(cls: type, pool: Pool | None = None) -> pg.sprite.Sprite:
+        """
+        コンストラクタ（乱数を使うものがある）を通さずにスプライトを作る
+        引数1 cls：スプライトのクラス
+        引数2 pool：Pooledのときに戻し先にするPool
+        戻り値：属性が空のスプライト
+        """
+        obj = cls.__new__(cls)
+        pg.sprite.Sprite.__init__(obj)
+        if issubclass(cls, Pooled):
+            obj.pool, obj.generation = None, 0
+            if pool is not None:
+                pool.adopt(obj)
+        return obj
+
+
+    @classmethod
+    def dumps(cls, game: Game, scene: Scene, frame: int = 0) -> bytes:
+        """
+        ゲームの状態をバイト列にする
+        引数1 game：保存するゲーム
+        引数2 scene：そのときのシーン
+        引数3 frame：メインループのフレーム番号
+        戻り値：ヘッダ付きの圧縮済みバイト列
+        """
+        out = cls()
+        out.put("Ii", frame, game.tmr)
+        left = getattr(scene, "left", 0)
+        out.put("Bi", cls.scenes.index(type(scene)), left)
+        out._dump_state(game)
+        out._dump_sprites(game)
+        out._dump_lifecycle(game)
+        version, internal, gauss = random.getstate()
+        out.put("i", version)
+        out.put_array("I", list(internal))
+        out.put("?d", gauss is not None, gauss or 0.0)
+        body = b"".join(out.chunks)
+        return cls.header.pack(cls.magic, cls.version, len(body)) + zlib.compress(body)
+
+
+    @classmethod
+    def loads(cls, data: bytes) -> tuple[Game, Scene, int]:
+        """
+        dumpsのバイト列からゲームを作り直す（乱数の状態も戻す）
+        引数 data：dumpsが返したバイト列
+        戻り値：(ゲーム, シーン, フレーム番号)
+        """
+        magic, version, size = cls.header.unpack_from(data)
+        if magic != cls.magic:
+            raise ValueError("スナップショットではない")
+        if version != cls.version:  # 形式が違うと同じ状態に戻らない
+            raise ValueError(f"スナップショットの形式{version}は読み込めない（{cls.version}のみ）")
+        body = zlib.decompress(data[cls.header.size:])
+        if len(body) != size:
+            raise ValueError("スナップショットが壊れている")
+        src = cls(body)
+        frame, tmr = src.get("Ii")
+        kind, left = src.get("Bi")
+        game = src._load_state(tmr)
+        src._load_sprites(game)
+        src._load_lifecycle(game)
+        version, = src.get("i")
+        internal = tuple(src.get_array("I"))
+        has_gauss, gauss = src.get("?d")
+        random.setstate((version, internal, gauss if has_gauss else None))
+
+        scene = cls.scenes[kind]
+        if scene is SkillSelect:
+            scene = SkillSelect(game, Play(game))  # 選んだ後はPlayに戻る
+        else:
+            scene = scene(game)
+            if hasattr(scene, "left"):
+                scene.left = left
+        return game, scene, frame
+
+
+    @classmethod
+    def save(cls, path: str, game: Game, scene: Scene, frame: int = 0):
+        """
+        ゲームの状態をファイルに書き出す
+        """
+        with open(path, "wb") as f:
+            f.write(cls.dumps(game, scene, frame))
+
+
+    @classmethod
+    def load(cls, path: str) -> tuple[Game, Scene, int]:
+        """
+        ファイルからゲームを作り直す
+        戻り値：(ゲーム, シーン, フレーム番号)
+        """
+        with open(path, "rb") as f:
+            return cls.loads(f.read())
+
+
+    def _dump_state(self, game: Game):
+        """
+        Gameの数値，こうかとん，敵の出現，ボスの状態を詰める
+        """
+        self.put("iiidiiii??", game.score.value, game.level_save, game.beam_timer, game.xbeam, game.beam_span,
+                 game.item_count, game.item_interval, game.gravity_item_interval,
+                 game.invincible, game.collided is not None)
+        bird = game.bird
+        face = next((num for num in (6, 8) if bird.image is ASSETS.get(f"fig/{num}.png", 1.25)), 0)  # 0なら向きの画像
+        self.put("iiiiiiBdi?", *bird.rect, *bird.dire, face, bird.speed, bird.hyper_life, bird.wait_skill)
+        self.put_str(bird.state)
+        d = game.director
+        self.put("iiiidiiiiiiiiii", d.directions, d.enemy_interval, d.clown_interval, d.max_live, d.budget_ms,
+                 d.max_directions, d.per_wave, d.last_ramp, d.next_enemy, d.next_clown, d.level,
+                 d.spawned, d.throttled, d.deferred, d.capped)
+        a = game.appearance
+        self.put("ii?ii??", a.threshold, a.boss_health, a.boss_appeared, a.warning, a.flash_time, a.boss_visible,
+                 a.boss is not None)
+        if a.boss is not None:
+            boss = a.boss
+            self.put("iiii??ii", boss.rect.x, boss.rect.y, boss.health, boss.max_health, boss.appearing,
+                     boss.defeated, *boss.dire)
+
+
+    def _load_state(self, tmr: int) -> Game:
+        score, level_save, beam_timer, xbeam, beam_span, item_count, item_interval, gravity_item_interval, \
+            invincible, pixel = self.get("iiidiiii??")
+        game = Game(item_interval=item_interval, gravity_item_interval=gravity_item_interval, pixel_collide=pixel)
+        game.tmr, game.score.value, game.level_save, game.beam_timer = tmr, score, level_save, beam_timer
+        game.xbeam, game.beam_span, game.item_count = xbeam, beam_span, item_count
+        game.invincible = invincible
+        bird = game.bird
+        x, y, w, h, dx, dy, face, bird.speed, bird.hyper_life, bird.wait_skill = self.get("iiiiiiBdi?")
+        bird.rect = pg.Rect(x, y, w, h)
+        bird.dire = dx, dy
+        bird.image = ASSETS.get(f"fig/{face}.png", 1.25) if face else bird.imgs[bird.dire]
+        bird.state = self.get_str()
+        d = game.director
+        (d.directions, d.enemy_interval, d.clown_interval, d.max_live, d.budget_ms, d.max_directions, d.per_wave,
+         d.last_ramp, d.next_enemy, d.next_clown, d.level, d.spawned, d.throttled, d.deferred, d.capped) = self.get("iiiidiiiiiiiiii")
+        a = game.appearance
+        a.threshold, a.boss_health, a.boss_appeared, a.warning, a.flash_time, a.boss_visible, has_boss = self.get("ii?ii??")
+        if has_boss:
+            boss = a.boss = Boss()
+            x, y, boss.health, boss.max_health, boss.appearing, boss.defeated, dx, dy = self.get("iiii??ii")
+            boss.rect.topleft = x, y
+            boss.dire = dx, dy
+        return game
+
+
+    def _dump_sprites(self, game: Game):
+        """
+        スプライトグループを種類ごとに列にして詰める（グループ内の順番も保つ）
+        """
+        emys, cemys = game.emys.sprites(), game.cemys.sprites()
+        swarm = game.swarm
+        self.put_array("i", [v for e in emys for v in e.rect.topleft])
+        self.put_array("d", [e.speed for e in emys])
+        self.put_array("?", [e.visible for e in emys])
+        self.put_array("i", [v for e in cemys for v in e.rect.topleft])
+        rows = []
+        for e in cemys:
+            if swarm is not None:  # 速度と位相は配列の方が新しい
+                i = swarm.slots[e]
+                rows += [e.base_speed, e.speed, e.points, float(swarm.vx[i]), float(swarm.vy[i]), float(swarm.phase[i])]
+            else:
+                rows += [e.base_speed, e.speed, e.points, e.vx, e.vy, e.movement_phase]
+        self.put_array("d", rows)
+
+        index = {e: i for i, e in enumerate(emys + cemys)}  # ビームの狙う敵は番号で表す
+        targets = []
+        for beam in game.beams:
+            if beam.target is None:
+                targets.append(__class__.NO_TARGET)
+            else:
+                targets.append(index[beam.target] if beam.target_alive() else __class__.LOST)
+        beams = game.beams.sprites()
+        self.put_array("i", [v for b in beams for v in b.rect])
+        self.put_array("i", targets)
+        self.put_array("?", [bool(b.appearance) for b in beams])
+        self.put_array("d", [b.bucket * Beam.rotations.step for b in beams])  # 刻みが変わっても同じ向きに戻せるように角度で持つ
+        self.put_array("d", [v for b in beams for v in (b.speed, b.vx, b.vy, b.scale)])
+
+        exps = game.exps.sprites()
+        self.put_array("i", [v for x in exps for v in (*x.rect.center, x.life)])
+        self.put_array("i", [g.life for g in game.gravities])
+        self.put_array("i", [v for item in game.items for v in item.rect.topleft])
+        self.put_array("i", [v for item in game.gravityitems for v in item.rect.topleft])
+
+        proj = game.projectiles
+        for group in (game.drns, game.balls):
+            rows = [proj.slots[s] for s in group]
+            self.put_array("d", [v for i in rows for v in (proj.x[i], proj.y[i], proj.vx[i], proj.vy[i], proj.speed[i])])
+            self.put_array("?", [proj.touching[i] for i in rows])
+
+        self.put("d", BossBullets.rotations[0].step)  # 画像の番号は回転の刻みによって意味が変わる
+        for name, values in game.boss_beams.dump().items():
+            self.put_array("i" if name == "image" else "d", values)
+
+
+    def _load_sprites(self, game: Game):
+        bird, pools = game.bird, game.pools
+        xy = self.get_array("i")
+        speeds = self.get_array("d")
+        visible = self.get_array("?")
+        for i, speed in enumerate(speeds):
+            e = self._blank(Enemy, pools["emys"])
+            e.image = ASSETS.get("fig/alien1.png", 0.5)
+            e.rect = e.image.get_rect(topleft=(xy[2*i], xy[2*i+1]))
+            e.player, e.speed, e.visible = bird, speed, visible[i]
+            game.emys.add(e)
+        xy = self.get_array("i")
+        rows = self.get_array("d")
+        for i in range(len(xy) // 2):
+            e = self._blank(ClownEnemy, pools["cemys"])
+            e.image = ASSETS.get("fig/images.jpg", 0.25)
+            e.rect = e.image.get_rect(topleft=(xy[2*i], xy[2*i+1]))
+            e.player = bird
+            e.base_speed, e.speed, e.points, e.vx, e.vy, e.movement_phase = rows[6*i:6*i+6]
+            game.cemys.add(e)  # 配列にはここで写される
+
+        enemies = game.emys.sprites() + game.cemys.sprites()
+        lost = pg.sprite.Sprite()  # どのグループにも入らない（倒された敵の代わり）
+        rects = self.get_array("i")
+        targets = self.get_array("i")
+        appearance = self.get_array("?")
+        angles = self.get_array("d")
+        rows = self.get_array("d")
+        for i, target in enumerate(targets):
+            beam = self._blank(Beam, pools["beams"])
+            beam.rect = pg.Rect(rects[4*i:4*i+4])
+            beam.appearance = appearance[i]
+            beam.speed, beam.vx, beam.vy, beam.scale = rows[4*i:4*i+4]
+            beam.bucket = Beam.rotations.bucket(angles[i])
+            beam.image = Beam.rotations.get(beam.bucket, beam.scale)
+            beam.aim(None if target == __class__.NO_TARGET else lost if target == __class__.LOST else enemies[target])
+            game.beams.add(beam)
+
+        rows = self.get_array("i")
+        for i in range(0, len(rows), 3):
+            exp = self._blank(Explosion, pools["exps"])
+            exp.imgs = [ASSETS.get(*key) for key in Explosion.variants()]
+            exp.life = rows[i+2]
+            exp.image = exp.imgs[exp.life//10%2]
+            exp.rect = exp.image.get_rect(center=(rows[i], rows[i+1]))
+            game.exps.add(exp)
+        for life in self.get_array("i"):
+            game.gravities.add(Gravity(life))
+        for group, cls, image in ((game.items, Item, ("fig/kouseki_colorful.png", 0.1)),
+                                  (game.gravityitems, GravityItem, ("fig/bakudan.png", 0.15))):
+            xy = self.get_array("i")
+            for i in range(0, len(xy), 2):
+                item = self._blank(cls)
+                item.image = ASSETS.get(*image)
+                item.rect = item.image.get_rect(topleft=(xy[i], xy[i+1]))
+                group.add(item)
+
+        proj = game.projectiles
+        for group, cls in ((game.drns, Durian), (game.balls, Soccerball)):
+            rows = self.get_array("d")
+            touching = self.get_array("?")
+            for i in range(len(touching)):
+                x, y, vx, vy, speed = rows[5*i:5*i+5]
+                sprite = cls(bird)
+                sprite.rect.topleft = round(x), round(y)
+                sprite.vx, sprite.vy, sprite.speed = int(vx), int(vy), speed
+                group.add(sprite)
+                j = proj.slots[sprite]
+                proj.x[j], proj.y[j], proj.touching[j] = x, y, touching[i]
+
+        step, = self.get("d")
+        columns = {name: self.get_array("i" if name == "image" else "d") for name in BossBullets.columns}
+        if step != BossBullets.rotations[0].step:  # 保存したときの刻みの番号を今の刻みの番号に直す
+            saved = max(1, round(360 / step))
+            images = []
+            for image in columns["image"]:
+                rotations = BossBullets.rotations[image // saved]
+                images.append(image // saved * rotations.size + rotations.bucket(image % saved * step))
+            columns["image"] = images
+        game.boss_beams.load(columns)
+
+
+    def _dump_lifecycle(self, game: Game):
+        """
+        間引きの記録（アイテムの年齢を含む）を詰める
+        """
+        lifecycle = game.lifecycle
+        self.put("I", lifecycle.tick)
+        for name, (group, policy) in lifecycle.watched.items():
+            culled = lifecycle.culled[name]
+            self.put("IIII", lifecycle.peaks[name], culled["margin"], culled["age"], culled["count"])
+            if policy.max_age is not None:
+                born = lifecycle.born[name]
+                self.put_array("i", [born[s][1] if s in born else -1 for s in group])  # 入ったステップ（未記録は-1）
+
+
+    def _load_lifecycle(self, game: Game):
+        lifecycle = game.lifecycle
+        lifecycle.tick, = self.get("I")
+        for name, (group, policy) in lifecycle.watched.items():
+            peak, margin, age, count = self.get("IIII")
+            lifecycle.peaks[name] = peak
+            lifecycle.culled[name] = {"margin": margin, "age": age, "count": count}
+            if policy.max_age is not None:
+                stamps = self.get_array("i")
+                lifecycle.born[name] = {s: (getattr(s, "generation", 0), tick) for s, tick in zip(group, stamps) if tick >= 0}
+
+
+
+def main(headless: bool = False, frames: int | None = None, control=None, full_redraw: bool = False,
+         profile: bool = False, profile_csv: str | None = None,
+         seed: int | None = None, record: str | None = None, replay: str | None = None,
+         params: dict | None = None, quality: int | None = None,
+         resume: str | None = None, snapshot: str | None = None, snapshot_at: int | None = None) -> dict:
+    """
+    ゲームのメインループ
+    シミュレーションはFPS回/秒の固定間隔で進め，描画が遅れたときは1フレームで最大MAX_STEPS回まで追いつく
+    プレイ・スキル選択・ゲームオーバー・クリアの各シーンはこのループの1ステップずつ進み，待ち時間で止めることはない
+    ウィンドウ表示時は画像とフォントを別スレッドで用意する間，読み込み画面を出す
+    引数1 headless：Trueなら1ループ1ステップで進め，画面更新・フレーム待ち・停止演出を行わない
+    引数2 frames：実行するステップ数（Noneなら終了するまで）
+    引数3 control：入力元（poll・pressure・watchを持つ．Noneならheadless時はScriptedInput，それ以外はKeyboard）
+    引数4 full_redraw：Trueなら変化した部分だけでなく毎フレーム画面全体を描き直す
+    引数5 profile：Trueなら区間ごとの処理時間を計る（F3キーでも計測と表示を切り替えられる）
+    引数6 profile_csv：フレームごとの処理時間を書き出すCSVファイル名
+    引数7 seed：乱数シード（Noneなら固定しない）
+    引数8 record：入力とシードを記録するファイル名
+    引数9 replay：再生する記録ファイル名（シード・入力・描画品質は記録のものを使い，framesがNoneなら記録の長さだけ進める．画像が記録時と違えば警告する）
+    引数10 params：Gameに渡す調整用の引数の辞書（出現間隔やボスの体力など）
+    引数11 quality：描画品質の段階を固定する（Noneならウィンドウ表示時は処理時間に応じて変え，headless時は0に固定する）
+    引数12 resume：続きから始めるスナップショットのファイル名（フレーム番号も続きから数える）
+    引数13 snapshot：スナップショットを書き出すファイル名（F5キーでも書き出す）
+    引数14 snapshot_at：このフレームを進めた直後にスナップショットを書き出す
+    戻り値：終了理由，スコア，ステップ数，スプライト数とその最大値，間引いた数，実行時間，起動時間（計測時は処理時間も）の辞書
+    """
+    if resume and (record or replay):  # 記録はシードから始めたゲームしか再生できない
+        raise ValueError("resumeはrecord・replayと同時に使えない")
+    pg.display.set_caption("こうかとんサバイバー")
+    screen = pg.display.set_mode((WIDTH, HEIGHT))
+    startup = {"window": process_uptime()}  # プロセス開始からの秒数
+    if headless:
+        ASSETS.load_all()  # 画面生成後に全画像を一度だけ読み込む
+        TEXT.load_all()  # 固定の文字列も先に描画しておく
+    else:
+        loader = Loader(ASSETS, TEXT).start()  # 読み込みの間も画面を出して応答する
+        while not loader.ready():
+            if any(event.type == pg.QUIT for event in pg.event.get()):
+                return {"result": "quit", "seed": seed, "score": 0, "frames": 0, "startup": startup}
+            loader.draw(screen)
+            pg.display.update()
+            loader.wait(1 / RENDER_FPS)  # 読み込みが終われば1フレーム分待たずに始める
+        loader.finish()
+    startup["loaded"] = process_uptime()
+
+    if replay:
+        control = Replay(replay)
+        seed, params = control.seed, control.params
+        if frames is None:
+            frames = control.frames
+        if control.assets != ASSETS.digest():  # 画像が違うと当たり判定のマスクも変わる
+            warnings.warn(f"{replay}: 記録したときと画像が違うので同じ結果にならないことがある", RuntimeWarning)
+        if quality is None:
+            quality = control.quality
+        elif control.quality is not None and quality != control.quality:
+            warnings.warn(f"{replay}: 記録したときの描画品質は{control.quality}（今回は{quality}）", RuntimeWarning)
+    if headless and quality is None:
+        quality = 0  # 負荷で段階が変わると実行ごとに描画の処理が変わるので固定する
+    if control is None:
+        control = ScriptedInput() if headless else Keyboard()
+    if record:
+        if seed is None:
+            seed = random.randrange(2**32)  # 再生できるようにシードを決めておく
+        control = recorder = Recorder(control, record, seed, params, quality, ASSETS.digest())
+    frame = 0  # スキル選択画面も含めたステップ数
+    if resume:
+        game, scene, frame = Snapshot.load(resume)  # 乱数の状態も保存したときに戻る
+        startup["resumed"] = process_uptime()
+    else:
+        if seed is not None:
+            random.seed(seed)
+        game = Game(**(params or {}))
+        scene = Play(game)
+    control.watch(WorldView(game))  # ボットが見るゲーム（他の入力元は使わない）
+    if headless:
+        game.gameover_steps = 0  # やられた画面を見せずにすぐ終わる
+    game.quality = Quality(fixed=quality)
+    renderer = Renderer(screen, game.bg_img, full_redraw)
+    prof = game.profiler
+    if profile:
+        prof.enable()
+    if profile_csv:
+        prof.open_csv(profile_csv)
+    clock = pg.time.Clock()
+
+    start = time.perf_counter()
+    last = start
+    lag = 0.0  # まだシミュレーションしていない経過時間（秒）
+    load_ms = 0.0  # 描画1回あたりの処理時間（待ち時間を除く）の移動平均（ミリ秒）
+
+    def finish(reason: str) -> dict:
+        """
+        実行結果をまとめる
+        引数 reason：終了理由（"quit"，"dead"，"clear"，"frames"）
+        """
+        elapsed = time.perf_counter() - start
+        prof.close()
+        if record:
+            recorder.save()
+        result = {
+            "result": reason,
+            "seed": seed,
+            "score": game.score.value,
+            "frames": frame,
+            "tmr": game.tmr,
+            "counts": game.lifecycle.counts(),
+            "culled": game.lifecycle.culled,
+            "peaks": game.lifecycle.peaks,
+            "pools": {name: pool.stats() for name, pool in game.pools.items()},
+            "text": TEXT.stats(),
+            "masks": MASKS.stats(),
+            "spawn": game.director.stats(),
+            "quality": game.quality.stats(),
+            "elapsed": elapsed,
+            "fps": frame / elapsed if elapsed > 0 else 0.0,
+            "startup": startup,
+        }
+        if prof.enabled:
+            result["profile"] = prof.summary()
+        return result
+
+    while frames is None or frame < frames:
+        prof.begin()
+        busy = time.perf_counter()
+        if headless:
+            steps = 1
+        else:
+            now = time.perf_counter()
+            lag += now - last
+            last = now
+            steps = min(int(lag / STEP), MAX_STEPS)
+            lag -= steps * STEP
+            if steps == MAX_STEPS:
+                lag = min(lag, STEP)  # 追いつけない分は捨てて処理落ちの連鎖を防ぐ
+        for i in range(steps):
+            frame += 1
+            key_lst, events = control.poll(frame, game.bird)
+            prof.lap("input")  # ボットが操作するときはその判断の時間
+            if game.handle(events) == "quit":
+                return finish("quit")
+            if i == steps - 1 and not headless:
+                game.capture()
+            game.director.level = control.pressure(frame, game.director.pressure(load_ms))
+            if any(event.type == pg.WINDOWEXPOSED for event in events):  # 隠れていた画面を描き直す
+                scene.shown = False
+                renderer.invalidate()
+            prof.lap("events")
+            result = scene.step(key_lst, events)
+            if isinstance(result, str):
+                if result == "dead" and not scene.idle:  # GameOverを経ずに終わるときもやられた画面を残す
+                    game.draw(renderer)
+                    renderer.present(not headless)
+                return finish(result)
+            scene = result
+            if frame == snapshot_at or any(event.type == pg.KEYDOWN and event.key == pg.K_F5 for event in events):
+                Snapshot.save(snapshot or "snapshot.kks", game, scene, frame)  # このステップを終えた状態
+            if frames is not None and frame >= frames:
+                break
+        if not (scene.idle and scene.shown):  # 変化のないシーンは一度だけ描く
+            scene.draw(renderer, 1.0 if headless else lag / STEP)
+            renderer.present(not headless)
+            scene.shown = True
+        if "interactive" not in startup:  # 操作できる最初のフレームを出した時点
+            startup["interactive"] = process_uptime()
+        prof.lap("present")
+        load_ms += ((time.perf_counter() - busy) * 1000 - load_ms) * 0.1
+        game.quality.update(load_ms)
+        if not headless:
+            clock.tick(IDLE_FPS if scene.idle else RENDER_FPS)  # 入力を待つだけの間は間隔を空ける
+            prof.lap("wait")
+        if prof.enabled:
+            prof.end(game.lifecycle.counts())
+
+    return finish("frames")
+
+
+
+def run_headless(frames: int | None, control=None, seed: int | None = None, full_redraw: bool = False,
+                 profile: bool = False, profile_csv: str | None = None,
+                 record: str | None = None, replay: str | None = None, params: dict | None = None,
+                 quality: int | None = None, resume: str | None = None, snapshot: str | None = None,
+                 snapshot_at: int | None = None) -> dict:
+    """
+    SDLのダミードライバでウィンドウを出さずにフレーム上限なしで実行する
+    引数1 frames：実行するフレーム数（Noneなら終了するまで）
+    引数2 control：入力元（Noneなら何も押さないScriptedInput，ボットに操作させるならAutoplayer）
+    引数3 seed：乱数シード（Noneなら固定しない）
+    引数4 full_redraw：Trueなら毎フレーム画面全体を描き直す
+    引数5 profile：Trueなら区間ごとの処理時間を計る
+    引数6 profile_csv：フレームごとの処理時間を書き出すCSVファイル名
+    引数7 record：入力とシードを記録するファイル名
+    引数8 replay：再生する記録ファイル名
+    引数9 params：Gameに渡す調整用の引数の辞書
+    引数10 quality：描画品質の段階（Noneなら最高品質の0に固定する）
+    引数11 resume：続きから始めるスナップショットのファイル名
+    引数12 snapshot：スナップショットを書き出すファイル名
+    引数13 snapshot_at：スナップショットを書き出すフレーム番号
+    戻り値：mainの実行結果
+    """
+    os.environ["SDL_VIDEODRIVER"] = "dummy"
+    os.environ["SDL_AUDIODRIVER"] = "dummy"
+    if pg.display.get_init() and pg.display.get_driver() != "dummy":
+        pg.display.quit()  # 既に実ドライバで初期化されていたら作り直す
+    pg.display.init()  # 音は使わないので画面と文字だけ初期化する
+    pg.font.init()
+    return main(headless=True, frames=frames, control=control, full_redraw=full_redraw,
+                profile=profile, profile_csv=profile_csv, seed=seed, record=record, replay=replay, params=params,
+                quality=quality, resume=resume, snapshot=snapshot, snapshot_at=snapshot_at)
+
 
-        bird.update(key_lst, screen)
-        beams.update(xbeam, appearance.boss)
-        beams.draw(screen)
-        boss_beams.update()
-        boss_beams.draw(screen)
-        emys.update()
-        emys.draw(screen)
-        exps.update()
-        exps.draw(screen)
-        gravities.update()
-        gravities.draw(screen)
-        drns.update()
-        drns.draw(screen)
-        balls.draw(screen)  # スキル機能の描画
-        items.draw(screen)  # 強化アイテムを画面に描画
-        gravityitems.draw(screen)  # 重力場発動アイテムを画面に描画
-        score.update(screen)
-        cemys.update()
-        cemys.draw(screen)
-        appearance.__update__(screen, emys, cemys)
-        
-        pg.display.update()
-        tmr += 1
-        clock.tick(50)
-        
-        
 
 if __name__ == "__main__":
-    pg.init()
-    main()
+    import argparse
+    parser = argparse.ArgumentParser(description="こうかとんサバイバー")
+    parser.add_argument("--headless", action="store_true", help="ウィンドウを出さずにフレーム上限なしで実行する")
+    parser.add_argument("--frames", type=int, default=None, help="ヘッドレス実行のフレーム数（既定は3000，再生時は記録の長さ）")
+    parser.add_argument("--seed", type=int, default=None, help="乱数シード")
+    parser.add_argument("--full-redraw", action="store_true", help="変化した部分だけでなく毎フレーム画面全体を描き直す")
+    parser.add_argument("--profile", action="store_true", help="区間ごとの処理時間を計る（ウィンドウ表示中はF3でも切り替えられる．終了時に起動時間も表示する）")
+    parser.add_argument("--profile-csv", help="フレームごとの処理時間を書き出すCSVファイル")
+    parser.add_argument("--record", help="シードと入力を記録するファイル")
+    parser.add_argument("--replay", help="記録した入力を再生するファイル")
+    parser.add_argument("--autoplay", action="store_true", help="ボットに操作させる（耐久試験用，ウィンドウ表示でも使える）")
+    parser.add_argument("--bake", action="store_true", help="画像のアトラスを作り直して終了する（通常は元画像が変わったときに自動で作り直す）")
+    parser.add_argument("--resume", help="スナップショットから続きを始める")
+    parser.add_argument("--snapshot", help="スナップショットを書き出すファイル（F5キーでも書き出す．既定はsnapshot.kks）")
+    parser.add_argument("--snapshot-at", type=int, help="このフレームを進めた直後にスナップショットを書き出す")
+    parser.add_argument("--param", action="append", default=[], metavar="NAME=VALUE", help="Gameの調整用の整数の引数（例：boss_threshold=150）")
+    parser.add_argument("--pixel-collide", action="store_true", help="矩形で当たったものを画素単位でも調べる（透明な角では当たらない）")
+    parser.add_argument("--quality", type=int, choices=range(len(Quality.levels)), help="描画品質を固定する（0が最高，省略時はウィンドウ表示なら処理時間に応じて変え，--headlessなら0）")
+    args = parser.parse_args()
+    params = {name: int(value) for name, _, value in (param.partition("=") for param in args.param)}
+    if args.pixel_collide:
+        params["pixel_collide"] = True
+    options = dict(control=Autoplayer() if args.autoplay else None, seed=args.seed, full_redraw=args.full_redraw, profile=args.profile,
+                   profile_csv=args.profile_csv, record=args.record, replay=args.replay, quality=args.quality,
+                   params=params or None,
+                   resume=args.resume, snapshot=args.snapshot, snapshot_at=args.snapshot_at)
+    if args.bake:
+        os.environ["SDL_VIDEODRIVER"] = "dummy"  # ウィンドウは出さない
+        pg.display.init()
+        pg.display.set_mode((1, 1))
+        ASSETS.load_all(rebake=True)
+        print(ASSETS.stats())
+    elif args.headless:
+        frames = args.frames if args.frames is not None or args.replay else 3000
+        print(run_headless(frames, **options))
+    else:
+        pg.display.init()  # 音は使わないので画面と文字だけ初期化する（音声デバイスの初期化を待たない）
+        pg.font.init()
+        startup = main(frames=args.frames, **options)["startup"]
+        if args.profile:  # 起動時間は計測するときだけ出す
+            print(" ".join(f"{name}={sec*1000:.0f}ms" for name, sec in startup.items()))
     pg.quit()
     sys.exit()
@@ -0,0 +1,349 @@
+import math
+import os
+import random
+import sys
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pygame as pg
+import pytest
+
+import koukaton_survivor as ks
+
+
+@pytest.fixture(scope="module", autouse=True)
+def display(tmp_path_factory):
+    ks.ASSETS.atlas = str(tmp_path_factory.mktemp("cache") / "atlas")  # 利用者のキャッシュには書かない
+    pg.display.init()
+    pg.display.set_mode((1, 1))
+    yield
+    pg.display.quit()
+
+
+def pixels(img: pg.Surface) -> bytes:
+    return pg.image.tobytes(img, "RGBA")
+
+
+def test_atlas_cold_and_warm_are_identical(tmp_path):
+    # 元画像から作った画像とアトラスから読み込んだ画像は画素も当たり判定のマスクも同じ
+    cold = ks.AssetRegistry(str(tmp_path / "atlas"))
+    cold.load_all(rebake=True)
+    warm = ks.AssetRegistry(str(tmp_path / "atlas"))
+    warm.load_all()
+    assert cold.atlas_state == "baked" and warm.atlas_state == "loaded"
+    for key in cold.variants():
+        a, b = cold.find(*key), warm.find(*key)
+        assert a.get_size() == b.get_size(), key
+        assert pixels(a) == pixels(b), key
+        ma, mb = pg.mask.from_surface(a), pg.mask.from_surface(b)
+        assert ma.count() == mb.count() == ma.overlap_area(mb, (0, 0)), key
+    assert cold.digest() == warm.digest()
+
+
+def test_atlas_rebakes_only_changed_keys(tmp_path, monkeypatch):
+    # 使うキーが増えても既存のキーはアトラスから読み，足りない分だけ作る
+    ks.AssetRegistry(str(tmp_path / "atlas")).load_all(rebake=True)
+    extra = ("fig/beam.png", 1.0, 7, (False, False))
+    variants = ks.AssetRegistry.variants
+    monkeypatch.setattr(ks.AssetRegistry, "variants", lambda self: variants(self) + [extra])
+    assets = ks.AssetRegistry(str(tmp_path / "atlas"))
+    assets.load_all()
+    assert assets.atlas_state == "baked"
+    assert extra not in assets.baked and len(assets.baked) == len(assets.variants()) - 1
+    again = ks.AssetRegistry(str(tmp_path / "atlas"))
+    again.load_all()
+    assert again.atlas_state == "loaded" and extra in again.baked
+
+
+def test_atlas_rejects_pixels_from_another_write(tmp_path):
+    # 同じ大きさでも目録と組になっていない画素は使わずに作り直す
+    ks.AssetRegistry(str(tmp_path / "atlas")).load_all(rebake=True)
+    with open(tmp_path / "atlas.rgba", "r+b") as f:
+        data = bytearray(f.read())
+        data[len(data) // 2] ^= 0xFF
+        f.seek(0)
+        f.write(data)
+    assets = ks.AssetRegistry(str(tmp_path / "atlas"))
+    assets.load_all()
+    assert assets.atlas_state == "baked"
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["atlas.json", "atlas.rgba"]  # 一時ファイルは残らない
+
+
+class Box(pg.sprite.Sprite):
+    def __init__(self, rect: pg.Rect):
+        super().__init__()
+        self.rect = pg.Rect(rect)
+
+
+def boxes(rng: random.Random, n: int, size: int) -> list[pg.Rect]:
+    return [pg.Rect(rng.randrange(-50, ks.WIDTH), rng.randrange(-50, ks.HEIGHT),
+                    rng.randrange(1, size), rng.randrange(1, size)) for _ in range(n)]
+
+
+def labels(hits: dict) -> list:
+    return [(a.label, [b.label for b in bs]) for a, bs in hits.items()]
+
+
+@pytest.mark.parametrize("register_b", [False, True])
+@pytest.mark.parametrize("dokilla, dokillb", [(False, False), (True, False), (False, True), (True, True)])
+def test_spatial_hash_matches_groupcollide(dokilla, dokillb, register_b):
+    rng = random.Random(5)
+    rects = boxes(rng, 60, 120), boxes(rng, 200, 40)
+    hashed, plain = [], []
+    for groups in (hashed, plain):
+        for name, rs in zip("ab", rects):
+            group = pg.sprite.Group()
+            for i, r in enumerate(rs):
+                sprite = Box(r)
+                sprite.label = name, i
+                group.add(sprite)
+            groups.append(group)
+    grid = ks.SpatialHash(64)
+    grid.build(*(hashed if register_b else hashed[:1]))
+    got = grid.collide(*hashed, dokilla, dokillb)
+    want = pg.sprite.groupcollide(*plain, dokilla, dokillb)
+    # 組も並び順も同じで，先にkillされたbは後のaの結果に入らない
+    assert labels(got) == labels(want)
+    for h, p in zip(hashed, plain):
+        assert sorted(s.label for s in h) == sorted(s.label for s in p)
+
+
+def test_target_index_matches_linear_scan():
+    rng = random.Random(3)
+    groups = pg.sprite.Group(), pg.sprite.Group()
+    for group, n in zip(groups, (150, 40)):
+        for r in boxes(rng, n, 60):
+            group.add(Box(r))
+    for sprite in groups[0].sprites()[::7]:  # 倒された敵は選ばない
+        sprite.kill()
+    index = ks.TargetIndex(*groups)
+    everyone = [s for group in groups for s in group]
+    for _ in range(300):
+        pos = rng.randrange(-200, ks.WIDTH + 200), rng.randrange(-200, ks.HEIGHT + 200)
+        want = min(everyone, key=lambda s: math.hypot(pos[0] - s.rect.centerx, pos[1] - s.rect.centery))
+        assert index.nearest(pos) is want
+    index.invalidate()
+    for group in groups:
+        group.empty()
+    assert index.nearest((0, 0)) is None
+
+
+def outcome(result: dict) -> dict:
+    return {key: result[key] for key in ("result", "score", "frames", "tmr", "counts")}
+
+
+def test_record_then_replay_is_identical(tmp_path):
+    path = str(tmp_path / "play.json")
+    recorded = ks.run_headless(600, control=ks.Autoplayer(), seed=11, record=path)
+    replayed = ks.run_headless(None, replay=path)
+    assert outcome(replayed) == outcome(recorded)
+
+
+def test_snapshot_resume_matches_uninterrupted_run(tmp_path):
+    path = str(tmp_path / "state.kks")
+    straight = ks.run_headless(800, control=ks.Autoplayer(), seed=7, snapshot=path, snapshot_at=400)
+    resumed = ks.run_headless(800, control=ks.Autoplayer(), resume=path)
+    assert outcome(resumed) == outcome(straight)
+    with open(path, "rb") as f:
+        data = f.read()
+    assert ks.Snapshot.dumps(*ks.Snapshot.loads(data)) == data  # 読み込んでそのまま書き出すと同じバイト列
+
+
+def test_autoplayer_survives_until_boss():
+    result = ks.run_headless(3000, control=ks.Autoplayer(), seed=3)  # 無敵なしの既定の設定
+    assert result["score"] >= 1000  # boss_thresholdに届いてボス戦まで生き残る
+
+
+def test_rotation_cache_miss_matches_baked_variant(monkeypatch):
+    # アトラスにない倍率でも焼き込みと同じ画素で作り，画面の形式に変換してから使い回す
+    ks.ASSETS.get("fig/beam.png")
+    converted = []
+    convert = ks.ASSETS.convert
+    monkeypatch.setattr(ks.ASSETS, "convert", lambda path, img, *args: converted.append(path) or convert(path, img, *args))
+    rotations = ks.RotationCache("fig/beam.png")
+    scale = 1.7
+    assert ks.ASSETS.find("fig/beam.png", scale, 45) is None
+    img = rotations.get(rotations.bucket(45), scale)
+    assert converted == ["fig/beam.png"]
+    assert pixels(img) == pixels(convert("fig/beam.png", ks.ASSETS.build("fig/beam.png", scale, 45, (False, False))))
+    assert rotations.get(rotations.bucket(45), scale) is img and len(converted) == 1
+
+
+@pytest.mark.skipif(ks.np is None, reason="EnemySwarmにはNumPyが要る")
+def test_enemy_swarm_matches_per_sprite_update():
+    # 配列でまとめて動かしても，1体ずつupdateしたのと同じ位置になる（途中で倒された敵も含む）
+    player = Box(pg.Rect(ks.WIDTH//2, ks.HEIGHT//2, 60, 60))
+    rng = random.Random(9)
+    swarm = ks.EnemySwarm(4)  # 途中で配列を広げる
+    grouped, plain = ks.SwarmGroup(swarm), pg.sprite.Group()
+    for i in range(80):
+        x, y = rng.randrange(-300, ks.WIDTH + 300), rng.randrange(-300, ks.HEIGHT + 300)
+        for group in (grouped, plain):
+            emy = (ks.ClownEnemy if i % 3 == 0 else ks.Enemy)(player, 8)
+            emy.rect.center = x, y
+            group.add(emy)
+    for t in range(200):
+        player.rect.center = ks.WIDTH//2 + int(200*math.cos(t/20)), ks.HEIGHT//2 + int(150*math.sin(t/15))
+        swarm.step(player.rect)
+        plain.update()
+        if t % 40 == 39:  # 同じ敵を倒して空いた行を詰めさせる
+            for a, b in list(zip(grouped.sprites(), plain.sprites()))[::9]:
+                a.kill()
+                b.kill()
+        if t % 7 == 0:  # 読まれなかったステップの位置はまとめて書き戻される
+            assert [tuple(s.rect) for s in grouped] == [tuple(s.rect) for s in plain], t
+    assert len(swarm) == len(grouped)
+
+
+def test_pool_reuses_killed_sprites_with_new_generation():
+    # killされた敵はプールに戻り，次のacquireで初期化し直して使い回す．使い回すたびに世代が進む
+    player = Box(pg.Rect(0, 0, 10, 10))
+    pool = ks.Pool(ks.Enemy)
+    group = pg.sprite.Group()
+    first = pool.acquire(player, 4)
+    group.add(first)
+    gen = first.generation
+    first.rect.topleft = 123, 45
+    first.speed = 99
+    first.kill()
+    first.kill()  # 2回killしても1回しか戻らない
+    assert pool.stats() == {"live": 0, "high": 1, "free": 1, "acquires": 1, "misses": 1}
+    again = pool.acquire(player, 4)
+    assert again is first and again.generation == gen + 1
+    assert again.speed == 3 and again.rect.topleft != (123, 45)  # resetで初期化し直されている
+    other = pool.acquire(player, 4)
+    assert other is not first
+    assert pool.stats() == {"live": 2, "high": 2, "free": 0, "acquires": 3, "misses": 2}
+    direct = ks.Enemy(player, 4)  # プールを通さずに作ったものはkillしても戻らない
+    group.add(direct)
+    direct.kill()
+    assert pool.stats()["free"] == 0
+
+
+def test_spawn_director_pressure_levels():
+    # 予算の7割で波を半分にし，9割で後回しにする．生きている数はmax_liveを超えない
+    director = ks.SpawnDirector(enemy_interval=20, clown_interval=100, max_live=10, budget_ms=20)
+    assert [director.pressure(ms) for ms in (0, 13.9, 14, 17.9, 18, 40)] == [0, 0, 1, 1, 2, 2]
+    director.per_wave = 4
+    assert director.plan(0, 0) == (4, 1)
+    director.level = 1
+    assert director.plan(20, 5) == (2, 0)
+    director.level = 2
+    assert director.plan(40, 5) == (0, 0)
+    director.level = 0
+    assert director.plan(44, 5) == (0, 0)  # 後回しにした波はinterval//4ステップ後に試し直す
+    assert director.plan(45, 8) == (2, 0)  # 上限までしか出さない
+    assert director.stats() == {"spawned": 9, "throttled": 1, "deferred": 1, "capped": 2, "per_wave": 4, "directions": 4}
+
+
+def test_quality_hysteresis():
+    # 予算超えが続いたら1段下げ，余裕が続いたら1段戻す．間の値や途切れた連続では動かさない
+    quality = ks.Quality(budget_ms=20, down_frames=3, up_frames=5)
+    levels = []
+    for ms in [19, 19, 15, 19, 19, 19] + [25] * 3 + [25] * 3 + [10] * 4 + [15] + [10] * 5:
+        quality.update(ms)
+        levels.append(quality.level)
+    assert levels == [0, 0, 0, 0, 0, 1] + [1, 1, 2] + [2, 2, 2] + [2] * 4 + [2] + [2] * 4 + [1]
+    assert quality.stats() == {"level": 1, "changes": 3}
+    assert quality.settings == ks.Quality.levels[1]
+    fixed = ks.Quality(budget_ms=20, fixed=2, down_frames=1, up_frames=1)
+    for ms in (1, 1, 100):
+        fixed.update(ms)
+    assert fixed.level == 2
+
+
+def projectile(cls: type, topleft: tuple, speed: int) -> pg.sprite.Sprite:
+    sprite = cls(Box(pg.Rect(0, 0, 10, 10)))
+    sprite.rect.topleft = topleft
+    sprite.speed = speed
+    return sprite
+
+
+def test_projectiles_sweep_hits_enemies_between_steps():
+    # 1ステップで敵を飛び越える速さでも通り道の敵に当たる．ドリアンは貫通し，サッカーボールは最初の敵で跳ね返る
+    for cls, want in ((ks.Durian, ["near", "far"]), (ks.Soccerball, ["near"])):
+        shots = ks.Projectiles()
+        group = ks.SwarmGroup(shots, projectile(cls, (200, 200), 300))
+        w, h = group.sprites()[0].rect.size
+        enemies = pg.sprite.Group()
+        for name, d in (("near", 40), ("far", 120)):  # 通り道の途中だけにある小さな敵
+            box = Box(pg.Rect(200 + w + d, 200 + h + d, 3, 3))
+            box.label = name
+            assert not box.rect.colliderect(pg.Rect(200, 200, w, h)) and not box.rect.colliderect(pg.Rect(500, 500, w, h))
+            enemies.add(box)
+        grid = ks.SpatialHash(64)
+        grid.build(enemies)
+        hits, damage = shots.step(grid, (enemies,), None)
+        shots.sync()
+        assert [sprite.label for sprite in hits] == want and damage == 0
+        ball = group.sprites()[0]
+        if cls is ks.Durian:
+            assert ball.rect.topleft == (500, 500) and (ball.vx, ball.vy) == (1, 1)
+        else:
+            assert ball.rect.right <= 200 + w + 40 and ball.rect.bottom <= 200 + h + 40  # 敵の手前で跳ね返った
+
+
+def test_projectiles_bounce_off_walls_within_a_step():
+    shots = ks.Projectiles()
+    group = ks.SwarmGroup(shots, projectile(ks.Durian, (ks.WIDTH - 100, 10), 150))
+    ball = group.sprites()[0]
+    w = ball.rect.width
+    hits, damage = shots.step(ks.SpatialHash(64), (), None)
+    shots.sync()
+    assert hits == [] and damage == 0
+    assert ball.rect.topleft == (2*(ks.WIDTH - w) - (ks.WIDTH - 100) - 150, 160) and (ball.vx, ball.vy) == (-1, 1)
+
+
+class FakeBoss:
+    def __init__(self):
+        self.rect = pg.Rect(500, 100, 40, 40)
+        self.dire = (1, 0)
+
+
+def test_boss_beam_patterns():
+    boss = FakeBoss()
+    random.seed(4)
+    fan = ks.NeoBeam(boss, 5).angles()
+    assert [b - a for a, b in zip(fan, fan[1:])] == [25] * 4 and -230 <= fan[0] <= 130  # 100度の扇
+    random.seed(4)
+    ring = ks.NeoBeam(boss, 8, "ring").angles()
+    assert [b - a for a, b in zip(ring, ring[1:])] == [45] * 7
+    spiral = ks.NeoBeam(boss, 4, "spiral", turn=3)
+    assert spiral.angles(10) == [30, 120, 210, 300]  # ステップごとに回る
+    boss.dire = (0, -1)  # 真上を向くと基準も90度回る
+    assert spiral.angles(0) == [90, 180, 270, 360]
+    with pytest.raises(ValueError):
+        ks.NeoBeam(boss, 3, "zigzag").angles()
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_boss_bullets_move_and_hit(numpy, monkeypatch):
+    # 撃ったビームはまっすぐ進み，当たったものだけが順番を保ったまま消える（NumPyがなくても同じ）
+    if not numpy:
+        monkeypatch.setattr(ks, "np", None)
+    elif ks.np is None:
+        pytest.skip("NumPyがない")
+    bullets = ks.BossBullets(capacity=2)  # 途中で配列を広げる
+    assert ks.NeoBeam(FakeBoss(), 4, "spiral", turn=0).fire(bullets) == 4  # 右・上・左・下
+    boss = FakeBoss()
+    boss.rect.topleft = 100, 500  # 扇は離れた所から撃つ
+    assert ks.NeoBeam(boss, 3).fire(bullets) == 3
+    assert len(bullets) == 7
+    start = bullets.dump()
+    assert start["w"][4] > start["w"][0]  # 扇は太いビーム
+    for _ in range(60):
+        bullets.capture()
+        bullets.step()
+    moved = bullets.dump()
+    for i in range(7):
+        assert moved["x"][i] == pytest.approx(start["x"][i] + 60*start["dx"][i])
+        assert moved["y"][i] == pytest.approx(start["y"][i] + 60*start["dy"][i])
+    assert bullets.hit(pg.Rect(0, 0, 1, 1)) == 0
+    right = pg.Rect(moved["x"][0] + moved["w"][0] - 1, moved["y"][0] + moved["h"][0]//2, 1, 1)  # 右へ進むビームの先端だけに触れる
+    assert bullets.hit(right) == 1
+    left = bullets.dump()
+    assert len(bullets) == 6 and left["x"] == moved["x"][1:] and left["image"] == moved["image"][1:]
+    bullets.clear()
+    assert len(bullets) == 0 and bullets.hit(right) == 0